@@ -58,6 +58,7 @@ def create_app(config_name=None):
     from app.routes.invoices import invoices_bp
     from app.routes.clients import clients_bp
     from app.routes.products import products_bp
+    from app.routes.expenses import expenses_bp
     from app.routes.settings import settings_bp
     from app.routes.reports import reports_bp
     from app.routes.payments import payments_bp
@@ -69,11 +70,21 @@ def create_app(config_name=None):
     app.register_blueprint(invoices_bp, url_prefix='/invoices')
     app.register_blueprint(clients_bp, url_prefix='/clients')
     app.register_blueprint(products_bp, url_prefix='/products')
+    app.register_blueprint(expenses_bp, url_prefix='/expenses')
     app.register_blueprint(settings_bp, url_prefix='/settings')
     app.register_blueprint(reports_bp, url_prefix='/reports')
     app.register_blueprint(payments_bp, url_prefix='/payments')
     app.register_blueprint(api_bp, url_prefix='/api')
 
+    # Data change tracking and report caching
+    from app.services import api_auth, change_tracking, rate_limit, report_cache, webhooks
+    change_tracking.register_listeners()
+    webhooks.register_listeners()
+    webhooks.init_app(app)
+    report_cache.init_app(app)
+    api_auth.init_app(app)
+    rate_limit.init_app(app)
+
     # Register error handlers
     register_error_handlers(app)
 
@@ -3,7 +3,7 @@ SąskaitaPro Forms
 WTForms definitions
 """
 from flask_wtf import FlaskForm
-from flask_wtf.file import FileField, FileAllowed
+from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms import (
     StringField, PasswordField, BooleanField, TextAreaField,
     SelectField, DecimalField, IntegerField, DateField
@@ -319,3 +319,85 @@ class InvoiceItemForm(FlaskForm):
         (5, '5%'),
         (0, '0%')
     ], coerce=int, default=21)
+
+
+# Expense Forms
+EXPENSE_CATEGORIES = [
+    ('office', 'Biuras'),
+    ('rent', 'Nuoma'),
+    ('travel', 'Kelionės'),
+    ('transport', 'Transportas'),
+    ('supplies', 'Prekės ir medžiagos'),
+    ('services', 'Paslaugos'),
+    ('software', 'Programinė įranga'),
+    ('marketing', 'Rinkodara'),
+    ('salaries', 'Darbo užmokestis'),
+    ('taxes', 'Mokesčiai'),
+    ('other', 'Kita')
+]
+
+
+class ExpenseForm(FlaskForm):
+    """Expense form"""
+    description = StringField('Aprašymas', validators=[
+        DataRequired(message='Įveskite aprašymą'),
+        Length(max=300)
+    ])
+    category = SelectField('Kategorija', choices=EXPENSE_CATEGORIES, default='other')
+    amount = DecimalField('Suma be PVM', validators=[
+        DataRequired(message='Įveskite sumą'),
+        NumberRange(min=0, message='Suma negali būti neigiama')
+    ], places=2)
+    vat_amount = DecimalField('PVM suma', validators=[
+        Optional(),
+        NumberRange(min=0, message='PVM negali būti neigiamas')
+    ], places=2, default=0)
+    expense_date = DateField('Data', validators=[
+        DataRequired(message='Pasirinkite datą')
+    ])
+    vendor_name = StringField('Tiekėjas', validators=[
+        Optional(),
+        Length(max=200)
+    ])
+    vendor_vat_code = StringField('Tiekėjo PVM kodas', validators=[
+        Optional(),
+        Length(max=20)
+    ])
+    receipt_number = StringField('Dokumento numeris', validators=[
+        Optional(),
+        Length(max=50)
+    ])
+    receipt_file = FileField('Kvitas / sąskaita', validators=[
+        FileAllowed(['png', 'jpg', 'jpeg', 'gif', 'pdf'], 'Leidžiami tik paveikslėliai ir PDF')
+    ])
+    notes = TextAreaField('Pastabos', validators=[
+        Optional()
+    ])
+
+
+class ExpenseImportForm(FlaskForm):
+    """Bulk expense CSV import form"""
+    csv_file = FileField('CSV failas', validators=[
+        FileRequired(message='Pasirinkite failą'),
+        FileAllowed(['csv', 'txt'], 'Leidžiami tik CSV failai')
+    ])
+
+
+class ClientImportForm(FlaskForm):
+    """Bulk client CSV import form"""
+    csv_file = FileField('CSV failas', validators=[
+        FileRequired(message='Pasirinkite failą'),
+        FileAllowed(['csv', 'txt'], 'Leidžiami tik CSV failai')
+    ])
+
+
+class ApiKeyForm(FlaskForm):
+    """New API key form"""
+    name = StringField('Pavadinimas', validators=[
+        DataRequired(message='Įveskite rakto pavadinimą'),
+        Length(max=100)
+    ])
+    scopes = SelectField('Teisės', choices=[
+        ('read,write', 'Skaityti ir rašyti'),
+        ('read', 'Tik skaityti')
+    ], default='read,write')
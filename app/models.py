@@ -40,6 +40,10 @@ class User(UserMixin, db.Model):
     stripe_subscription_id = db.Column(db.String(100))
     subscription_expires = db.Column(db.DateTime)
 
+    # Bumped when API access changes (key revoked, plan changed); cached
+    # API principals of other versions are stale in every worker
+    auth_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     # Relationships
     company = db.relationship('Company', backref='owner', uselist=False, lazy=True)
     invoices = db.relationship('Invoice', backref='user', lazy='dynamic')
@@ -92,7 +96,7 @@ class Company(db.Model):
     __tablename__ = 'companies'
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
 
     # Company details
     name = db.Column(db.String(200), nullable=False)
@@ -125,6 +129,10 @@ class Company(db.Model):
     invoice_notes = db.Column(db.Text)  # Default notes on invoices
     payment_terms = db.Column(db.Integer, default=14)  # Days
 
+    # Reporting
+    data_version = db.Column(db.Integer, default=0, nullable=False)  # Bumped on every data change
+    books_locked_until = db.Column(db.Date)  # Periods ending on or before this date are closed
+
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -140,6 +148,10 @@ class Company(db.Model):
         db.session.commit()
         return f"{self.invoice_prefix}{number:06d}"
 
+    def is_date_locked(self, value):
+        """Check whether a document date falls in a period closed by books_locked_until"""
+        return bool(value and self.books_locked_until and value <= self.books_locked_until)
+
     def __repr__(self):
         return f'<Company {self.name}>'
 
@@ -147,6 +159,9 @@ class Company(db.Model):
 class Client(db.Model):
     """Client/Customer model"""
     __tablename__ = 'clients'
+    __table_args__ = (
+        db.Index('ix_clients_company_active_created_id', 'company_id', 'is_active', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
@@ -195,9 +210,23 @@ class Client(db.Model):
         return f'<Client {self.name}>'
 
 
+def normalized_code(expression):
+    """A company or VAT code as imports match it: spaces removed, upper case"""
+    # Literals rather than bound parameters, so queries match the index expression
+    return db.func.upper(db.func.replace(expression, db.literal_column("' '"), db.literal_column("''")))
+
+
+# Import matching by code, on the same expression as the lookup
+db.Index('ix_clients_company_company_code', Client.company_id, normalized_code(Client.company_code))
+db.Index('ix_clients_company_vat_code', Client.company_id, normalized_code(Client.vat_code))
+
+
 class Product(db.Model):
     """Product/Service model"""
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('ix_products_company_active_created_id', 'company_id', 'is_active', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
@@ -224,6 +253,11 @@ class Product(db.Model):
 class Invoice(db.Model):
     """Invoice model"""
     __tablename__ = 'invoices'
+    __table_args__ = (
+        db.Index('ix_invoices_company_invoice_date', 'company_id', 'invoice_date'),
+        db.Index('ix_invoices_company_status_due_date', 'company_id', 'status', 'due_date'),
+        db.Index('ix_invoices_company_created_id', 'company_id', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -269,9 +303,14 @@ class Invoice(db.Model):
 
     def generate_payment_reference(self):
         """Generate unique payment reference for bank transfer"""
-        self.payment_reference = f"SF{self.id:08d}"
+        self.payment_reference = self.payment_reference_for(self.id)
         return self.payment_reference
 
+    @staticmethod
+    def payment_reference_for(invoice_id):
+        """Payment reference for an invoice id"""
+        return f"SF{invoice_id:08d}"
+
     @property
     def is_overdue(self):
         """Check if invoice is overdue"""
@@ -299,7 +338,7 @@ class InvoiceItem(db.Model):
     __tablename__ = 'invoice_items'
 
     id = db.Column(db.Integer, primary_key=True)
-    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'))
 
     # Item details
@@ -329,13 +368,13 @@ class Expense(db.Model):
     __tablename__ = 'expenses'
 
     id = db.Column(db.Integer, primary_key=True)
-    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False, index=True)
 
     # Expense details
     description = db.Column(db.String(300), nullable=False)
     category = db.Column(db.String(50))  # office, travel, supplies, etc.
-    amount = db.Column(db.Numeric(10, 2), nullable=False)
-    vat_amount = db.Column(db.Numeric(10, 2), default=0)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)  # Excluding VAT
+    vat_amount = db.Column(db.Numeric(10, 2), default=0)  # Input VAT
     expense_date = db.Column(db.Date, nullable=False, default=date.today)
 
     # Vendor info
@@ -358,6 +397,87 @@ class Expense(db.Model):
         return f'<Expense {self.description[:30]}>'
 
 
+class ExpenseMonthlyRollup(db.Model):
+    """Per-month, per-category expense totals maintained on every expense write"""
+    __tablename__ = 'expense_monthly_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('company_id', 'month', 'category', name='uq_expense_rollup_month_category'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    month = db.Column(db.Date, nullable=False)  # First day of the month
+    category = db.Column(db.String(50), nullable=False, default='')
+
+    amount = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    vat_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    expense_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ExpenseMonthlyRollup {self.month} {self.category}>'
+
+
+class ReportJob(db.Model):
+    """Background report/export job"""
+    __tablename__ = 'report_jobs'
+    __table_args__ = (
+        db.Index('ix_report_jobs_company_params', 'company_id', 'params_key', 'status'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+
+    kind = db.Column(db.String(30), nullable=False)  # invoices_csv/xlsx, vat_csv/xlsx, isaf_xml, revenue_csv, analytics
+    params = db.Column(db.Text)  # JSON
+    params_key = db.Column(db.String(64), nullable=False)  # Hash of kind + normalized params
+
+    status = db.Column(db.String(20), default='queued')  # queued, running, completed, failed
+    progress = db.Column(db.Integer, default=0)  # Percent
+    result_file = db.Column(db.String(300))  # Path relative to UPLOAD_FOLDER
+    download_name = db.Column(db.String(200))
+    error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    @property
+    def is_active(self):
+        return self.status in ['queued', 'running']
+
+    def __repr__(self):
+        return f'<ReportJob {self.kind} {self.status}>'
+
+
+class ApiKey(db.Model):
+    """Long-lived API key; only its prefix and a keyed hash of the full key are stored"""
+    __tablename__ = 'api_keys'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    prefix = db.Column(db.String(16), unique=True, nullable=False)  # Public part, used for lookup
+    key_hash = db.Column(db.String(64), nullable=False)  # HMAC-SHA256 of the full key
+    scopes = db.Column(db.String(50), nullable=False, default='read,write')  # Comma-separated
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    revoked_at = db.Column(db.DateTime)
+
+    # Relationship
+    user = db.relationship('User', backref=db.backref('api_keys', lazy='dynamic'))
+
+    @property
+    def scope_list(self):
+        return self.scopes.split(',') if self.scopes else []
+
+    @property
+    def is_revoked(self):
+        return self.revoked_at is not None
+
+    def __repr__(self):
+        return f'<ApiKey {self.prefix}>'
+
+
 class ActivityLog(db.Model):
     """Activity logging for audit trail"""
     __tablename__ = 'activity_logs'
@@ -391,3 +511,101 @@ class ActivityLog(db.Model):
 
     def __repr__(self):
         return f'<ActivityLog {self.action} {self.entity_type}>'
+
+
+class ChangeLogEntry(db.Model):
+    """Append-only log of API-visible changes, written in the same transaction as the change"""
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('ix_change_log_company_id', 'company_id', 'id'),
+    )
+
+    # Ids are allocated while the company row is locked by the data version
+    # bump, so per company they increase in commit order
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    entity_type = db.Column(db.String(20), nullable=False)  # invoice, client, product
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # created, updated, deleted
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ChangeLogEntry {self.entity_type} {self.entity_id} {self.action}>'
+
+
+class WebhookEndpoint(db.Model):
+    """Customer URL that receives signed event notifications"""
+    __tablename__ = 'webhook_endpoints'
+
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False, index=True)
+    url = db.Column(db.String(500), nullable=False)
+    secret = db.Column(db.String(100), nullable=False)  # HMAC signing key, shown to the customer
+    events = db.Column(db.String(300), nullable=False, default='*')  # Comma-separated event types or *
+    is_active = db.Column(db.Boolean, default=True)
+
+    # Delivery tuning
+    max_concurrency = db.Column(db.Integer, nullable=False, default=2)  # Parallel POSTs to this URL per dispatching process
+    batch_size = db.Column(db.Integer, nullable=False, default=1)  # Events per POST; >1 sends {"events": [...]}
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def subscribes_to(self, event_type):
+        return self.events == '*' or event_type in self.events.split(',')
+
+    def __repr__(self):
+        return f'<WebhookEndpoint {self.url}>'
+
+
+class WebhookDelivery(db.Model):
+    """Queued delivery of one event to one endpoint"""
+    __tablename__ = 'webhook_deliveries'
+    __table_args__ = (
+        db.Index('ix_webhook_deliveries_due', 'status', 'next_attempt_at'),
+        db.Index('ix_webhook_deliveries_endpoint', 'endpoint_id', 'status', 'id'),
+    )
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    endpoint_id = db.Column(db.Integer, db.ForeignKey('webhook_endpoints.id', ondelete='CASCADE'), nullable=False)
+    event_id = db.Column(db.String(32), nullable=False)  # Same for every endpoint receiving the event
+    event_type = db.Column(db.String(30), nullable=False)  # invoice.created, invoice.paid, client.created, ...
+    entity_type = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, delivering, delivered, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime)  # Lease of the dispatcher currently delivering
+    last_error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<WebhookDelivery {self.event_type} {self.status}>'
+
+
+class IdempotencyKey(db.Model):
+    """Outcome of a mutating API request, replayed when the client retries with the same key"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),
+        db.Index('ix_idempotency_keys_expires_at', 'expires_at'),
+    )
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)  # Idempotency-Key header
+    fingerprint = db.Column(db.String(64), nullable=False)  # SHA-256 of method, path and body
+    status = db.Column(db.String(20), nullable=False, default='processing')  # processing, completed
+
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.LargeBinary)
+    response_mimetype = db.Column(db.String(100))
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # While processing: end of the first request's lease; once completed: end of the replay window
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.key} {self.status}>'
@@ -2,60 +2,192 @@
 API Routes
 RESTful API for enterprise customers
 """
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, Response, jsonify, make_response, request, current_app, g, stream_with_context
 from functools import wraps
+from urllib.parse import parse_qsl
+import hmac
 import jwt
+import re
 from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, load_only, selectinload
+from werkzeug.datastructures import MultiDict
 
 from app import db
-from app.models import User, Invoice, Client, Product, InvoiceItem
+from app.models import User, Invoice, Client, Product, InvoiceItem, WebhookEndpoint
+from app.services import (
+    api_auth, api_serializers, bulk_invoices, change_tracking, client_import, etags, exports, idempotency,
+    rate_limit, webhooks
+)
+from app.services.pagination import keyset_page
 
 api_bp = Blueprint('api', __name__)
 
 
 def token_required(f):
-    """Decorator to require valid API token"""
+    """
+    Decorator to require valid API token.
+
+    Accepts an API key (created in settings) or a JWT from /api/token.
+    The view receives an ApiPrincipal (user id, company id, plan, scopes)
+    rather than a User; repeat calls with the same credential are served
+    from the principal cache after one auth_version lookup.
+    """
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
+        # Sub-requests of POST /api/batch reuse the principal the batch resolved
+        current_user = g.get('batch_principal')
+        if current_user is None:
+            current_user, error = authenticate_request()
+            if error is not None:
+                return error
+
+        # Check if user has API access (enterprise plan)
+        if current_user.plan != 'enterprise':
+            return jsonify({'error': 'API access requires Enterprise plan'}), 403
+
+        scope = getattr(f, 'api_scope', None) or ('read' if request.method in ('GET', 'HEAD') else 'write')
+        if scope not in current_user.scopes:
+            return jsonify({'error': f'API key lacks the {scope} scope'}), 403
+
+        result = rate_limit.limiter.hit(current_user.id, getattr(f, 'rate_limit_class', scope))
+        if result is not None:
+            g.rate_limit = result
+            if not result.allowed:
+                return jsonify({'error': 'Rate limit exceeded'}), 429
 
-        # Get token from header
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            if auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
+        return f(current_user, *args, **kwargs)
 
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
+    return decorated
 
-        try:
-            data = jwt.decode(
-                token,
-                current_app.config['SECRET_KEY'],
-                algorithms=['HS256']
-            )
-            current_user = User.query.get(data['user_id'])
 
-            if not current_user:
-                return jsonify({'error': 'User not found'}), 401
+def authenticate_request():
+    """
+    Resolve the principal from the Authorization header.
+
+    Returns:
+        tuple: (ApiPrincipal, None) or (None, 401 error response)
+    """
+    token = None
 
-            # Check if user has API access (enterprise plan)
-            if current_user.subscription_plan != 'enterprise':
-                return jsonify({'error': 'API access requires Enterprise plan'}), 403
+    # Get token from header
+    if 'Authorization' in request.headers:
+        auth_header = request.headers['Authorization']
+        if auth_header.startswith('Bearer '):
+            token = auth_header.split(' ')[1]
 
+    if not token:
+        return None, (jsonify({'error': 'Token is missing'}), 401)
+
+    if api_auth.is_api_key(token):
+        current_user = api_auth.authenticate_key(token)
+        if not current_user:
+            return None, (jsonify({'error': 'Invalid API key'}), 401)
+    else:
+        try:
+            current_user = api_auth.authenticate(token)
         except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
+            return None, (jsonify({'error': 'Token has expired'}), 401)
         except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+            return None, (jsonify({'error': 'Invalid token'}), 401)
 
-        return f(current_user, *args, **kwargs)
+        if not current_user:
+            return None, (jsonify({'error': 'User not found'}), 401)
+
+    return current_user, None
+
+
+def rate_limit_class(name):
+    """Count a view against another endpoint class than read/write (apply below token_required)"""
+    def decorator(f):
+        f.rate_limit_class = name
+        return f
+    return decorator
+
+
+def idempotent(f):
+    """
+    Honour an Idempotency-Key header (apply below token_required).
+
+    The first request with a key runs and its response is stored; retries
+    with the same key get that response back without running again, and
+    a retry arriving while the first request runs waits for it. Server
+    errors are not stored, so they can be retried.
+    """
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return f(current_user, *args, **kwargs)
+        if not key or len(key) > idempotency.MAX_KEY_LENGTH:
+            return jsonify({'error': f'Idempotency-Key must be 1-{idempotency.MAX_KEY_LENGTH} characters'}), 400
+
+        fingerprint = idempotency.fingerprint(request.method, request.path, request.get_data())
+        try:
+            stored = idempotency.begin(current_user.id, key, fingerprint)
+        except idempotency.IdempotencyConflict as e:
+            return jsonify({'error': str(e)}), e.status_code
+
+        if stored is not None:
+            response = current_app.response_class(stored.body, status=stored.status, mimetype=stored.mimetype)
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = make_response(f(current_user, *args, **kwargs))
+        except Exception:
+            idempotency.release(current_user.id, key)
+            raise
+
+        if response.status_code >= 500:
+            idempotency.release(current_user.id, key)
+        else:
+            idempotency.complete(current_user.id, key, response)
+        return response
 
     return decorated
 
 
+def api_scope(name):
+    """Require another scope than the HTTP method implies (apply below token_required)"""
+    def decorator(f):
+        f.api_scope = name
+        return f
+    return decorator
+
+
+@api_bp.after_request
+def add_rate_limit_headers(response):
+    result = g.pop('rate_limit', None)
+    if result is not None:
+        rate_limit.apply_headers(response, result)
+    return response
+
+
+def invoice_etag(current_user, invoice_id):
+    """Conditional GET validator for a single invoice"""
+    row = etags.invoice_version(invoice_id, current_user.id)
+    if row is None:
+        return None
+    return current_user.id, row.updated_at, row.data_version
+
+
+def company_data_etag(current_user):
+    """Conditional GET validator for lists of company data"""
+    row = etags.company_version(current_user.id)
+    if row is None:
+        return None
+    return current_user.id, row.id, row.data_version
+
+
 @api_bp.route('/token', methods=['POST'])
 def get_token():
-    """Get API token"""
+    """
+    Get a 24-hour API token for interactive use.
+
+    Integrations should use an API key from settings instead: this checks
+    the password hash on every call.
+    """
     data = request.get_json()
 
     if not data or 'email' not in data or 'password' not in data:
@@ -84,50 +216,70 @@ def get_token():
 @api_bp.route('/invoices', methods=['GET'])
 @token_required
 def list_invoices(current_user):
-    """List all invoices"""
-    company = current_user.company
-
-    # Pagination
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
-
+    """List invoices, newest first, one cursor page at a time"""
     # Filters
     status = request.args.get('status')
     client_id = request.args.get('client_id', type=int)
 
-    query = company.invoices
+    # Sparse fieldset and related data
+    try:
+        fields = requested_fields(INVOICE_FIELDS)
+        include = requested_includes(INVOICE_INCLUDES)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = Invoice.query.filter_by(company_id=current_user.company_id).options(
+        *invoice_load_options(fields, include)
+    )
 
     if status:
         query = query.filter_by(status=status)
     if client_id:
         query = query.filter_by(client_id=client_id)
 
-    pagination = query.order_by(Invoice.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    serialize = api_serializers.serializer_for('invoice', fields, include)
 
-    return jsonify({
-        'invoices': [invoice_to_dict(inv) for inv in pagination.items],
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'current_page': page
-    })
+    # Offset pagination is kept for integrations still sending ?page=
+    if 'page' in request.args:
+        page = request.args.get('page', 1, type=int)
+        pagination = query.order_by(Invoice.created_at.desc()).paginate(
+            page=page, per_page=page_size(), error_out=False
+        )
+
+        return api_serializers.json_response({
+            'invoices': [serialize(inv) for inv in pagination.items],
+            'total': pagination.total,
+            'pages': pagination.pages,
+            'current_page': page
+        })
+
+    return cursor_page_response('invoices', query, Invoice, serialize)
 
 
 @api_bp.route('/invoices/<int:invoice_id>', methods=['GET'])
 @token_required
+@etags.conditional(invoice_etag)
 def get_invoice(current_user, invoice_id):
     """Get single invoice"""
-    invoice = Invoice.query.get_or_404(invoice_id)
+    try:
+        fields = requested_fields(INVOICE_FIELDS)
+        include = requested_includes(INVOICE_INCLUDES, default=('items',))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    if invoice.company_id != current_user.company.id:
+    invoice = Invoice.query.options(
+        *invoice_load_options(fields + ('company_id',), include)
+    ).filter_by(id=invoice_id).first_or_404()
+
+    if invoice.company_id != current_user.company_id:
         return jsonify({'error': 'Not found'}), 404
 
-    return jsonify(invoice_to_dict(invoice, include_items=True))
+    return api_serializers.json_response(invoice_to_dict(invoice, fields=fields, include=include))
 
 
 @api_bp.route('/invoices', methods=['POST'])
 @token_required
+@idempotent
 def create_invoice(current_user):
     """Create new invoice"""
     data = request.get_json()
@@ -142,13 +294,22 @@ def create_invoice(current_user):
     if not client or client.company_id != company.id:
         return jsonify({'error': 'Client not found'}), 404
 
+    invoice_date = datetime.strptime(data.get('invoice_date', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d').date()
+    if company.is_date_locked(invoice_date):
+        return jsonify({'error': f'Books are locked until {company.books_locked_until.isoformat()}'}), 409
+
+    vat_rates = current_app.config['VAT_RATES'].values()
+    for idx, item_data in enumerate(data.get('items', [])):
+        if item_data.get('vat_rate', 21) not in vat_rates:
+            return jsonify({'error': f'items[{idx}].vat_rate must be one of {", ".join(map(str, vat_rates))}'}), 400
+
     # Create invoice
     invoice = Invoice(
         user_id=current_user.id,
         company_id=company.id,
         client_id=data['client_id'],
         invoice_number=company.get_next_invoice_number(),
-        invoice_date=datetime.strptime(data.get('invoice_date', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d').date(),
+        invoice_date=invoice_date,
         due_date=datetime.strptime(data['due_date'], '%Y-%m-%d').date() if 'due_date' in data else None,
         notes=data.get('notes', ''),
         status='draft'
@@ -181,34 +342,92 @@ def create_invoice(current_user):
     invoice.calculate_totals()
     db.session.commit()
 
-    return jsonify(invoice_to_dict(invoice, include_items=True)), 201
+    return api_serializers.json_response(invoice_to_dict(invoice, include_items=True), 201)
+
+
+@api_bp.route('/invoices/bulk', methods=['POST'])
+@token_required
+@rate_limit_class('bulk')
+@idempotent
+def bulk_create_invoices(current_user):
+    """Create many draft invoices in one request, with per-entry results"""
+    data = request.get_json(silent=True) or {}
+    company = current_user.company
+    entries = data.get('invoices')
+
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': 'invoices must be a non-empty list'}), 400
+
+    max_entries = current_app.config['API_BULK_MAX_INVOICES']
+    if len(entries) > max_entries:
+        return jsonify({'error': f'At most {max_entries} invoices per request'}), 400
+
+    try:
+        results = bulk_invoices.create_invoices(current_user, company, entries)
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Invoice number conflict, nothing was created'}), 409
+
+    created = sum(1 for result in results if result['status'] == 'created')
+
+    return api_serializers.json_response({
+        'results': results,
+        'created': created,
+        'failed': len(results) - created
+    }, 201 if created == len(results) else 207)
 
 
 @api_bp.route('/clients', methods=['GET'])
 @token_required
+@etags.conditional(company_data_etag)
 def list_clients(current_user):
-    """List all clients"""
-    company = current_user.company
+    """List active clients, one cursor page at a time"""
 
-    clients = company.clients.filter_by(is_active=True).order_by(Client.name).all()
+    try:
+        fields = requested_fields(CLIENT_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    return jsonify({
-        'clients': [client_to_dict(c) for c in clients]
-    })
+    query = Client.query.filter_by(company_id=current_user.company_id, is_active=True).options(
+        load_only(*columns_for(Client, fields))
+    )
+
+    return cursor_page_response(
+        'clients', query, Client, api_serializers.serializer_for('client', fields)
+    )
+
+
+@api_bp.route('/clients/<int:client_id>', methods=['GET'])
+@token_required
+def get_client(current_user, client_id):
+    """Get single client"""
+    try:
+        fields = requested_fields(CLIENT_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    client = Client.query.options(load_only(*columns_for(Client, fields))).filter_by(
+        id=client_id, company_id=current_user.company_id
+    ).first()
+
+    if client is None:
+        return jsonify({'error': 'Not found'}), 404
+
+    return api_serializers.json_response(client_to_dict(client, fields=fields))
 
 
 @api_bp.route('/clients', methods=['POST'])
 @token_required
+@idempotent
 def create_client(current_user):
     """Create new client"""
     data = request.get_json()
-    company = current_user.company
 
     if 'name' not in data:
         return jsonify({'error': 'name is required'}), 400
 
     client = Client(
-        company_id=company.id,
+        company_id=current_user.company_id,
         name=data['name'],
         legal_name=data.get('legal_name'),
         client_type=data.get('client_type', 'company'),
@@ -226,84 +445,549 @@ def create_client(current_user):
     db.session.add(client)
     db.session.commit()
 
-    return jsonify(client_to_dict(client)), 201
+    return api_serializers.json_response(client_to_dict(client), 201)
+
+
+@api_bp.route('/clients/bulk', methods=['POST'])
+@token_required
+@rate_limit_class('bulk')
+@idempotent
+def bulk_upsert_clients(current_user):
+    """
+    Create or update many clients in one request.
+
+    Clients are matched to existing ones by company_code and vat_code;
+    matched clients get the fields present in the entry (and are
+    reactivated), the rest are created. Entries whose codes match two
+    clients, or the client of an earlier entry, fail. Results are per
+    entry, in request order.
+    """
+    data = request.get_json(silent=True) or {}
+    entries = data.get('clients')
+
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': 'clients must be a non-empty list'}), 400
+
+    max_entries = current_app.config['API_BULK_MAX_CLIENTS']
+    if len(entries) > max_entries:
+        return jsonify({'error': f'At most {max_entries} clients per request'}), 400
+
+    plan = current_app.config['SUBSCRIPTION_PLANS'].get(current_user.plan, {})
+    results = [
+        dict(result, index=index)
+        for index, result in enumerate(client_import.upsert_clients(
+            current_user.company_id,
+            list(enumerate(entries)),
+            client_limit=plan.get('clients_limit', 10)
+        ))
+    ]
+    failed = sum(1 for result in results if result['status'] == 'error')
+
+    return api_serializers.json_response({
+        'results': results,
+        'created': sum(1 for result in results if result['status'] == 'created'),
+        'updated': sum(1 for result in results if result['status'] == 'updated'),
+        'failed': failed
+    }, 200 if not failed else 207)
 
 
 @api_bp.route('/products', methods=['GET'])
 @token_required
+@etags.conditional(company_data_etag)
 def list_products(current_user):
-    """List all products"""
-    company = current_user.company
+    """List active products, one cursor page at a time"""
 
-    products = company.products.filter_by(is_active=True).order_by(Product.name).all()
+    try:
+        fields = requested_fields(PRODUCT_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    return jsonify({
-        'products': [product_to_dict(p) for p in products]
+    query = Product.query.filter_by(company_id=current_user.company_id, is_active=True).options(
+        load_only(*columns_for(Product, fields))
+    )
+
+    return cursor_page_response(
+        'products', query, Product, api_serializers.serializer_for('product', fields)
+    )
+
+
+@api_bp.route('/changes', methods=['GET'])
+@token_required
+def list_changes(current_user):
+    """
+    Invoices, clients and products created, updated or deleted since a cursor.
+
+    Pass the previous response's next_cursor as ?since= (omit it to read
+    the whole log, or use since=latest to start from now). Created and
+    updated entries carry the current record; deleted entries are
+    tombstones without data.
+    """
+    company_id = current_user.company_id
+    since = request.args.get('since', '0')
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+
+    if since == 'latest':
+        return jsonify({
+            'changes': [],
+            'next_cursor': str(change_tracking.latest_change_id(company_id)),
+            'has_more': False
+        })
+
+    try:
+        since_id = int(since)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    page = change_tracking.changes_since(company_id, since_id, limit)
+
+    # Current state of changed records, one IN query per type
+    wanted = {}
+    for entry in page['entries']:
+        if entry.action != 'deleted':
+            wanted.setdefault(entry.entity_type, set()).add(entry.entity_id)
+
+    records = {}
+    for entity_type, ids in wanted.items():
+        model, serializer, options = CHANGE_FEED_TYPES[entity_type]
+        rows = model.query.options(*options).filter(
+            model.company_id == company_id,
+            model.id.in_(ids)
+        ).all()
+        for row in rows:
+            records[(entity_type, row.id)] = serializer(row)
+
+    changes = []
+    for entry in page['entries']:
+        # A record deleted after this page's entries is already a tombstone
+        record = records.get((entry.entity_type, entry.entity_id))
+        changes.append({
+            'type': entry.entity_type,
+            'id': entry.entity_id,
+            'action': entry.action if record is not None else 'deleted',
+            'changed_at': entry.created_at.isoformat(),
+            'data': record
+        })
+
+    return api_serializers.json_response({
+        'changes': changes,
+        'next_cursor': str(page['next_cursor']),
+        'has_more': page['has_more']
+    })
+
+
+@api_bp.route('/export/invoices.ndjson', methods=['GET'])
+@token_required
+@rate_limit_class('bulk')
+def export_invoices_ndjson(current_user):
+    """
+    Stream every invoice with its items and client, one JSON object per line.
+
+    Rows come from a single server-side cursor and are sent in chunks, so
+    memory stays flat however many invoices a company has. Invoices are
+    in id order; after a broken download pass the last id received as
+    ?after_id= to continue. Optional filters: date_from, date_to, status.
+    """
+    try:
+        after_id = request.args.get('after_id', 0, type=int)
+        date_from = parse_date_arg('date_from')
+        date_to = parse_date_arg('date_to')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = exports.invoice_document_query(
+        current_user.company_id,
+        after_id=after_id,
+        date_from=date_from,
+        date_to=date_to,
+        status=request.args.get('status')
+    )
+
+    def generate():
+        buffer = []
+        size = 0
+        for document in exports.invoice_documents(exports.stream_rows(query)):
+            line = api_serializers.dumps(document) + b'\n'
+            buffer.append(line)
+            size += len(line)
+            if size >= exports.NDJSON_CHUNK_SIZE:
+                yield b''.join(buffer)
+                buffer = []
+                size = 0
+        if buffer:
+            yield b''.join(buffer)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@api_bp.route('/batch', methods=['POST'])
+@token_required
+@api_scope('read')
+def batch(current_user):
+    """
+    Run many GET requests in one round trip.
+
+    Body: {"requests": [{"id": "a", "path": "/api/invoices/12?fields=id,total"}, ...]}.
+    Only the JSON read endpoints in BATCHABLE_PATH can be batched; streaming
+    exports, metrics and the batch itself are refused with a 400 entry.
+    Credentials are checked once for the whole batch. Invoice and client
+    lookups by id that share a query string are answered together with one
+    IN query; other paths run through their normal view in this app context
+    and session. Every sub-request counts against the read rate limit.
+    Responses ({"id", "status", "body"}) come back in request order.
+    """
+    data = request.get_json(silent=True) or {}
+    entries = data.get('requests')
+
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': 'requests must be a non-empty list'}), 400
+
+    max_entries = current_app.config['API_BATCH_MAX_REQUESTS']
+    if len(entries) > max_entries:
+        return jsonify({'error': f'At most {max_entries} requests per batch'}), 400
+
+    results = [None] * len(entries)
+    lookups = {}  # (collection, query string) -> {entry index: record id}
+    dispatched = []
+
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not isinstance(entry.get('path'), str):
+            results[index] = (400, {'error': 'path is required'})
+            continue
+        if str(entry.get('method', 'GET')).upper() != 'GET':
+            results[index] = (405, {'error': 'Only GET requests can be batched'})
+            continue
+
+        path, _, query_string = entry['path'].partition('?')
+        if not BATCHABLE_PATH.match(path):
+            results[index] = (400, {'error': 'path cannot be batched'})
+            continue
+
+        match = BATCH_LOOKUP_PATH.match(path)
+        if match is None:
+            dispatched.append((index, path, query_string))
+            continue
+
+        # Dispatched requests are counted by token_required in their own view
+        limited = rate_limit.limiter.hit(current_user.id, 'read')
+        if limited is not None:
+            g.rate_limit = limited
+            if not limited.allowed:
+                results[index] = (429, {'error': 'Rate limit exceeded'})
+                continue
+        lookups.setdefault((match.group(1), query_string), {})[index] = int(match.group(2))
+
+    for (collection, query_string), wanted in lookups.items():
+        args = MultiDict(parse_qsl(query_string, keep_blank_values=True))
+        try:
+            records = BATCH_LOOKUPS[collection](current_user.company_id, set(wanted.values()), args)
+        except ValueError as e:
+            records = None
+            error = str(e)
+
+        for index, record_id in wanted.items():
+            if records is None:
+                results[index] = (400, {'error': error})
+            elif record_id in records:
+                results[index] = (200, records[record_id])
+            else:
+                results[index] = (404, {'error': 'Not found'})
+
+    for index, path, query_string in dispatched:
+        results[index] = dispatch_subrequest(path, query_string, current_user)
+
+    return api_serializers.json_response({
+        'responses': [
+            {
+                'id': entry.get('id') if isinstance(entry, dict) else None,
+                'status': status,
+                'body': body
+            }
+            for entry, (status, body) in zip(entries, results)
+        ]
     })
 
 
+@api_bp.route('/webhooks', methods=['GET'])
+@token_required
+def list_webhooks(current_user):
+    """Registered webhook endpoints (secrets are only returned on creation)"""
+    endpoints = WebhookEndpoint.query.filter_by(
+        company_id=current_user.company_id
+    ).order_by(WebhookEndpoint.id).all()
+
+    return api_serializers.json_response({'webhooks': [webhook_to_dict(endpoint) for endpoint in endpoints]})
+
+
+@api_bp.route('/webhooks', methods=['POST'])
+@token_required
+def create_webhook(current_user):
+    """
+    Register a webhook endpoint.
+
+    Body: url, events ("*" or a list of event types), batch_size (events
+    per POST, default 1) and max_concurrency (parallel POSTs per
+    dispatching process, default 2; the receiver can see this times the
+    number of worker processes).
+    """
+    data = request.get_json(silent=True) or {}
+
+    try:
+        settings = webhooks.validate_endpoint(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    endpoint = webhooks.create_endpoint(current_user.company_id, settings)
+
+    result = webhook_to_dict(endpoint)
+    result['secret'] = endpoint.secret
+    return api_serializers.json_response(result, 201)
+
+
+@api_bp.route('/webhooks/<int:webhook_id>', methods=['DELETE'])
+@token_required
+def delete_webhook(current_user, webhook_id):
+    """Remove a webhook endpoint and its pending deliveries"""
+    endpoint = WebhookEndpoint.query.filter_by(
+        id=webhook_id, company_id=current_user.company_id
+    ).first()
+    if not endpoint:
+        return jsonify({'error': 'Not found'}), 404
+
+    webhooks.delete_endpoint(endpoint)
+    return '', 204
+
+
+@api_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Rate limiter counters in Prometheus text format (needs METRICS_TOKEN)"""
+    expected = current_app.config.get('METRICS_TOKEN')
+    if not expected:
+        return jsonify({'error': 'Not found'}), 404
+
+    supplied = request.headers.get('Authorization', '')[len('Bearer '):]
+    if not hmac.compare_digest(supplied.encode('utf-8'), expected.encode('utf-8')):
+        return jsonify({'error': 'Invalid token'}), 401
+
+    body = rate_limit.prometheus_text(rate_limit.limiter.metrics())
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+
 # Helper functions
-def invoice_to_dict(invoice, include_items=False):
-    """Convert invoice to dictionary"""
+def page_size():
+    """Requested page size, capped at 100"""
+    return max(1, min(request.args.get('per_page', 20, type=int), 100))
+
+
+def cursor_page_response(key, query, model, serializer):
+    """
+    Serialize one keyset page of a list endpoint.
+
+    Query parameters: cursor (from the previous page's next_cursor),
+    per_page, order (desc or asc) and with_total=1 to add a total count.
+    """
+    try:
+        page = keyset_page(
+            query, model, page_size(),
+            cursor=request.args.get('cursor'),
+            descending=request.args.get('order', 'desc') != 'asc',
+            with_total=request.args.get('with_total') in ('1', 'true')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     result = {
-        'id': invoice.id,
-        'invoice_number': invoice.invoice_number,
-        'invoice_date': invoice.invoice_date.isoformat(),
-        'due_date': invoice.due_date.isoformat(),
-        'status': invoice.status,
-        'client_id': invoice.client_id,
-        'client_name': invoice.client.name,
-        'subtotal': float(invoice.subtotal),
-        'vat_amount': float(invoice.vat_amount),
-        'total': float(invoice.total),
-        'payment_reference': invoice.payment_reference,
-        'created_at': invoice.created_at.isoformat(),
-        'updated_at': invoice.updated_at.isoformat()
+        key: [serializer(item) for item in page['items']],
+        'next_cursor': page['next_cursor'],
+        'has_more': page['has_more']
     }
+    if 'total' in page:
+        result['total'] = page['total']
+
+    return api_serializers.json_response(result)
+
+
+def requested_fields(allowed, args=None):
+    """
+    Fields named in ?fields=, in request order; all fields by default.
+
+    Raises:
+        ValueError: If an unknown field is requested
+    """
+    value = (request.args if args is None else args).get('fields')
+    if not value:
+        return allowed
+
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    return fields
+
+
+def requested_includes(allowed, default=(), args=None):
+    """
+    Related data named in ?include=.
+
+    Raises:
+        ValueError: If an unknown include is requested
+    """
+    value = (request.args if args is None else args).get('include')
+    if value is None:
+        return default
+
+    include = tuple(i.strip() for i in value.split(',') if i.strip())
+    unknown = [i for i in include if i not in allowed]
+    if unknown:
+        raise ValueError(f'Unknown include: {", ".join(unknown)}')
+    return include
+
+
+def parse_date_arg(name):
+    """Date query parameter as YYYY-MM-DD, or None when absent"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{name} must be a date (YYYY-MM-DD)')
+
+
+def columns_for(model, fields):
+    """Mapped columns to load for a fieldset; id and created_at drive cursors"""
+    names = dict.fromkeys(('id', 'created_at') + tuple(fields))
+    return [getattr(model, name) for name in names]
+
+
+def invoice_load_options(fields, include):
+    """
+    Loader options so serializing a page takes a fixed number of queries.
+
+    Only the requested invoice columns are selected. The client comes from
+    a JOIN in the same query (just its name unless ?include=client), and
+    items are fetched with one extra IN query for the whole page.
+    """
+    columns = [f for f in fields if f != 'client_name']
+    if 'client_name' in fields:
+        columns.append('client_id')
+
+    options = [load_only(*columns_for(Invoice, columns))]
 
-    if include_items:
-        result['items'] = [{
-            'id': item.id,
-            'description': item.description,
-            'quantity': float(item.quantity),
-            'unit': item.unit,
-            'unit_price': float(item.unit_price),
-            'vat_rate': item.vat_rate,
-            'line_total': float(item.line_total),
-            'vat_amount': float(item.vat_amount)
-        } for item in invoice.items]
+    if 'client' in include:
+        options.append(joinedload(Invoice.client))
+    elif 'client_name' in fields:
+        options.append(joinedload(Invoice.client).load_only(Client.name))
 
-    return result
+    if 'items' in include:
+        options.append(selectinload(Invoice.items))
 
+    return options
 
-def client_to_dict(client):
+
+INVOICE_FIELDS = tuple(api_serializers.INVOICE_SPEC)
+INVOICE_INCLUDES = tuple(api_serializers.INCLUDES['invoice'])
+CLIENT_FIELDS = tuple(api_serializers.CLIENT_SPEC)
+PRODUCT_FIELDS = tuple(api_serializers.PRODUCT_SPEC)
+
+
+def invoice_to_dict(invoice, include_items=False, fields=INVOICE_FIELDS, include=()):
+    """Convert invoice to dictionary, touching only the requested attributes"""
+    if include_items and 'items' not in include:
+        include = tuple(include) + ('items',)
+    return api_serializers.serializer_for('invoice', fields, include)(invoice)
+
+
+def client_to_dict(client, fields=CLIENT_FIELDS):
     """Convert client to dictionary"""
-    return {
-        'id': client.id,
-        'name': client.name,
-        'legal_name': client.legal_name,
-        'client_type': client.client_type,
-        'company_code': client.company_code,
-        'vat_code': client.vat_code,
-        'contact_person': client.contact_person,
-        'email': client.email,
-        'phone': client.phone,
-        'address': client.address,
-        'city': client.city,
-        'postal_code': client.postal_code,
-        'country': client.country
-    }
+    return api_serializers.serializer_for('client', fields)(client)
 
 
-def product_to_dict(product):
+def product_to_dict(product, fields=PRODUCT_FIELDS):
     """Convert product to dictionary"""
+    return api_serializers.serializer_for('product', fields)(product)
+
+
+def webhook_to_dict(endpoint):
+    """Convert webhook endpoint to dictionary (without its secret)"""
     return {
-        'id': product.id,
-        'name': product.name,
-        'description': product.description,
-        'sku': product.sku,
-        'product_type': product.product_type,
-        'unit_price': float(product.unit_price),
-        'unit': product.unit,
-        'vat_rate': product.vat_rate
+        'id': endpoint.id,
+        'url': endpoint.url,
+        'events': endpoint.events if endpoint.events == '*' else endpoint.events.split(','),
+        'batch_size': endpoint.batch_size,
+        'max_concurrency': endpoint.max_concurrency,
+        'is_active': endpoint.is_active,
+        'created_at': endpoint.created_at.isoformat()
     }
+
+
+def lookup_invoices(company_id, ids, args):
+    """Invoices by id as GET /api/invoices/<id> renders them, in one IN query"""
+    fields = requested_fields(INVOICE_FIELDS, args)
+    include = requested_includes(INVOICE_INCLUDES, default=('items',), args=args)
+    serialize = api_serializers.serializer_for('invoice', fields, include)
+
+    invoices = Invoice.query.options(*invoice_load_options(fields, include)).filter(
+        Invoice.company_id == company_id,
+        Invoice.id.in_(ids)
+    )
+    return {invoice.id: serialize(invoice) for invoice in invoices}
+
+
+def lookup_clients(company_id, ids, args):
+    """Clients by id as GET /api/clients/<id> renders them, in one IN query"""
+    fields = requested_fields(CLIENT_FIELDS, args)
+    serialize = api_serializers.serializer_for('client', fields)
+
+    clients = Client.query.options(load_only(*columns_for(Client, fields))).filter(
+        Client.company_id == company_id,
+        Client.id.in_(ids)
+    )
+    return {client.id: serialize(client) for client in clients}
+
+
+def dispatch_subrequest(path, query_string, principal):
+    """
+    Run a batched GET through its view, in the current app context and session.
+
+    The view gets the batch's principal instead of authenticating again.
+    g is shared with the batch request, so the batch's rate limit result
+    is put back after the sub-request's after_request hooks consumed theirs.
+
+    Returns:
+        tuple: (status code, JSON body); non-JSON responses such as the
+               HTML error pages become {"error": "<status>"}
+    """
+    saved_rate_limit = g.pop('rate_limit', None)
+    g.batch_principal = principal
+    try:
+        with current_app.test_request_context(path, query_string=query_string):
+            response = current_app.full_dispatch_request()
+    finally:
+        g.pop('batch_principal', None)
+        g.pop('rate_limit', None)
+        if saved_rate_limit is not None:
+            g.rate_limit = saved_rate_limit
+
+    body = response.get_json(silent=True)
+    if body is None:
+        body = {'error': response.status}
+    return response.status_code, body
+
+
+# GET paths POST /api/batch accepts: JSON read endpoints only, never streams
+BATCHABLE_PATH = re.compile(r'^/api/(?:(?:invoices|clients)(?:/\d+)?|products|changes|webhooks)$')
+
+# GET paths POST /api/batch answers with one IN query per collection
+BATCH_LOOKUP_PATH = re.compile(r'^/api/(invoices|clients)/(\d+)$')
+BATCH_LOOKUPS = {
+    'invoices': lookup_invoices,
+    'clients': lookup_clients
+}
+
+
+# entity type: (model, serializer, loader options) for GET /api/changes
+CHANGE_FEED_TYPES = {
+    'invoice': (Invoice, invoice_to_dict, invoice_load_options(INVOICE_FIELDS, ())),
+    'client': (Client, client_to_dict, ()),
+    'product': (Product, product_to_dict, ())
+}
@@ -6,7 +6,8 @@ from flask_login import login_required, current_user
 
 from app import db
 from app.models import Client, ActivityLog
-from app.forms import ClientForm
+from app.forms import ClientForm, ClientImportForm
+from app.services import client_import
 
 clients_bp = Blueprint('clients', __name__)
 
@@ -46,7 +47,8 @@ def index():
         'clients/index.html',
         clients=clients,
         search=search,
-        show_inactive=show_inactive
+        show_inactive=show_inactive,
+        import_form=ClientImportForm()
     )
 
 
@@ -190,6 +192,62 @@ def delete(client_id):
     return redirect(url_for('clients.index'))
 
 
+@clients_bp.route('/import', methods=['POST'])
+@login_required
+def import_csv():
+    """Bulk import clients from CSV, updating existing ones with the same code"""
+    company = current_user.company
+    if not company:
+        flash('Prašome pirmiausia užpildyti įmonės informaciją.', 'warning')
+        return redirect(url_for('settings.company'))
+
+    form = ClientImportForm()
+
+    if not form.validate_on_submit():
+        for errors in form.errors.values():
+            for error in errors:
+                flash(error, 'error')
+        return redirect(url_for('clients.index'))
+
+    text = form.csv_file.data.read().decode('utf-8-sig', errors='replace')
+    try:
+        records = client_import.parse_csv(text)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('clients.index'))
+
+    results = client_import.upsert_clients(
+        company.id,
+        records,
+        client_limit=current_user.plan_config.get('clients_limit', 10)
+    )
+
+    created = sum(1 for result in results if result['status'] == 'created')
+    updated = sum(1 for result in results if result['status'] == 'updated')
+    errors = [
+        f'{line_number} eilutė: {result["error"]}'
+        for (line_number, _), result in zip(records, results)
+        if result['status'] == 'error'
+    ]
+
+    if created or updated:
+        ActivityLog.log(
+            user_id=current_user.id,
+            action='imported',
+            entity_type='client',
+            details=f'Created: {created}, updated: {updated}, errors: {len(errors)}',
+            ip_address=request.remote_addr
+        )
+
+    flash(f'Sukurta klientų: {created}, atnaujinta: {updated}.', 'success' if created or updated else 'warning')
+    for error in errors[:10]:
+        flash(error, 'error')
+    if len(errors) > 10:
+        flash(f'... ir dar {len(errors) - 10} klaidų.', 'error')
+
+    return redirect(url_for('clients.index'))
+
+
 @clients_bp.route('/search')
 @login_required
 def search():
@@ -0,0 +1,383 @@
+"""
+Expense Routes
+Expense tracking, receipts and bulk CSV import
+"""
+from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, current_app
+from flask_login import login_required, current_user
+from werkzeug.utils import secure_filename
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+import csv
+import io
+import os
+import uuid
+
+from app import db
+from app.models import Expense, ActivityLog
+from app.forms import ExpenseForm, ExpenseImportForm, EXPENSE_CATEGORIES
+from app.services import expense_rollup
+from app.services.change_tracking import bump_data_version
+
+expenses_bp = Blueprint('expenses', __name__)
+
+# Rows per executemany batch during CSV import
+IMPORT_BATCH_SIZE = 1000
+
+# Accepted CSV header names for each expense field
+IMPORT_COLUMNS = {
+    'expense_date': ['data', 'date'],
+    'description': ['aprasymas', 'aprašymas', 'description'],
+    'category': ['kategorija', 'category'],
+    'amount': ['suma', 'suma be pvm', 'amount'],
+    'vat_amount': ['pvm', 'pvm suma', 'vat', 'vat_amount'],
+    'vendor_name': ['tiekejas', 'tiekėjas', 'vendor', 'vendor_name'],
+    'vendor_vat_code': ['tiekejo pvm kodas', 'tiekėjo pvm kodas', 'vendor_vat_code'],
+    'receipt_number': ['dokumento nr.', 'dokumento numeris', 'receipt_number']
+}
+
+
+@expenses_bp.before_request
+@login_required
+def check_access():
+    """Expense tracking is a Pro feature"""
+    if not current_user.company:
+        flash('Prašome pirmiausia užpildyti įmonės informaciją.', 'warning')
+        return redirect(url_for('settings.company'))
+
+    if current_user.subscription_plan not in ['pro', 'enterprise']:
+        flash('Išlaidų sekimas prieinamas Pro plane.', 'warning')
+        return redirect(url_for('payments.upgrade'))
+
+
+@expenses_bp.route('/')
+def index():
+    """List expenses"""
+    company = current_user.company
+
+    # Filters
+    search = request.args.get('search', '')
+    category = request.args.get('category', 'all')
+    date_from = request.args.get('date_from')
+    date_to = request.args.get('date_to')
+
+    query = Expense.query.filter_by(company_id=company.id)
+
+    if search:
+        query = query.filter(
+            Expense.description.ilike(f'%{search}%') |
+            Expense.vendor_name.ilike(f'%{search}%') |
+            Expense.receipt_number.ilike(f'%{search}%')
+        )
+    if category != 'all':
+        query = query.filter_by(category=category)
+    if date_from:
+        query = query.filter(Expense.expense_date >= date_from)
+    if date_to:
+        query = query.filter(Expense.expense_date <= date_to)
+
+    # Pagination
+    page = request.args.get('page', 1, type=int)
+    expenses = query.order_by(Expense.expense_date.desc(), Expense.id.desc()).paginate(
+        page=page, per_page=20, error_out=False
+    )
+
+    return render_template(
+        'expenses/index.html',
+        expenses=expenses,
+        search=search,
+        category=category,
+        categories=EXPENSE_CATEGORIES,
+        import_form=ExpenseImportForm()
+    )
+
+
+@expenses_bp.route('/create', methods=['GET', 'POST'])
+def create():
+    """Create new expense"""
+    company = current_user.company
+    form = ExpenseForm()
+
+    if form.validate_on_submit() and not books_locked(company, form.expense_date.data):
+        expense = Expense(company_id=company.id)
+        populate_expense(expense, form)
+
+        db.session.add(expense)
+        expense_rollup.apply_deltas(expense_rollup.expense_deltas(expense))
+        db.session.commit()
+
+        ActivityLog.log(
+            user_id=current_user.id,
+            action='created',
+            entity_type='expense',
+            entity_id=expense.id,
+            ip_address=request.remote_addr
+        )
+
+        flash('Išlaida užregistruota.', 'success')
+        return redirect(url_for('expenses.index'))
+
+    if not form.expense_date.data:
+        form.expense_date.data = date.today()
+
+    return render_template('expenses/create.html', form=form)
+
+
+@expenses_bp.route('/<int:expense_id>/edit', methods=['GET', 'POST'])
+def edit(expense_id):
+    """Edit expense"""
+    expense = Expense.query.get_or_404(expense_id)
+
+    company = current_user.company
+    if expense.company_id != company.id:
+        flash('Neturite prieigos prie šios išlaidos.', 'error')
+        return redirect(url_for('expenses.index'))
+
+    if books_locked(company, expense.expense_date):
+        return redirect(url_for('expenses.index'))
+
+    form = ExpenseForm(obj=expense)
+
+    if form.validate_on_submit() and not books_locked(company, form.expense_date.data):
+        # Move the old values out of the rollup and the new ones in
+        deltas = expense_rollup.expense_deltas(expense, sign=-1)
+        populate_expense(expense, form)
+        expense_rollup.expense_deltas(expense, sign=1, deltas=deltas)
+
+        expense_rollup.apply_deltas(deltas)
+        db.session.commit()
+
+        ActivityLog.log(
+            user_id=current_user.id,
+            action='updated',
+            entity_type='expense',
+            entity_id=expense.id,
+            ip_address=request.remote_addr
+        )
+
+        flash('Išlaida atnaujinta.', 'success')
+        return redirect(url_for('expenses.index'))
+
+    return render_template('expenses/edit.html', form=form, expense=expense)
+
+
+@expenses_bp.route('/<int:expense_id>/delete', methods=['POST'])
+def delete(expense_id):
+    """Delete expense"""
+    expense = Expense.query.get_or_404(expense_id)
+
+    if expense.company_id != current_user.company.id:
+        flash('Neturite prieigos prie šios išlaidos.', 'error')
+        return redirect(url_for('expenses.index'))
+
+    if books_locked(current_user.company, expense.expense_date):
+        return redirect(url_for('expenses.index'))
+
+    expense_rollup.apply_deltas(expense_rollup.expense_deltas(expense, sign=-1))
+    receipt_file = expense.receipt_file
+    db.session.delete(expense)
+    db.session.commit()
+
+    if receipt_file:
+        path = os.path.join(current_app.config['UPLOAD_FOLDER'], receipt_file)
+        if os.path.exists(path):
+            os.remove(path)
+
+    ActivityLog.log(
+        user_id=current_user.id,
+        action='deleted',
+        entity_type='expense',
+        entity_id=expense_id,
+        ip_address=request.remote_addr
+    )
+
+    flash('Išlaida pašalinta.', 'success')
+    return redirect(url_for('expenses.index'))
+
+
+@expenses_bp.route('/<int:expense_id>/receipt')
+def receipt(expense_id):
+    """Download the receipt attached to an expense"""
+    expense = Expense.query.get_or_404(expense_id)
+
+    if expense.company_id != current_user.company.id or not expense.receipt_file:
+        flash('Kvitas nerastas.', 'error')
+        return redirect(url_for('expenses.index'))
+
+    return send_file(
+        os.path.join(current_app.config['UPLOAD_FOLDER'], expense.receipt_file),
+        as_attachment=True,
+        download_name=os.path.basename(expense.receipt_file).split('_', 1)[-1]
+    )
+
+
+@expenses_bp.route('/import', methods=['POST'])
+def import_csv():
+    """Bulk import expenses from CSV"""
+    company = current_user.company
+    form = ExpenseImportForm()
+
+    if not form.validate_on_submit():
+        for errors in form.errors.values():
+            for error in errors:
+                flash(error, 'error')
+        return redirect(url_for('expenses.index'))
+
+    text = form.csv_file.data.read().decode('utf-8-sig', errors='replace')
+    rows, errors = parse_expense_csv(text, company.id)
+
+    if company.books_locked_until:
+        locked = [row for row in rows if company.is_date_locked(row['expense_date'])]
+        if locked:
+            rows = [row for row in rows if not company.is_date_locked(row['expense_date'])]
+            errors.append(
+                f'Praleista išlaidų uždarytame laikotarpyje (iki '
+                f'{company.books_locked_until:%Y-%m-%d}): {len(locked)}.'
+            )
+
+    if rows:
+        deltas = expense_rollup.new_deltas()
+        for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+            batch = rows[start:start + IMPORT_BATCH_SIZE]
+            # Core insert: one executemany per batch even when optional
+            # columns are empty on some rows
+            db.session.execute(Expense.__table__.insert(), batch)
+            for row in batch:
+                expense_rollup.add_to_deltas(
+                    deltas, company.id, row['expense_date'], row['category'],
+                    row['amount'], row['vat_amount']
+                )
+
+        expense_rollup.apply_deltas(deltas)
+        # executemany bypasses the ORM flush hooks
+        bump_data_version(db.session.connection(), {company.id})
+        db.session.commit()
+
+        ActivityLog.log(
+            user_id=current_user.id,
+            action='imported',
+            entity_type='expense',
+            details=f'Imported: {len(rows)}, errors: {len(errors)}',
+            ip_address=request.remote_addr
+        )
+
+    flash(f'Importuota išlaidų: {len(rows)}.', 'success' if rows else 'warning')
+    for error in errors[:10]:
+        flash(error, 'error')
+    if len(errors) > 10:
+        flash(f'... ir dar {len(errors) - 10} klaidų.', 'error')
+
+    return redirect(url_for('expenses.index'))
+
+
+# Helper functions
+def books_locked(company, value):
+    """Flash an error and return True if a date falls in a period closed by the books lock"""
+    if not company.is_date_locked(value):
+        return False
+    flash(
+        f'Laikotarpis iki {company.books_locked_until:%Y-%m-%d} uždarytas. '
+        'Jo išlaidų keisti negalima.',
+        'error'
+    )
+    return True
+
+
+def populate_expense(expense, form):
+    """Copy form data onto an expense, saving an uploaded receipt"""
+    expense.description = form.description.data
+    expense.category = form.category.data
+    expense.amount = form.amount.data
+    expense.vat_amount = form.vat_amount.data or 0
+    expense.expense_date = form.expense_date.data
+    expense.vendor_name = form.vendor_name.data
+    expense.vendor_vat_code = form.vendor_vat_code.data
+    expense.receipt_number = form.receipt_number.data
+    expense.notes = form.notes.data
+
+    file = form.receipt_file.data
+    if file and getattr(file, 'filename', None):
+        expense.receipt_file = save_receipt(file, expense.company_id)
+
+
+def save_receipt(file, company_id):
+    """Store an uploaded receipt, returning its path relative to UPLOAD_FOLDER"""
+    filename = f'{uuid.uuid4().hex[:12]}_{secure_filename(file.filename)}'
+    relative_path = os.path.join('receipts', str(company_id), filename)
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    file.save(path)
+    return relative_path
+
+
+def parse_expense_csv(text, company_id):
+    """
+    Parse and validate an expense CSV.
+
+    Returns:
+        tuple: (list of insert-ready dicts, list of error messages)
+    """
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(io.StringIO(text), dialect)
+
+    header = next(reader, None)
+    if not header:
+        return [], ['Tuščias failas.']
+
+    positions = {}
+    normalized = [name.strip().lower() for name in header]
+    for field, aliases in IMPORT_COLUMNS.items():
+        for alias in aliases:
+            if alias in normalized:
+                positions[field] = normalized.index(alias)
+                break
+
+    missing = [f for f in ('expense_date', 'description', 'amount') if f not in positions]
+    if missing:
+        return [], [f'Trūksta stulpelių: {", ".join(missing)}']
+
+    categories = {key for key, _ in EXPENSE_CATEGORIES}
+    now = datetime.utcnow()
+    rows, errors = [], []
+
+    for line_number, values in enumerate(reader, start=2):
+        if not any(v.strip() for v in values):
+            continue
+
+        def value(field):
+            index = positions.get(field)
+            if index is None or index >= len(values):
+                return ''
+            return values[index].strip()
+
+        try:
+            expense_date = datetime.strptime(value('expense_date'), '%Y-%m-%d').date()
+            amount = Decimal(value('amount').replace(',', '.'))
+            vat_amount = Decimal((value('vat_amount') or '0').replace(',', '.'))
+        except (ValueError, InvalidOperation):
+            errors.append(f'{line_number} eilutė: neteisinga data arba suma.')
+            continue
+
+        description = value('description')
+        if not description:
+            errors.append(f'{line_number} eilutė: trūksta aprašymo.')
+            continue
+
+        category = value('category').lower()
+        rows.append({
+            'company_id': company_id,
+            'description': description[:300],
+            'category': category if category in categories else 'other',
+            'amount': amount.quantize(Decimal('0.01')),
+            'vat_amount': vat_amount.quantize(Decimal('0.01')),
+            'expense_date': expense_date,
+            'vendor_name': value('vendor_name')[:200] or None,
+            'vendor_vat_code': value('vendor_vat_code')[:20] or None,
+            'receipt_number': value('receipt_number')[:50] or None,
+            'created_at': now,
+            'updated_at': now
+        })
+
+    return rows, errors
@@ -2,7 +2,7 @@
 Invoice Routes
 Create, view, edit, send, and manage invoices
 """
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, current_app, session
 from flask_login import login_required, current_user
 from datetime import date, timedelta
 import io
@@ -12,6 +12,7 @@ from app.models import Invoice, InvoiceItem, Client, Product, ActivityLog
 from app.forms import InvoiceForm, InvoiceItemForm
 from app.services.pdf_generator import generate_invoice_pdf
 from app.services.email_service import send_invoice_email
+from app.services import etags
 
 invoices_bp = Blueprint('invoices', __name__)
 
@@ -83,7 +84,7 @@ def create():
         (c.id, c.name) for c in clients
     ]
 
-    if form.validate_on_submit():
+    if form.validate_on_submit() and not books_locked(company, form.invoice_date.data):
         # Generate invoice number
         invoice_number = company.get_next_invoice_number()
 
@@ -128,6 +129,7 @@ def create():
 
 @invoices_bp.route('/<int:invoice_id>')
 @login_required
+@etags.conditional(lambda invoice_id: invoice_page_etag(invoice_id))
 def view(invoice_id):
     """View invoice details"""
     invoice = Invoice.query.get_or_404(invoice_id)
@@ -157,13 +159,16 @@ def edit(invoice_id):
         flash('Galima redaguoti tik juodraščio būsenos sąskaitas.', 'warning')
         return redirect(url_for('invoices.view', invoice_id=invoice_id))
 
+    if books_locked(company, invoice.invoice_date):
+        return redirect(url_for('invoices.view', invoice_id=invoice_id))
+
     form = InvoiceForm(obj=invoice)
     clients = company.clients.filter_by(is_active=True).order_by(Client.name).all()
     form.client_id.choices = [(c.id, c.name) for c in clients]
 
     products = company.products.filter_by(is_active=True).order_by(Product.name).all()
 
-    if form.validate_on_submit():
+    if form.validate_on_submit() and not books_locked(company, form.invoice_date.data):
         invoice.client_id = form.client_id.data
         invoice.invoice_date = form.invoice_date.data
         invoice.due_date = form.invoice_date.data + timedelta(days=company.payment_terms)
@@ -193,8 +198,15 @@ def add_item(invoice_id):
     if invoice.status != 'draft':
         return jsonify({'error': 'Cannot modify sent invoice'}), 400
 
+    if current_user.company.is_date_locked(invoice.invoice_date):
+        return jsonify({'error': 'Books are locked for this period'}), 400
+
     data = request.get_json()
 
+    vat_rate = data.get('vat_rate', 21)
+    if vat_rate not in current_app.config['VAT_RATES'].values():
+        return jsonify({'error': 'Invalid VAT rate'}), 400
+
     item = InvoiceItem(
         invoice_id=invoice.id,
         product_id=data.get('product_id'),
@@ -202,7 +214,7 @@ def add_item(invoice_id):
         quantity=data['quantity'],
         unit=data.get('unit', 'vnt.'),
         unit_price=data['unit_price'],
-        vat_rate=data.get('vat_rate', 21),
+        vat_rate=vat_rate,
         position=len(invoice.items)
     )
     item.calculate()
@@ -238,6 +250,9 @@ def delete_item(invoice_id, item_id):
     if invoice.status != 'draft':
         return jsonify({'error': 'Cannot modify sent invoice'}), 400
 
+    if current_user.company.is_date_locked(invoice.invoice_date):
+        return jsonify({'error': 'Books are locked for this period'}), 400
+
     item = InvoiceItem.query.get_or_404(item_id)
     if item.invoice_id != invoice.id:
         return jsonify({'error': 'Item not found'}), 404
@@ -268,6 +283,10 @@ def send(invoice_id):
         flash('Sąskaita neturi eilučių.', 'error')
         return redirect(url_for('invoices.edit', invoice_id=invoice_id))
 
+    # Issuing a draft adds it to the VAT of its period; resending does not
+    if invoice.status == 'draft' and books_locked(current_user.company, invoice.invoice_date):
+        return redirect(url_for('invoices.view', invoice_id=invoice_id))
+
     # Generate PDF
     pdf_buffer = generate_invoice_pdf(invoice)
 
@@ -322,6 +341,11 @@ def mark_paid(invoice_id):
         flash('Neturite prieigos prie šios sąskaitos.', 'error')
         return redirect(url_for('invoices.index'))
 
+    # Payments arrive after the period closes and do not change its VAT;
+    # only a draft paid directly would become a document of that period
+    if invoice.status == 'draft' and books_locked(current_user.company, invoice.invoice_date):
+        return redirect(url_for('invoices.view', invoice_id=invoice_id))
+
     invoice.mark_as_paid()
     db.session.commit()
 
@@ -351,6 +375,9 @@ def cancel(invoice_id):
         flash('Negalima atšaukti apmokėtos sąskaitos.', 'error')
         return redirect(url_for('invoices.view', invoice_id=invoice_id))
 
+    if books_locked(current_user.company, invoice.invoice_date):
+        return redirect(url_for('invoices.view', invoice_id=invoice_id))
+
     invoice.status = 'cancelled'
     db.session.commit()
 
@@ -382,6 +409,9 @@ def duplicate(invoice_id):
         flash('Pasiektas sąskaitų limitas. Atnaujinkite planą.', 'warning')
         return redirect(url_for('payments.upgrade'))
 
+    if books_locked(company, date.today()):
+        return redirect(url_for('invoices.view', invoice_id=invoice_id))
+
     # Create new invoice
     new_invoice = Invoice(
         user_id=current_user.id,
@@ -418,3 +448,33 @@ def duplicate(invoice_id):
 
     flash(f'Sąskaitos kopija sukurta: {new_invoice.invoice_number}', 'success')
     return redirect(url_for('invoices.edit', invoice_id=new_invoice.id))
+
+
+# Helper functions
+def books_locked(company, value):
+    """Flash an error and return True if a date falls in a period closed by the books lock"""
+    if not company.is_date_locked(value):
+        return False
+    flash(
+        f'Laikotarpis iki {company.books_locked_until:%Y-%m-%d} uždarytas. '
+        'Jo sąskaitų keisti negalima.',
+        'error'
+    )
+    return True
+
+
+def invoice_page_etag(invoice_id):
+    """Conditional GET validator for the invoice page"""
+    # Pending flash messages are rendered once and must not be skipped
+    if session.get('_flashes'):
+        return None
+
+    row = etags.invoice_version(invoice_id, current_user.id)
+    if row is None:
+        return None
+
+    # The page also shows the seller, the user and today's overdue state
+    return (
+        current_user.id, current_user.updated_at, row.updated_at, row.data_version,
+        row.company_updated_at, date.today()
+    )
@@ -8,6 +8,7 @@ import stripe
 
 from app import db
 from app.models import ActivityLog
+from app.services import api_auth
 
 payments_bp = Blueprint('payments', __name__)
 
@@ -97,6 +98,7 @@ def success():
                 plan = session.metadata.get('plan', 'basic')
                 current_user.subscription_plan = plan
                 current_user.stripe_subscription_id = session.subscription
+                api_auth.revoke_user(current_user.id)
                 db.session.commit()
 
                 ActivityLog.log(
@@ -193,6 +195,7 @@ def handle_checkout_completed(session):
         if user:
             user.subscription_plan = plan
             user.stripe_subscription_id = session.get('subscription')
+            api_auth.revoke_user(user.id)
             db.session.commit()
 
 
@@ -238,6 +241,8 @@ def handle_subscription_deleted(subscription):
     if user:
         user.subscription_plan = 'free'
         user.stripe_subscription_id = None
+        # Other workers stop granting the old plan with their next request
+        api_auth.revoke_user(user.id)
         db.session.commit()
 
         ActivityLog.log(
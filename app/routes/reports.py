@@ -2,15 +2,20 @@
 Reports Routes
 Financial reports, VMI reports, analytics
 """
-from flask import Blueprint, render_template, request, send_file, current_app
+from flask import (
+    Blueprint, render_template, redirect, url_for, flash, request, send_file,
+    jsonify, current_app, Response, stream_with_context
+)
 from flask_login import login_required, current_user
-from datetime import date, datetime, timedelta
-from sqlalchemy import func
-import io
-import csv
+from datetime import date, datetime
+from decimal import Decimal
+import tempfile
 
-from app import db
-from app.models import Invoice, Client, Expense
+from app.models import Client, Expense, ReportJob
+from app.services import columnar_export, exports, isaf, report_data, report_jobs, xlsx_export
+from app.services import cashflow as cashflow_service
+from app.services.report_cache import cached_report
+from app.services.report_data import month_range, quarter_range
 
 reports_bp = Blueprint('reports', __name__)
 
@@ -47,52 +52,25 @@ def revenue():
     else:
         date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
 
-    # Get paid invoices in range
-    invoices = company.invoices.filter(
-        Invoice.status == 'paid',
-        Invoice.paid_date >= date_from,
-        Invoice.paid_date <= date_to
-    ).order_by(Invoice.paid_date).all()
-
-    # Calculate totals
-    total_revenue = sum(float(inv.total) for inv in invoices)
-    total_vat = sum(float(inv.vat_amount) for inv in invoices)
-    total_net = sum(float(inv.subtotal) for inv in invoices)
-
-    # Monthly breakdown
-    monthly_data = {}
-    for inv in invoices:
-        month_key = inv.paid_date.strftime('%Y-%m')
-        if month_key not in monthly_data:
-            monthly_data[month_key] = {'revenue': 0, 'vat': 0, 'count': 0}
-        monthly_data[month_key]['revenue'] += float(inv.total)
-        monthly_data[month_key]['vat'] += float(inv.vat_amount)
-        monthly_data[month_key]['count'] += 1
-
-    # Top clients by revenue
-    client_revenue = db.session.query(
-        Client.id,
-        Client.name,
-        func.sum(Invoice.total).label('total')
-    ).join(Invoice).filter(
-        Invoice.company_id == company.id,
-        Invoice.status == 'paid',
-        Invoice.paid_date >= date_from,
-        Invoice.paid_date <= date_to
-    ).group_by(Client.id, Client.name).order_by(
-        func.sum(Invoice.total).desc()
-    ).limit(10).all()
+    # Aggregates are cached until the company's data changes
+    summary = cached_report(
+        company, 'revenue', {'from': date_from, 'to': date_to},
+        lambda: report_data.revenue_summary(company.id, date_from, date_to),
+        period_end=date_to
+    )
+
+    # Only the per-invoice listing loads rows, one page at a time
+    page = request.args.get('page', 1, type=int)
+    invoices = report_data.paid_invoices_query(
+        company, date_from, date_to
+    ).paginate(page=page, per_page=50, error_out=False)
 
     return render_template(
         'reports/revenue.html',
         invoices=invoices,
-        total_revenue=total_revenue,
-        total_vat=total_vat,
-        total_net=total_net,
-        monthly_data=monthly_data,
-        client_revenue=client_revenue,
         date_from=date_from,
-        date_to=date_to
+        date_to=date_to,
+        **summary
     )
 
 
@@ -107,31 +85,30 @@ def vat_report():
     quarter = int(request.args.get('quarter', (date.today().month - 1) // 3 + 1))
 
     # Calculate date range for quarter
-    quarter_start = date(year, (quarter - 1) * 3 + 1, 1)
-    if quarter == 4:
-        quarter_end = date(year, 12, 31)
-    else:
-        quarter_end = date(year, quarter * 3 + 1, 1) - timedelta(days=1)
-
-    # Get invoices for the quarter
-    invoices = company.invoices.filter(
-        Invoice.invoice_date >= quarter_start,
-        Invoice.invoice_date <= quarter_end,
-        Invoice.status.in_(['sent', 'paid', 'overdue'])
-    ).order_by(Invoice.invoice_date).all()
-
-    # Group by VAT rate
-    vat_breakdown = {}
-    for inv in invoices:
-        for item in inv.items:
-            rate = item.vat_rate
-            if rate not in vat_breakdown:
-                vat_breakdown[rate] = {'base': 0, 'vat': 0}
-            vat_breakdown[rate]['base'] += float(item.line_total)
-            vat_breakdown[rate]['vat'] += float(item.vat_amount)
-
-    total_vat = sum(v['vat'] for v in vat_breakdown.values())
-    total_base = sum(v['base'] for v in vat_breakdown.values())
+    quarter_start, quarter_end = quarter_range(year, quarter)
+
+    # Per-rate totals are aggregated in the database
+    vat_breakdown = cached_report(
+        company, 'vat', {'year': year, 'quarter': quarter},
+        lambda: report_data.vat_breakdown(company.id, quarter_start, quarter_end),
+        period_end=quarter_end
+    )
+
+    total_vat = sum((v['vat'] for v in vat_breakdown.values()), Decimal('0.00'))
+    total_base = sum((v['base'] for v in vat_breakdown.values()), Decimal('0.00'))
+
+    # Deductible purchase VAT comes from the expense rollup
+    input_vat = cached_report(
+        company, 'input_vat', {'year': year, 'quarter': quarter},
+        lambda: report_data.input_vat(company.id, quarter_start, quarter_end),
+        period_end=quarter_end
+    )
+
+    # Invoice detail is paginated separately
+    page = request.args.get('page', 1, type=int)
+    invoices = report_data.vat_invoices_query(
+        company, quarter_start, quarter_end
+    ).paginate(page=page, per_page=50, error_out=False)
 
     return render_template(
         'reports/vat.html',
@@ -139,6 +116,8 @@ def vat_report():
         vat_breakdown=vat_breakdown,
         total_vat=total_vat,
         total_base=total_base,
+        input_vat=input_vat,
+        vat_payable=total_vat - input_vat,
         year=year,
         quarter=quarter,
         quarter_start=quarter_start,
@@ -146,6 +125,40 @@ def vat_report():
     )
 
 
+@reports_bp.route('/profit-loss')
+@login_required
+def profit_loss():
+    """Profit & loss report"""
+    company = current_user.company
+
+    # Date range
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+
+    if not date_from:
+        date_from = date(date.today().year, 1, 1)
+    else:
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date()
+
+    if not date_to:
+        date_to = date.today()
+    else:
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
+
+    summary = cached_report(
+        company, 'profit_loss', {'from': date_from, 'to': date_to},
+        lambda: report_data.profit_loss(company.id, date_from, date_to),
+        period_end=date_to
+    )
+
+    return render_template(
+        'reports/profit_loss.html',
+        date_from=date_from,
+        date_to=date_to,
+        **summary
+    )
+
+
 @reports_bp.route('/clients')
 @login_required
 def clients_report():
@@ -153,135 +166,336 @@ def clients_report():
     company = current_user.company
 
     # Get all clients with their invoice stats
-    clients_data = db.session.query(
-        Client,
-        func.count(Invoice.id).label('invoice_count'),
-        func.sum(Invoice.total).label('total_invoiced'),
-        func.sum(
-            db.case(
-                (Invoice.status == 'paid', Invoice.total),
-                else_=0
-            )
-        ).label('total_paid'),
-        func.sum(
-            db.case(
-                (Invoice.status.in_(['sent', 'overdue']), Invoice.total),
-                else_=0
-            )
-        ).label('outstanding')
-    ).outerjoin(Invoice).filter(
-        Client.company_id == company.id
-    ).group_by(Client.id).order_by(
-        func.sum(Invoice.total).desc().nullslast()
-    ).all()
+    clients_data = cached_report(
+        company, 'clients', {},
+        lambda: report_data.clients_summary(company.id)
+    )
 
     return render_template('reports/clients.html', clients_data=clients_data)
 
 
+@reports_bp.route('/aging')
+@login_required
+def aging():
+    """Receivables aging report"""
+    company = current_user.company
+    as_of = parse_as_of()
+
+    aging_data = cached_report(
+        company, 'aging', {'as_of': as_of},
+        lambda: report_data.aging_summary(company.id, as_of)
+    )
+
+    return render_template(
+        'reports/aging.html',
+        clients=aging_data['clients'],
+        totals=aging_data['totals'],
+        buckets=report_data.AGING_BUCKETS,
+        as_of=as_of
+    )
+
+
+@reports_bp.route('/aging/<int:client_id>')
+@login_required
+def aging_client(client_id):
+    """Open invoices of one client with their aging bucket"""
+    company = current_user.company
+    client = Client.query.get_or_404(client_id)
+
+    if client.company_id != company.id:
+        flash('Neturite prieigos prie šio kliento.', 'error')
+        return redirect(url_for('reports.aging'))
+
+    as_of = parse_as_of()
+    invoices = report_data.open_invoices_query(company.id, client.id).all()
+    rows = [{
+        'invoice': inv,
+        'days_overdue': max((as_of - inv.due_date).days, 0),
+        'bucket': report_data.aging_bucket(inv.due_date, as_of)
+    } for inv in invoices]
+
+    return render_template(
+        'reports/aging_client.html',
+        client=client,
+        rows=rows,
+        buckets=report_data.AGING_BUCKETS,
+        as_of=as_of
+    )
+
+
+@reports_bp.route('/export/aging')
+@login_required
+def export_aging():
+    """Export receivables aging report to CSV"""
+    company = current_user.company
+    as_of = parse_as_of()
+    aging_data = report_data.aging_summary(company.id, as_of)
+
+    keys = [key for key, _, _, _ in report_data.AGING_BUCKETS] + ['total']
+    header = ['Klientas', 'Sąskaitų'] + [
+        label for _, label, _, _ in report_data.AGING_BUCKETS
+    ] + ['Viso']
+    rows = [
+        [client['name'], client['invoice_count']] + [client[key] for key in keys]
+        for client in aging_data['clients']
+    ]
+    rows.append(['Viso', ''] + [aging_data['totals'][key] for key in keys])
+
+    return csv_response(
+        exports.generate_csv(header, rows, list, delimiter=';'),
+        f'skolu_senatis_{as_of.strftime("%Y%m%d")}.csv'
+    )
+
+
+@reports_bp.route('/cashflow')
+@login_required
+def cashflow():
+    """Cash-flow forecast: expected inflows per week for the next 13 weeks"""
+    company = current_user.company
+    as_of = parse_as_of()
+
+    forecast = cached_report(
+        company, 'cashflow', {'as_of': as_of},
+        lambda: cashflow_service.forecast_inflows(company.id, as_of)
+    )
+
+    return render_template('reports/cashflow.html', forecast=forecast, as_of=as_of)
+
+
 @reports_bp.route('/export/invoices')
 @login_required
 def export_invoices():
-    """Export invoices to CSV"""
+    """Export invoices to CSV (streamed) or XLSX"""
     company = current_user.company
 
     # Date range
     date_from = request.args.get('from')
     date_to = request.args.get('to')
 
-    query = company.invoices
-
-    if date_from:
-        query = query.filter(Invoice.invoice_date >= date_from)
-    if date_to:
-        query = query.filter(Invoice.invoice_date <= date_to)
-
-    invoices = query.order_by(Invoice.invoice_date).all()
-
-    # Create CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # Header
-    writer.writerow([
-        'Sąskaitos Nr.', 'Data', 'Terminas', 'Klientas',
-        'Suma be PVM', 'PVM', 'Viso', 'Būsena', 'Apmokėta'
-    ])
-
-    # Data
-    for inv in invoices:
-        writer.writerow([
-            inv.invoice_number,
-            inv.invoice_date.strftime('%Y-%m-%d'),
-            inv.due_date.strftime('%Y-%m-%d'),
-            inv.client.name,
-            float(inv.subtotal),
-            float(inv.vat_amount),
-            float(inv.total),
-            inv.status,
-            inv.paid_date.strftime('%Y-%m-%d') if inv.paid_date else ''
-        ])
-
-    output.seek(0)
+    rows = exports.stream_rows(
+        exports.invoice_export_query(company.id, date_from, date_to)
+    )
 
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8-sig')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'saskaitos_{date.today().strftime("%Y%m%d")}.csv'
+    if request.args.get('format') == 'xlsx':
+        return xlsx_response(
+            'Sąskaitos', exports.INVOICE_EXPORT_HEADER, xlsx_export.INVOICE_COLUMNS, rows,
+            f'saskaitos_{date.today().strftime("%Y%m%d")}.xlsx'
+        )
+
+    return csv_response(
+        exports.generate_csv(
+            exports.INVOICE_EXPORT_HEADER, rows, exports.format_invoice_row
+        ),
+        f'saskaitos_{date.today().strftime("%Y%m%d")}.csv'
     )
 
 
 @reports_bp.route('/export/vat')
 @login_required
 def export_vat():
-    """Export VAT report for VMI (SAF-T lite format)"""
+    """Export VAT report for VMI (SAF-T lite format, streamed CSV or XLSX)"""
     company = current_user.company
 
     year = int(request.args.get('year', date.today().year))
     quarter = int(request.args.get('quarter', (date.today().month - 1) // 3 + 1))
+    quarter_start, quarter_end = quarter_range(year, quarter)
 
-    quarter_start = date(year, (quarter - 1) * 3 + 1, 1)
-    if quarter == 4:
-        quarter_end = date(year, 12, 31)
-    else:
-        quarter_end = date(year, quarter * 3 + 1, 1) - timedelta(days=1)
-
-    invoices = company.invoices.filter(
-        Invoice.invoice_date >= quarter_start,
-        Invoice.invoice_date <= quarter_end,
-        Invoice.status.in_(['sent', 'paid', 'overdue'])
-    ).order_by(Invoice.invoice_date).all()
-
-    # Create CSV for VMI
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=';')
-
-    # SAF-T lite header
-    writer.writerow([
-        'Dokumento tipas', 'Dokumento numeris', 'Dokumento data',
-        'Pirkėjo kodas', 'Pirkėjo PVM kodas', 'Pirkėjo pavadinimas',
-        'Apmokestinama vertė', 'PVM suma', 'PVM tarifas'
-    ])
-
-    for inv in invoices:
-        for item in inv.items:
-            writer.writerow([
-                'SF',  # Sąskaita faktūra
-                inv.invoice_number,
-                inv.invoice_date.strftime('%Y-%m-%d'),
-                inv.client.company_code or '',
-                inv.client.vat_code or '',
-                inv.client.name,
-                float(item.line_total),
-                float(item.vat_amount),
-                item.vat_rate
-            ])
-
-    output.seek(0)
+    rows = exports.stream_rows(
+        exports.vat_export_query(company.id, quarter_start, quarter_end)
+    )
+
+    if request.args.get('format') == 'xlsx':
+        return xlsx_response(
+            'PVM', exports.VAT_EXPORT_HEADER, xlsx_export.VAT_COLUMNS, rows,
+            f'pvm_ataskaita_{year}Q{quarter}.xlsx', values=xlsx_export.vat_values
+        )
+
+    return csv_response(
+        exports.generate_csv(
+            exports.VAT_EXPORT_HEADER, rows, exports.format_vat_row, delimiter=';'
+        ),
+        f'pvm_ataskaita_{year}Q{quarter}.csv'
+    )
+
+
+@reports_bp.route('/export/clients')
+@login_required
+def export_clients():
+    """Export the clients report to CSV (streamed) or XLSX"""
+    company = current_user.company
+
+    rows = exports.stream_rows(report_data.clients_summary_query(company.id))
+
+    if request.args.get('format') == 'xlsx':
+        return xlsx_response(
+            'Klientai', exports.CLIENT_EXPORT_HEADER, xlsx_export.CLIENT_COLUMNS, rows,
+            f'klientai_{date.today().strftime("%Y%m%d")}.xlsx', values=xlsx_export.client_values
+        )
+
+    return csv_response(
+        exports.generate_csv(
+            exports.CLIENT_EXPORT_HEADER, rows, exports.format_client_row
+        ),
+        f'klientai_{date.today().strftime("%Y%m%d")}.csv'
+    )
+
+
+@reports_bp.route('/export/isaf')
+@login_required
+def export_isaf():
+    """Export the monthly i.SAF sales invoice register for VMI (XML, streamed)"""
+    company = current_user.company
+
+    year = int(request.args.get('year', date.today().year))
+    month = int(request.args.get('month', date.today().month))
+    month_start, month_end = month_range(year, month)
+
+    rates = isaf.unmapped_vat_rates(company.id, month_start, month_end)
+    if rates:
+        flash(f'i.SAF negalima eksportuoti: PVM tarifams {", ".join(f"{rate}%" for rate in rates)} '
+              f'nepriskirtas mokesčio kodas.', 'error')
+        return redirect(url_for('reports.index'))
+
+    countries = isaf.unmapped_countries(company.id, month_start, month_end)
+    if countries:
+        flash(f'i.SAF negalima eksportuoti: klientų šalims {", ".join(c or "(nenurodyta)" for c in countries)} '
+              f'nerastas šalies kodas.', 'error')
+        return redirect(url_for('reports.index'))
+
+    return Response(
+        stream_with_context(isaf.generate_isaf_xml(company, month_start, month_end)),
+        mimetype='application/xml',
+        headers={
+            'Content-Disposition': f'attachment; filename=isaf_{year}{month:02d}.xml'
+        }
+    )
+
+
+@reports_bp.route('/export/analytics')
+@login_required
+def export_analytics():
+    """Export invoices, invoice lines and clients as Parquet or Arrow IPC files"""
+    company = current_user.company
+
+    fmt = request.args.get('format', 'parquet')
+    if fmt not in columnar_export.FORMATS:
+        fmt = 'parquet'
+
+    if not columnar_export.is_available():
+        flash('Analitinis eksportas neįdiegtas serveryje.', 'warning')
+        return redirect(url_for('reports.index'))
+
+    archive = tempfile.TemporaryFile()
+    columnar_export.write_snapshot_zip(
+        company.id, archive, fmt,
+        date_from=request.args.get('from'),
+        date_to=request.args.get('to')
+    )
+    archive.seek(0)
 
     return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8-sig')),
-        mimetype='text/csv',
+        archive,
+        mimetype='application/zip',
         as_attachment=True,
-        download_name=f'pvm_ataskaita_{year}Q{quarter}.csv'
+        download_name=f'analitika_{fmt}_{date.today().strftime("%Y%m%d")}.zip'
+    )
+
+
+@reports_bp.route('/jobs', methods=['POST'])
+@login_required
+def submit_job():
+    """Submit a report or export to run in the background"""
+    company = current_user.company
+    params = request.get_json(silent=True) or request.form.to_dict()
+    kind = params.pop('kind', None)
+
+    try:
+        job = report_jobs.submit_job(company.id, current_user.id, kind, params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(job_to_dict(job)), 202
+
+
+@reports_bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """Report job status and progress (polled by the page)"""
+    job = ReportJob.query.get_or_404(job_id)
+
+    if job.company_id != current_user.company.id:
+        return jsonify({'error': 'Not found'}), 404
+
+    return jsonify(job_to_dict(job))
+
+
+@reports_bp.route('/jobs/<job_id>/download')
+@login_required
+def download_job_result(job_id):
+    """Download the result file of a completed report job"""
+    job = ReportJob.query.get_or_404(job_id)
+
+    if job.company_id != current_user.company.id:
+        flash('Neturite prieigos prie šios ataskaitos.', 'error')
+        return redirect(url_for('reports.index'))
+
+    if job.status != 'completed':
+        flash('Ataskaita dar ruošiama.', 'info')
+        return redirect(url_for('reports.index'))
+
+    return send_file(
+        report_jobs.result_path(job),
+        mimetype=report_jobs.result_mimetype(job),
+        as_attachment=True,
+        download_name=job.download_name
+    )
+
+
+# Helper functions
+def parse_as_of():
+    """Read the report date from the query string, defaulting to today"""
+    as_of = request.args.get('as_of')
+    if as_of:
+        return datetime.strptime(as_of, '%Y-%m-%d').date()
+    return date.today()
+
+
+def job_to_dict(job):
+    """Convert report job to dictionary"""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'status_url': url_for('reports.job_status', job_id=job.id),
+        'download_url': (
+            url_for('reports.download_job_result', job_id=job.id)
+            if job.status == 'completed' else None
+        )
+    }
+
+
+def xlsx_response(title, header, columns, rows, filename, values=tuple):
+    """Build a workbook in a temporary file and send it as a download"""
+    workbook = tempfile.TemporaryFile()
+    xlsx_export.write_xlsx(workbook, title, header, columns, rows, values)
+    workbook.seek(0)
+
+    return send_file(
+        workbook,
+        mimetype=xlsx_export.XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name=filename
+    )
+
+
+def csv_response(chunks, filename):
+    """Stream CSV chunks to the client as a file download"""
+    return Response(
+        stream_with_context(chunks),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
@@ -5,11 +5,13 @@ Company settings, user profile, preferences
 from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
+from datetime import datetime
 import os
 
 from app import db
-from app.models import Company, ActivityLog
-from app.forms import CompanyForm, UserProfileForm, ChangePasswordForm
+from app.models import Company, ActivityLog, ApiKey
+from app.forms import CompanyForm, UserProfileForm, ChangePasswordForm, ApiKeyForm
+from app.services import api_auth
 
 settings_bp = Blueprint('settings', __name__)
 
@@ -40,6 +42,7 @@ def company():
             email=current_user.email
         )
         db.session.add(company)
+        api_auth.revoke_user(current_user.id)
         db.session.commit()
 
     form = CompanyForm(obj=company)
@@ -135,10 +138,21 @@ def invoice_settings():
     company = current_user.company
 
     if request.method == 'POST':
+        # Closing the books marks earlier periods as final; an absent field keeps the lock
+        locked_until = company.books_locked_until
+        if 'books_locked_until' in request.form:
+            value = request.form['books_locked_until'].strip()
+            try:
+                locked_until = datetime.strptime(value, '%Y-%m-%d').date() if value else None
+            except ValueError:
+                flash('Neteisinga knygų uždarymo data.', 'error')
+                return redirect(url_for('settings.invoice_settings'))
+
         company.invoice_prefix = request.form.get('invoice_prefix', 'SF')[:10]
         company.payment_terms = int(request.form.get('payment_terms', 14))
         company.invoice_notes = request.form.get('invoice_notes', '')
         company.primary_color = request.form.get('primary_color', '#2563eb')
+        company.books_locked_until = locked_until
 
         db.session.commit()
         flash('Sąskaitų nustatymai išsaugoti.', 'success')
@@ -158,6 +172,57 @@ def billing():
     )
 
 
+@settings_bp.route('/api-keys', methods=['GET', 'POST'])
+@login_required
+def api_keys():
+    """API keys for integrations (Enterprise plan)"""
+    form = ApiKeyForm()
+    new_key = None
+
+    if form.validate_on_submit():
+        if current_user.subscription_plan != 'enterprise':
+            flash('API prieiga galima tik Enterprise plane.', 'warning')
+            return redirect(url_for('payments.upgrade'))
+
+        api_key, new_key = api_auth.create_api_key(current_user, form.name.data, form.scopes.data)
+
+        ActivityLog.log(
+            user_id=current_user.id,
+            action='api_key_created',
+            entity_type='api_key',
+            entity_id=api_key.id,
+            ip_address=request.remote_addr
+        )
+
+        flash('API raktas sukurtas. Nukopijuokite jį dabar - vėliau jo pamatyti nebegalėsite.', 'success')
+        form = ApiKeyForm(formdata=None)
+
+    keys = current_user.api_keys.order_by(ApiKey.created_at.desc()).all()
+
+    return render_template('settings/api_keys.html', form=form, keys=keys, new_key=new_key)
+
+
+@settings_bp.route('/api-keys/<int:key_id>/revoke', methods=['POST'])
+@login_required
+def revoke_api_key(key_id):
+    """Revoke an API key"""
+    api_key = ApiKey.query.filter_by(id=key_id, user_id=current_user.id).first_or_404()
+
+    if not api_key.is_revoked:
+        api_auth.revoke_api_key(api_key)
+
+        ActivityLog.log(
+            user_id=current_user.id,
+            action='api_key_revoked',
+            entity_type='api_key',
+            entity_id=api_key.id,
+            ip_address=request.remote_addr
+        )
+
+    flash('API raktas atšauktas.', 'success')
+    return redirect(url_for('settings.api_keys'))
+
+
 @settings_bp.route('/export')
 @login_required
 def export_data():
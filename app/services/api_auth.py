@@ -0,0 +1,293 @@
+"""
+API Auth Service
+API keys and verified bearer credentials cached as compact principals
+"""
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from datetime import datetime
+
+import jwt
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from app.models import User, Company, ApiKey
+from app.services.report_cache import ReportCache
+
+# API keys look like sp_<prefix>_<secret>; JWTs never start with this
+API_KEY_PREFIX = 'sp_'
+
+API_SCOPES = ('read', 'write')
+
+
+class ApiPrincipal:
+    """
+    The caller of an API request: the ids, plan and scopes the handlers need.
+
+    ``id`` is the user id, so code written against a User (``current_user.id``)
+    keeps working. The company row is only loaded by handlers that write.
+    """
+
+    __slots__ = ('id', 'company_id', 'plan', 'scopes')
+
+    def __init__(self, user_id, company_id, plan, scopes=API_SCOPES):
+        self.id = user_id
+        self.company_id = company_id
+        self.plan = plan
+        self.scopes = frozenset(scopes)
+
+    @property
+    def company(self):
+        """The user's company (identity-map lookup, one query at most)"""
+        if self.company_id is None:
+            return None
+        return db.session.get(Company, self.company_id)
+
+    def __repr__(self):
+        return f'<ApiPrincipal user={self.id} company={self.company_id} plan={self.plan}>'
+
+
+class PrincipalCache:
+    """
+    Verified tokens keyed by SHA-256 of the token, until the token expires.
+
+    Each entry keeps the user's ``auth_version`` it was loaded with; callers
+    compare it with the database on every hit, so revocations made in any
+    worker process apply at once. Entries live at most ``max_ttl`` seconds.
+    ``revoke`` drops every cached principal of a user in this process.
+    """
+
+    def __init__(self, max_entries=10000, max_ttl=300):
+        self.max_ttl = max_ttl
+        self._entries = ReportCache(max_entries=max_entries, default_ttl=max_ttl)
+        self._revoked = {}  # user id -> monotonic time of revocation
+        self._lock = threading.Lock()
+
+    def configure(self, max_entries, max_ttl):
+        self.max_ttl = max_ttl
+        self._entries.max_entries = max_entries
+        self._entries.default_ttl = max_ttl
+
+    def get(self, key):
+        """Return (principal, auth version) or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        cached_at, principal, auth_version = entry
+        with self._lock:
+            revoked_at = self._revoked.get(principal.id)
+        if revoked_at is not None and cached_at <= revoked_at:
+            return None
+        return principal, auth_version
+
+    def set(self, key, principal, auth_version, loaded_at, expires_at=None):
+        """
+        Store a principal.
+
+        Args:
+            auth_version: The user's auth_version read with the principal
+            loaded_at: time.monotonic() taken before the principal was read,
+                       so a revocation racing with the read still applies
+            expires_at: The token's ``exp`` claim (Unix time), if any
+        """
+        ttl = self.max_ttl
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - time.time())
+        if ttl > 0:
+            self._entries.set(key, (loaded_at, principal, auth_version), ttl=ttl)
+
+    def revoke(self, user_id):
+        """Forget every cached principal of a user"""
+        now = time.monotonic()
+        with self._lock:
+            self._revoked[user_id] = now
+            # Anything cached before max_ttl ago has expired anyway
+            for revoked_user, revoked_at in list(self._revoked.items()):
+                if revoked_at < now - self.max_ttl:
+                    del self._revoked[revoked_user]
+
+    def clear(self):
+        self._entries.clear()
+        with self._lock:
+            self._revoked.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+principal_cache = PrincipalCache()
+
+
+def init_app(app):
+    """Configure the shared cache from app config"""
+    principal_cache.configure(
+        max_entries=app.config['API_PRINCIPAL_CACHE_MAX_ENTRIES'],
+        max_ttl=app.config['API_PRINCIPAL_CACHE_TTL']
+    )
+
+
+def token_key(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def load_principal(user_id):
+    """
+    Principal for a user id in one query.
+
+    Returns:
+        tuple: (ApiPrincipal, auth version), or None if the user does not exist
+    """
+    row = db.session.execute(
+        select(User.id, Company.id, User.subscription_plan, User.auth_version).outerjoin(
+            Company, Company.user_id == User.id
+        ).where(User.id == user_id).order_by(Company.id).limit(1)
+    ).first()
+    if row is None:
+        return None
+    return ApiPrincipal(row[0], row[1], row[2]), row.auth_version
+
+
+def cached_principal(key):
+    """
+    A cached principal that is still current, or None.
+
+    One primary key lookup of the user's auth_version per hit; this is what
+    makes a revocation or plan change in another worker take effect at once.
+    """
+    cached = principal_cache.get(key)
+    if cached is None:
+        return None
+
+    principal, auth_version = cached
+    current = db.session.scalar(select(User.auth_version).where(User.id == principal.id))
+    if current != auth_version:
+        return None
+    return principal
+
+
+def authenticate(token):
+    """
+    Principal for a bearer token.
+
+    A token seen before is answered from the cache without decoding it
+    again; only its user's auth_version is checked.
+
+    Returns:
+        ApiPrincipal or None if the token's user no longer exists
+
+    Raises:
+        jwt.InvalidTokenError: If the token is invalid or expired
+    """
+    key = token_key(token)
+    principal = cached_principal(key)
+    if principal is not None:
+        return principal
+
+    data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+    loaded_at = time.monotonic()
+    loaded = load_principal(data.get('user_id'))
+    if loaded is None:
+        return None
+    principal, auth_version = loaded
+    principal_cache.set(key, principal, auth_version, loaded_at, data.get('exp'))
+    return principal
+
+
+def is_api_key(token):
+    return token.startswith(API_KEY_PREFIX)
+
+
+def hash_api_key(key):
+    """Keyed SHA-256 of an API key (keys are random, so no slow hash is needed)"""
+    return hmac.new(
+        current_app.config['SECRET_KEY'].encode('utf-8'),
+        key.encode('utf-8'),
+        hashlib.sha256
+    ).hexdigest()
+
+
+def create_api_key(user, name, scopes='read,write'):
+    """
+    Create an API key for a user.
+
+    Returns:
+        tuple: (ApiKey, full key) - the full key is not stored and can only
+               be shown now
+    """
+    prefix = secrets.token_hex(6)
+    key = f'{API_KEY_PREFIX}{prefix}_{secrets.token_urlsafe(32)}'
+
+    api_key = ApiKey(
+        user_id=user.id,
+        name=name,
+        prefix=prefix,
+        key_hash=hash_api_key(key),
+        scopes=scopes
+    )
+    db.session.add(api_key)
+    db.session.commit()
+    return api_key, key
+
+
+def revoke_api_key(api_key):
+    api_key.revoked_at = datetime.utcnow()
+    revoke_user(api_key.user_id)
+    db.session.commit()
+
+
+def authenticate_key(key):
+    """
+    Principal for an API key: a current cache hit or one query on the unique prefix.
+
+    Returns:
+        ApiPrincipal or None if the key is unknown, revoked or malformed
+    """
+    cache_key = token_key(key)
+    principal = cached_principal(cache_key)
+    if principal is not None:
+        return principal
+
+    parts = key[len(API_KEY_PREFIX):].split('_', 1)
+    if len(parts) != 2:
+        return None
+
+    loaded_at = time.monotonic()
+    row = db.session.execute(
+        select(
+            ApiKey.key_hash, ApiKey.scopes, User.id, Company.id, User.subscription_plan, User.auth_version
+        ).join(User, User.id == ApiKey.user_id).outerjoin(
+            Company, Company.user_id == User.id
+        ).where(
+            ApiKey.prefix == parts[0],
+            ApiKey.revoked_at.is_(None)
+        ).order_by(Company.id).limit(1)
+    ).first()
+
+    if row is None or not hmac.compare_digest(row.key_hash, hash_api_key(key)):
+        return None
+
+    principal = ApiPrincipal(row[2], row[3], row[4], row.scopes.split(','))
+    principal_cache.set(cache_key, principal, row.auth_version, loaded_at)
+    return principal
+
+
+def revoke_user(user_id):
+    """
+    Make the next API call of a user re-read its keys, plan and company.
+
+    Bumps the user's auth_version, which invalidates the principals cached
+    by every worker process, not only this one. Call it in the transaction
+    that makes the change; the caller commits.
+    """
+    users = User.__table__
+    db.session.execute(
+        users.update().where(users.c.id == user_id).values(
+            auth_version=users.c.auth_version + 1,
+            updated_at=users.c.updated_at  # Not a profile change
+        )
+    )
+    principal_cache.revoke(user_id)
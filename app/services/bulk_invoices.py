@@ -0,0 +1,236 @@
+"""
+Bulk Invoice Service
+Validates and inserts many API invoices in one transaction
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from flask import current_app
+from sqlalchemy import bindparam, select
+
+from app import db
+from app.models import Company, Invoice, InvoiceItem, Client, Product
+from app.services import webhooks
+from app.services.change_tracking import bump_data_version, record_changes
+
+
+class BulkEntryError(ValueError):
+    """An entry of a bulk request that cannot be created"""
+
+
+def _parse_date(value, field):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise BulkEntryError(f'{field} must be YYYY-MM-DD')
+
+
+def _parse_item(item_data, position, product_ids):
+    """Validate one item and compute its amounts like InvoiceItem.calculate"""
+    if not isinstance(item_data, dict):
+        raise BulkEntryError(f'items[{position}] must be an object')
+    if not item_data.get('description'):
+        raise BulkEntryError(f'items[{position}].description is required')
+    if 'unit_price' not in item_data:
+        raise BulkEntryError(f'items[{position}].unit_price is required')
+
+    try:
+        quantity = Decimal(str(item_data.get('quantity', 1)))
+        unit_price = Decimal(str(item_data['unit_price']))
+        vat_rate = int(item_data.get('vat_rate', 21))
+    except (InvalidOperation, TypeError, ValueError):
+        raise BulkEntryError(f'items[{position}] has an invalid number')
+
+    vat_rates = current_app.config['VAT_RATES'].values()
+    if vat_rate not in vat_rates:
+        raise BulkEntryError(f'items[{position}].vat_rate must be one of {", ".join(map(str, vat_rates))}')
+
+    product_id = item_data.get('product_id')
+    if product_id is not None and product_id not in product_ids:
+        raise BulkEntryError(f'items[{position}].product_id not found')
+
+    line_total = quantity * unit_price
+    return {
+        'product_id': product_id,
+        'description': item_data['description'],
+        'quantity': quantity,
+        'unit': item_data.get('unit', 'vnt.'),
+        'unit_price': unit_price,
+        'vat_rate': vat_rate,
+        'line_total': line_total,
+        'vat_amount': line_total * Decimal(vat_rate) / Decimal('100'),
+        'position': position
+    }
+
+
+def _parse_entry(entry, company, client_ids, product_ids):
+    """
+    Validate one bulk entry.
+
+    Returns:
+        tuple: (invoice column values without number, list of item values)
+
+    Raises:
+        BulkEntryError: If the entry is invalid
+    """
+    if not isinstance(entry, dict):
+        raise BulkEntryError('entry must be an object')
+    if entry.get('client_id') not in client_ids:
+        raise BulkEntryError('Client not found')
+
+    invoice_date = _parse_date(entry['invoice_date'], 'invoice_date') \
+        if 'invoice_date' in entry else date.today()
+    due_date = _parse_date(entry['due_date'], 'due_date') \
+        if 'due_date' in entry else invoice_date + timedelta(days=company.payment_terms)
+    if company.is_date_locked(invoice_date):
+        raise BulkEntryError(f'Books are locked until {company.books_locked_until.isoformat()}')
+
+    items_data = entry.get('items', [])
+    if not isinstance(items_data, list):
+        raise BulkEntryError('items must be a list')
+    items = [_parse_item(item, idx, product_ids) for idx, item in enumerate(items_data)]
+
+    subtotal = sum((item['line_total'] for item in items), Decimal('0'))
+    vat_amount = sum((item['vat_amount'] for item in items), Decimal('0'))
+
+    invoice = {
+        'client_id': entry['client_id'],
+        'invoice_date': invoice_date,
+        'due_date': due_date,
+        'notes': entry.get('notes', ''),
+        'status': 'draft',
+        'subtotal': subtotal,
+        'vat_amount': vat_amount,
+        'total': subtotal + vat_amount
+    }
+    return invoice, items
+
+
+def _referenced_ids(entries, company_id):
+    """Client and product ids of the company referenced by entries (one IN query each)"""
+    client_ids = set()
+    product_ids = set()
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        if isinstance(entry.get('client_id'), int):
+            client_ids.add(entry['client_id'])
+        for item in entry.get('items') or []:
+            if isinstance(item, dict) and isinstance(item.get('product_id'), int):
+                product_ids.add(item['product_id'])
+
+    if client_ids:
+        client_ids = set(db.session.scalars(
+            select(Client.id).where(Client.company_id == company_id, Client.id.in_(client_ids))
+        ))
+    if product_ids:
+        product_ids = set(db.session.scalars(
+            select(Product.id).where(Product.company_id == company_id, Product.id.in_(product_ids))
+        ))
+    return client_ids, product_ids
+
+
+def allocate_invoice_numbers(company, count):
+    """
+    Reserve a contiguous block of invoice numbers in the current transaction.
+
+    A single UPDATE ... RETURNING increments the counter, so the company row
+    stays locked until commit and concurrent allocations cannot overlap. A
+    rollback returns the block.
+    """
+    companies = Company.__table__
+    next_number = db.session.execute(
+        companies.update().where(companies.c.id == company.id).values(
+            next_invoice_number=companies.c.next_invoice_number + count
+        ).returning(companies.c.next_invoice_number)
+    ).scalar()
+    db.session.expire(company, ['next_invoice_number'])
+
+    first = next_number - count
+    return [f"{company.invoice_prefix}{number:06d}" for number in range(first, next_number)]
+
+
+def create_invoices(user, company, entries):
+    """
+    Create draft invoices from API entries.
+
+    Invalid entries are reported and skipped; the valid ones are inserted
+    with one executemany per table after a single number-block allocation.
+
+    Args:
+        user: User creating the invoices
+        company: The user's company
+        entries: List of invoice dicts as accepted by POST /api/invoices
+
+    Returns:
+        list: One result dict per entry, in request order
+    """
+    client_ids, product_ids = _referenced_ids(entries, company.id)
+
+    results = [None] * len(entries)
+    valid = []
+    for index, entry in enumerate(entries):
+        try:
+            valid.append((index,) + _parse_entry(entry, company, client_ids, product_ids))
+        except BulkEntryError as e:
+            results[index] = {'index': index, 'status': 'error', 'error': str(e)}
+
+    if not valid:
+        return results
+
+    numbers = allocate_invoice_numbers(company, len(valid))
+    now = datetime.utcnow()
+
+    # Core statements keep each table to one batched executemany; RETURNING
+    # rows may come back in any order, so ids are matched by invoice number
+    invoices = Invoice.__table__
+    invoice_rows = [
+        dict(invoice, user_id=user.id, company_id=company.id, invoice_number=number,
+             created_at=now, updated_at=now)
+        for (_, invoice, _), number in zip(valid, numbers)
+    ]
+    ids_by_number = dict(db.session.execute(
+        invoices.insert().returning(invoices.c.invoice_number, invoices.c.id),
+        invoice_rows
+    ).all())
+    invoice_ids = [ids_by_number[number] for number in numbers]
+
+    db.session.execute(
+        invoices.update().where(invoices.c.id == bindparam('invoice_id')).values(
+            payment_reference=bindparam('reference')
+        ),
+        [
+            {'invoice_id': invoice_id, 'reference': Invoice.payment_reference_for(invoice_id)}
+            for invoice_id in invoice_ids
+        ]
+    )
+
+    item_rows = [
+        dict(item, invoice_id=invoice_id)
+        for (_, _, items), invoice_id in zip(valid, invoice_ids)
+        for item in items
+    ]
+    if item_rows:
+        db.session.execute(InvoiceItem.__table__.insert(), item_rows)
+
+    # executemany bypasses the ORM flush hooks
+    connection = db.session.connection()
+    bump_data_version(connection, {company.id})
+    record_changes(connection, company.id, 'invoice', invoice_ids, 'created')
+    webhooks.queue_events(db.session, [
+        (company.id, 'invoice.created', 'invoice', invoice_id) for invoice_id in invoice_ids
+    ])
+    db.session.commit()
+
+    for (index, invoice, _), invoice_id, number in zip(valid, invoice_ids, numbers):
+        results[index] = {
+            'index': index,
+            'status': 'created',
+            'id': invoice_id,
+            'invoice_number': number,
+            'payment_reference': Invoice.payment_reference_for(invoice_id),
+            'subtotal': float(invoice['subtotal']),
+            'vat_amount': float(invoice['vat_amount']),
+            'total': float(invoice['total'])
+        }
+
+    return results
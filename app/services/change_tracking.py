@@ -0,0 +1,181 @@
+"""
+Change Tracking Service
+Maintains per-company data versions and the API change log from ORM flushes
+"""
+from datetime import datetime
+from sqlalchemy import event, select, func, or_, literal
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Company, Invoice, InvoiceItem, Client, Product, Expense, ChangeLogEntry
+
+# Models whose rows carry a company_id directly
+COMPANY_SCOPED_MODELS = (Invoice, Client, Product, Expense)
+
+# Models exposed through GET /api/changes, with their entity type names
+CHANGE_LOGGED_MODELS = {
+    Invoice: 'invoice',
+    Client: 'client',
+    Product: 'product'
+}
+
+
+def register_listeners():
+    """Attach the flush listener (idempotent)"""
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+
+
+def _after_flush(session, flush_context):
+    """Bump data versions and log changes for every company touched by this flush"""
+    company_ids = set()
+    invoice_ids = set()
+    changes = {}  # (entity_type, entity_id) -> (company_id, action)
+
+    for obj, action in _changed_objects(session):
+        if isinstance(obj, COMPANY_SCOPED_MODELS):
+            company_ids.add(obj.company_id)
+            entity_type = CHANGE_LOGGED_MODELS.get(type(obj))
+            if entity_type and obj.company_id is not None:
+                changes[(entity_type, obj.id)] = (obj.company_id, action)
+        elif isinstance(obj, InvoiceItem):
+            invoice_ids.add(obj.invoice_id)
+
+    company_ids.discard(None)
+    invoice_ids.discard(None)
+
+    # Line changes show up as updates of invoices not already logged
+    invoice_ids -= {entity_id for entity_type, entity_id in changes if entity_type == 'invoice'}
+
+    if company_ids or invoice_ids:
+        connection = session.connection()
+        # The version bump locks the company rows first, so change log ids
+        # below are allocated in commit order per company
+        bump_data_version(connection, company_ids, invoice_ids)
+        _insert_changes(connection, changes, invoice_ids)
+
+
+def _changed_objects(session):
+    """(object, action) for objects inserted, deleted or modified in the current flush"""
+    for obj in session.new:
+        yield obj, 'created'
+    for obj in session.deleted:
+        yield obj, 'deleted'
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            yield obj, 'updated'
+
+
+def _insert_changes(connection, changes, updated_invoice_ids=()):
+    now = datetime.utcnow()
+    table = ChangeLogEntry.__table__
+
+    if changes:
+        connection.execute(table.insert(), [
+            {
+                'company_id': company_id,
+                'entity_type': entity_type,
+                'entity_id': entity_id,
+                'action': action,
+                'created_at': now
+            }
+            for (entity_type, entity_id), (company_id, action) in changes.items()
+        ])
+
+    if updated_invoice_ids:
+        connection.execute(table.insert().from_select(
+            ['company_id', 'entity_type', 'entity_id', 'action', 'created_at'],
+            select(
+                Invoice.company_id,
+                literal('invoice'),
+                Invoice.id,
+                literal('updated'),
+                literal(now)
+            ).where(Invoice.id.in_(list(updated_invoice_ids)))
+        ))
+
+
+def record_changes(connection, company_id, entity_type, entity_ids, action):
+    """
+    Log changes written outside the ORM unit of work.
+
+    Bulk paths call this after bump_data_version, in the same transaction.
+    """
+    _insert_changes(connection, {
+        (entity_type, entity_id): (company_id, action) for entity_id in entity_ids
+    })
+
+
+def changes_since(company_id, since_id, limit):
+    """
+    A company's change log after an entry id, oldest first.
+
+    Walks the (company_id, id) index from the cursor. Several entries for
+    the same entity within the page collapse into the latest one.
+
+    Returns:
+        dict: {'entries', 'next_cursor', 'has_more'}
+    """
+    entries = ChangeLogEntry.query.filter(
+        ChangeLogEntry.company_id == company_id,
+        ChangeLogEntry.id > since_id
+    ).order_by(ChangeLogEntry.id).limit(limit + 1).all()
+
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for entry in entries:
+        key = (entry.entity_type, entry.entity_id)
+        latest.pop(key, None)
+        latest[key] = entry
+
+    return {
+        'entries': list(latest.values()),
+        'next_cursor': entries[-1].id if entries else since_id,
+        'has_more': has_more
+    }
+
+
+def latest_change_id(company_id):
+    """Id of a company's newest change log entry (0 when empty)"""
+    return db.session.execute(
+        select(func.max(ChangeLogEntry.id)).where(ChangeLogEntry.company_id == company_id)
+    ).scalar() or 0
+
+
+def bump_data_version(connection, company_ids=(), invoice_ids=()):
+    """
+    Increment data versions for companies in the current transaction.
+
+    Bulk paths that bypass the ORM unit of work (executemany inserts)
+    must call this themselves.
+
+    Args:
+        connection: Connection bound to the writing transaction
+        company_ids: Companies whose data changed
+        invoice_ids: Invoices whose lines changed (company looked up in SQL)
+    """
+    conditions = []
+    if company_ids:
+        conditions.append(Company.id.in_(list(company_ids)))
+    if invoice_ids:
+        conditions.append(Company.id.in_(
+            select(Invoice.company_id).where(Invoice.id.in_(list(invoice_ids)))
+        ))
+    if not conditions:
+        return
+
+    companies = Company.__table__
+    connection.execute(
+        companies.update().where(or_(*conditions)).values(
+            data_version=companies.c.data_version + 1
+        )
+    )
+
+
+def get_data_version(session, company_id):
+    """Current data version of a company, read fresh from the database"""
+    return session.execute(
+        select(Company.data_version).where(Company.id == company_id)
+    ).scalar() or 0
@@ -0,0 +1,328 @@
+"""
+Client Import Service
+Validates and upserts many clients from CSV files or API requests
+"""
+import csv
+import io
+import re
+from datetime import datetime
+from sqlalchemy import bindparam, func, or_, select
+
+from app import db
+from app.models import Client, normalized_code
+from app.services import webhooks
+from app.services.change_tracking import bump_data_version, record_changes
+
+# Rows matched and written per round trip
+IMPORT_BATCH_SIZE = 1000
+
+# Importable columns: field -> max length (None for unlimited)
+CLIENT_FIELDS = {
+    'name': 200,
+    'legal_name': 200,
+    'client_type': 20,
+    'company_code': 20,
+    'vat_code': 20,
+    'contact_person': 100,
+    'email': 120,
+    'phone': 20,
+    'address': 300,
+    'city': 100,
+    'postal_code': 10,
+    'country': 50,
+    'notes': None
+}
+
+# CSV header aliases (lower case) per field
+IMPORT_COLUMNS = {
+    'name': ('name', 'pavadinimas', 'klientas'),
+    'legal_name': ('legal_name', 'oficialus pavadinimas'),
+    'client_type': ('client_type', 'tipas'),
+    'company_code': ('company_code', 'įmonės kodas', 'imones kodas', 'kodas'),
+    'vat_code': ('vat_code', 'pvm kodas'),
+    'contact_person': ('contact_person', 'kontaktinis asmuo'),
+    'email': ('email', 'el. paštas', 'el. pastas'),
+    'phone': ('phone', 'telefonas'),
+    'address': ('address', 'adresas'),
+    'city': ('city', 'miestas'),
+    'postal_code': ('postal_code', 'pašto kodas', 'pasto kodas'),
+    'country': ('country', 'šalis', 'salis'),
+    'notes': ('notes', 'pastabos')
+}
+
+CLIENT_TYPES = ('company', 'individual')
+
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+def parse_csv(text):
+    """
+    Read a client CSV into raw records.
+
+    Returns:
+        list: (line number, {field: value}) for every non-empty line
+
+    Raises:
+        ValueError: If the file is empty or has no name column
+    """
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(io.StringIO(text), dialect)
+
+    header = next(reader, None)
+    if not header:
+        raise ValueError('Tuščias failas.')
+
+    normalized = [name.strip().lower() for name in header]
+    positions = {}
+    for field, aliases in IMPORT_COLUMNS.items():
+        for alias in aliases:
+            if alias in normalized:
+                positions[field] = normalized.index(alias)
+                break
+
+    if 'name' not in positions:
+        raise ValueError('Trūksta stulpelio: pavadinimas')
+
+    records = []
+    for line_number, values in enumerate(reader, start=2):
+        if not any(v.strip() for v in values):
+            continue
+        records.append((line_number, {
+            field: values[index] if index < len(values) else ''
+            for field, index in positions.items()
+        }))
+    return records
+
+
+def validate(records):
+    """
+    Normalize and validate raw records in one pass.
+
+    Codes are stripped and upper-cased so they match regardless of how
+    they were typed. Of several records with the same code only the first
+    is kept; the rest are reported.
+
+    Args:
+        records: List of (row reference, dict of field values)
+
+    Returns:
+        tuple: (list of (row reference, column values), list of (row reference, error))
+    """
+    valid, errors = [], []
+    seen_codes = {}
+
+    for ref, data in records:
+        if not isinstance(data, dict):
+            errors.append((ref, 'entry must be an object'))
+            continue
+
+        values = {}
+        error = None
+        for field, max_length in CLIENT_FIELDS.items():
+            value = data.get(field)
+            if value is None:
+                continue
+            if not isinstance(value, str):
+                value = str(value)
+            value = value.strip()
+            if not value:
+                continue
+            if max_length and len(value) > max_length:
+                error = f'{field} is longer than {max_length} characters'
+                break
+            values[field] = value
+
+        if error is None:
+            for field in ('company_code', 'vat_code'):
+                if field in values:
+                    values[field] = values[field].replace(' ', '').upper()
+            if 'name' not in values:
+                error = 'name is required'
+            elif values.get('client_type', 'company') not in CLIENT_TYPES:
+                error = 'client_type must be company or individual'
+            elif 'email' in values and not EMAIL_PATTERN.match(values['email']):
+                error = 'invalid email'
+
+        if error is None:
+            for key in _match_keys(values):
+                if key in seen_codes:
+                    error = f'duplicate {key[0]} of row {seen_codes[key]}'
+                    break
+            else:
+                for key in _match_keys(values):
+                    seen_codes[key] = ref
+
+        if error is not None:
+            errors.append((ref, error))
+        else:
+            valid.append((ref, values))
+
+    return valid, errors
+
+
+def _match_keys(values):
+    keys = []
+    if values.get('company_code'):
+        keys.append(('company_code', values['company_code']))
+    if values.get('vat_code'):
+        keys.append(('vat_code', values['vat_code']))
+    return keys
+
+
+def _existing_clients(company_id, chunk):
+    """Existing (client id, is active) keyed by (field, code) for a chunk (one IN query)"""
+    company_codes = {values['company_code'] for _, values in chunk if 'company_code' in values}
+    vat_codes = {values['vat_code'] for _, values in chunk if 'vat_code' in values}
+    if not company_codes and not vat_codes:
+        return {}
+
+    # Stored codes may have been typed with spaces or in lower case
+    company_code_match = normalized_code(Client.company_code)
+    vat_code_match = normalized_code(Client.vat_code)
+
+    conditions = []
+    if company_codes:
+        conditions.append(company_code_match.in_(company_codes))
+    if vat_codes:
+        conditions.append(vat_code_match.in_(vat_codes))
+
+    rows = db.session.execute(
+        select(Client.id, Client.is_active, company_code_match, vat_code_match).where(
+            Client.company_id == company_id,
+            or_(*conditions)
+        ).order_by(Client.id)
+    )
+
+    # With duplicate codes already in the table the oldest client wins
+    existing = {}
+    for client_id, is_active, company_code, vat_code in rows:
+        if company_code:
+            existing.setdefault(('company_code', company_code), (client_id, is_active))
+        if vat_code:
+            existing.setdefault(('vat_code', vat_code), (client_id, is_active))
+    return existing
+
+
+def upsert_clients(company_id, records, client_limit=-1):
+    """
+    Create or update clients, matching existing ones by company or VAT code.
+
+    Per chunk, existing clients are found with one IN query; new clients
+    are written with one executemany INSERT and matched ones with one
+    executemany UPDATE that only overwrites the fields the record has.
+    A record whose codes match two different clients, or that matches a
+    client an earlier record already updated, is an error. Matched inactive
+    clients are reactivated and count against client_limit.
+    The clients, their change log and the data version are committed
+    together; callers commit their activity log entry separately.
+
+    Args:
+        company_id: Company the clients belong to
+        records: List of (row reference, dict of field values), e.g. from
+                 parse_csv() or the API request body
+        client_limit: Active client limit of the plan, -1 for none
+
+    Returns:
+        list: One result dict per record, in record order: status
+              'created' or 'updated' with the client id, or 'error'
+    """
+    valid, errors = validate(records)
+    results = {ref: {'status': 'error', 'error': error} for ref, error in errors}
+
+    remaining = None
+    if client_limit != -1:
+        active = db.session.scalar(
+            select(func.count(Client.id)).where(
+                Client.company_id == company_id,
+                Client.is_active == True
+            )
+        )
+        remaining = max(client_limit - active, 0)
+
+    table = Client.__table__
+    update = table.update().where(table.c.id == bindparam('client_id')).values({
+        field: func.coalesce(bindparam(f'new_{field}'), table.c[field])
+        for field in CLIENT_FIELDS
+    }).values(is_active=True, updated_at=bindparam('now'))
+
+    created_ids, updated_ids = [], []
+    matched_by = {}  # client id -> row reference of the record that updates it
+    now = datetime.utcnow()
+
+    for start in range(0, len(valid), IMPORT_BATCH_SIZE):
+        chunk = valid[start:start + IMPORT_BATCH_SIZE]
+        existing = _existing_clients(company_id, chunk)
+
+        inserts, updates = [], []
+        for ref, values in chunk:
+            matches = {key: existing[key] for key in _match_keys(values) if key in existing}
+            client_id, is_active = next(iter(matches.values()), (None, False))
+            # New and reactivated clients both take an active client slot
+            takes_slot = remaining is not None and not is_active
+
+            if len({match[0] for match in matches.values()}) > 1:
+                results[ref] = {'status': 'error', 'error': 'codes match different clients: ' + ', '.join(
+                    f'{field} client {match[0]}' for (field, _), match in matches.items()
+                )}
+            elif client_id in matched_by:
+                results[ref] = {'status': 'error', 'error': f'same client as row {matched_by[client_id]}'}
+            elif takes_slot and remaining <= 0:
+                results[ref] = {'status': 'error', 'error': 'client limit of the plan reached'}
+            else:
+                if takes_slot:
+                    remaining -= 1
+                if client_id is None:
+                    inserts.append((ref, values))
+                else:
+                    matched_by[client_id] = ref
+                    updates.append((ref, client_id, values))
+
+        if inserts:
+            # Every row gets every column so the batch stays one executemany
+            rows = [
+                dict(
+                    {field: values.get(field) for field in CLIENT_FIELDS},
+                    company_id=company_id,
+                    client_type=values.get('client_type', 'company'),
+                    country=values.get('country', 'Lietuva'),
+                    is_active=True,
+                    created_at=now,
+                    updated_at=now
+                )
+                for _, values in inserts
+            ]
+            ids = db.session.scalars(
+                table.insert().returning(table.c.id, sort_by_parameter_order=True), rows
+            ).all()
+            for (ref, _), client_id in zip(inserts, ids):
+                results[ref] = {'status': 'created', 'id': client_id}
+            created_ids.extend(ids)
+
+        if updates:
+            db.session.execute(update, [
+                dict(
+                    {f'new_{field}': values.get(field) for field in CLIENT_FIELDS},
+                    client_id=client_id,
+                    now=now
+                )
+                for _, client_id, values in updates
+            ])
+            for ref, client_id, _ in updates:
+                results[ref] = {'status': 'updated', 'id': client_id}
+            updated_ids.extend(client_id for _, client_id, _ in updates)
+
+    if created_ids or updated_ids:
+        # executemany bypasses the ORM flush hooks
+        connection = db.session.connection()
+        bump_data_version(connection, {company_id})
+        record_changes(connection, company_id, 'client', created_ids, 'created')
+        record_changes(connection, company_id, 'client', updated_ids, 'updated')
+        webhooks.queue_events(db.session, [
+            (company_id, 'client.created', 'client', client_id) for client_id in created_ids
+        ])
+        db.session.commit()
+
+    return [results[ref] for ref, _ in records]
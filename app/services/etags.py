@@ -0,0 +1,89 @@
+"""
+ETag Service
+Conditional GET for views that opt in with a cheap validator query
+"""
+import hashlib
+from functools import wraps
+from flask import request, make_response, current_app
+from sqlalchemy import select
+
+from app import db
+from app.models import Company, Invoice
+
+
+def make_etag(*parts):
+    """Strong ETag value from the parts that determine a response"""
+    payload = '\x1f'.join(str(part) for part in parts)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def conditional(validator):
+    """
+    Answer GET requests with 304 Not Modified when the client's copy is current.
+
+    ``validator`` is called with the view's arguments and returns a tuple of
+    values that change whenever the response would (typically timestamps and
+    the company's data version), or None to skip conditional handling, e.g.
+    when the resource is missing and the view should produce the error. It
+    should be one small indexed query: on a match the view itself never runs,
+    so nothing is loaded or serialized.
+
+    The request path and query string are always part of the ETag.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return f(*args, **kwargs)
+
+            parts = validator(*args, **kwargs)
+            if parts is None:
+                return f(*args, **kwargs)
+
+            etag = make_etag(request.full_path, *parts)
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+
+        return decorated
+
+    return decorator
+
+
+def company_version(user_id):
+    """(company id, data version) of a user's company, or None"""
+    return db.session.execute(
+        select(Company.id, Company.data_version).where(Company.user_id == user_id)
+    ).first()
+
+
+def invoice_version(invoice_id, user_id):
+    """
+    (updated_at, company data version, company updated_at) of an invoice
+    owned by a user's company. The company's own timestamp covers the seller
+    details printed on the invoice, which settings edits change without a
+    data version bump.
+
+    Returns None when the invoice does not exist or belongs to another
+    company, so the view can answer with its usual error.
+    """
+    return db.session.execute(
+        select(
+            Invoice.updated_at,
+            Company.data_version,
+            Company.updated_at.label('company_updated_at')
+        ).join(
+            Company, Company.id == Invoice.company_id
+        ).where(
+            Invoice.id == invoice_id,
+            Company.user_id == user_id
+        )
+    ).first()
@@ -0,0 +1,118 @@
+"""
+Expense Rollup Service
+Keeps per-month, per-category expense totals in step with expense writes
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.models import Expense, ExpenseMonthlyRollup
+from app.services.change_tracking import bump_data_version
+from app.services.report_data import month_key
+
+
+def month_start(value):
+    """First day of the month containing a date"""
+    return date(value.year, value.month, 1)
+
+
+def new_deltas():
+    """Empty delta map: (company_id, month, category) -> [amount, vat, count]"""
+    return defaultdict(lambda: [Decimal('0'), Decimal('0'), 0])
+
+
+def add_to_deltas(deltas, company_id, expense_date, category, amount, vat_amount, sign=1):
+    """Accumulate one expense into a delta map"""
+    entry = deltas[(company_id, month_start(expense_date), category or '')]
+    entry[0] += sign * Decimal(str(amount or 0))
+    entry[1] += sign * Decimal(str(vat_amount or 0))
+    entry[2] += sign
+
+
+def expense_deltas(expense, sign=1, deltas=None):
+    """Delta map for adding (sign=1) or removing (sign=-1) an expense"""
+    if deltas is None:
+        deltas = new_deltas()
+    add_to_deltas(
+        deltas, expense.company_id, expense.expense_date, expense.category,
+        expense.amount, expense.vat_amount, sign
+    )
+    return deltas
+
+
+def apply_deltas(deltas):
+    """
+    Add deltas to the rollup rows in the current transaction.
+
+    One INSERT ... ON CONFLICT DO UPDATE per batch adds each delta to its
+    row or creates the row, so two writers that both find a month's row
+    missing cannot both insert it; the second one adds to the first one's
+    row. The caller commits.
+    """
+    deltas = {key: value for key, value in deltas.items() if any(value)}
+    if not deltas:
+        return
+
+    table = ExpenseMonthlyRollup.__table__
+    dialect_insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    insert = dialect_insert(table)
+    upsert = insert.on_conflict_do_update(
+        index_elements=['company_id', 'month', 'category'],
+        set_={
+            'amount': table.c.amount + insert.excluded.amount,
+            'vat_amount': table.c.vat_amount + insert.excluded.vat_amount,
+            'expense_count': table.c.expense_count + insert.excluded.expense_count
+        }
+    )
+
+    db.session.execute(upsert, [
+        {
+            'company_id': company_id,
+            'month': month,
+            'category': category,
+            'amount': amount,
+            'vat_amount': vat_amount,
+            'expense_count': count
+        }
+        for (company_id, month, category), (amount, vat_amount, count) in deltas.items()
+    ])
+
+
+def rebuild(company_id):
+    """
+    Recompute a company's rollup from raw expense rows (`flask rebuild-expense-rollup`).
+
+    Bumps the company's data version so cached reports built on the old
+    rollup are not served again.
+    """
+    ExpenseMonthlyRollup.query.filter_by(company_id=company_id).delete()
+
+    month = month_key(Expense.expense_date).label('month')
+    rows = db.session.query(
+        month,
+        Expense.category,
+        func.sum(Expense.amount).label('amount'),
+        func.sum(Expense.vat_amount).label('vat_amount'),
+        func.count(Expense.id).label('expense_count')
+    ).filter(
+        Expense.company_id == company_id
+    ).group_by(month, Expense.category).all()
+
+    deltas = new_deltas()
+    for row in rows:
+        entry = deltas[(
+            company_id,
+            datetime.strptime(row.month, '%Y-%m').date(),
+            row.category or ''
+        )]
+        entry[0] += Decimal(str(row.amount or 0))
+        entry[1] += Decimal(str(row.vat_amount or 0))
+        entry[2] += row.expense_count
+
+    db.session.flush()
+    apply_deltas(deltas)
+    bump_data_version(db.session.connection(), {company_id})
+    db.session.commit()
@@ -0,0 +1,253 @@
+"""
+Export Service
+Streaming row sources and CSV/NDJSON writers for invoice and VAT exports
+"""
+import csv
+import io
+from sqlalchemy import select
+
+from app import db
+from app.models import Invoice, InvoiceItem, Client
+from app.services import api_serializers
+from app.services.report_data import VAT_REPORTABLE_STATUSES
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+# Flush the CSV buffer to the client once it grows past this size
+CSV_CHUNK_SIZE = 64 * 1024
+
+# Same for NDJSON API exports
+NDJSON_CHUNK_SIZE = 64 * 1024
+
+INVOICE_EXPORT_HEADER = [
+    'Sąskaitos Nr.', 'Data', 'Terminas', 'Klientas',
+    'Suma be PVM', 'PVM', 'Viso', 'Būsena', 'Apmokėta'
+]
+
+VAT_EXPORT_HEADER = [
+    'Dokumento tipas', 'Dokumento numeris', 'Dokumento data',
+    'Pirkėjo kodas', 'Pirkėjo PVM kodas', 'Pirkėjo pavadinimas',
+    'Apmokestinama vertė', 'PVM suma', 'PVM tarifas'
+]
+
+CLIENT_EXPORT_HEADER = [
+    'Klientas', 'Įmonės kodas', 'El. paštas', 'Sąskaitų',
+    'Išrašyta', 'Apmokėta', 'Neapmokėta'
+]
+
+
+def invoice_export_query(company_id, date_from=None, date_to=None):
+    """
+    Build the invoice export query with the client joined in.
+
+    Selects plain columns rather than entities so streamed rows are not
+    kept in the session identity map.
+    """
+    query = select(
+        Invoice.invoice_number,
+        Invoice.invoice_date,
+        Invoice.due_date,
+        Client.name.label('client_name'),
+        Invoice.subtotal,
+        Invoice.vat_amount,
+        Invoice.total,
+        Invoice.status,
+        Invoice.paid_date
+    ).join(
+        Client, Invoice.client_id == Client.id
+    ).where(
+        Invoice.company_id == company_id
+    )
+
+    if date_from:
+        query = query.where(Invoice.invoice_date >= date_from)
+    if date_to:
+        query = query.where(Invoice.invoice_date <= date_to)
+
+    return query.order_by(Invoice.invoice_date, Invoice.id)
+
+
+def invoice_document_query(company_id, after_id=None, date_from=None, date_to=None, status=None):
+    """
+    Build the NDJSON export query: invoices with their lines and client.
+
+    One row per invoice line (one row for an invoice without lines),
+    ordered by invoice id so rows of an invoice are adjacent and a broken
+    download can resume with ``after_id``. Client columns are labelled
+    ``c_<name>`` and line columns ``item_<name>``.
+    """
+    client_columns = [
+        getattr(Client, name).label(f'c_{name}') for name in api_serializers.CLIENT_SPEC
+    ]
+    item_columns = [
+        getattr(InvoiceItem, name).label(f'item_{name}') for name in api_serializers.INVOICE_ITEM_SPEC
+    ]
+    invoice_columns = [
+        getattr(Invoice, path) for path, _ in api_serializers.INVOICE_SPEC.values() if '.' not in path
+    ]
+
+    query = select(*invoice_columns, *client_columns, *item_columns).join(
+        Client, Invoice.client_id == Client.id
+    ).outerjoin(
+        InvoiceItem, InvoiceItem.invoice_id == Invoice.id
+    ).where(
+        Invoice.company_id == company_id
+    )
+
+    if after_id:
+        query = query.where(Invoice.id > after_id)
+    if date_from:
+        query = query.where(Invoice.invoice_date >= date_from)
+    if date_to:
+        query = query.where(Invoice.invoice_date <= date_to)
+    if status:
+        query = query.where(Invoice.status == status)
+
+    return query.order_by(Invoice.id, InvoiceItem.position, InvoiceItem.id)
+
+
+def invoice_documents(rows):
+    """Group invoice document rows into one dict per invoice with client and items"""
+    invoice_fields = tuple(
+        name for name, (path, _) in api_serializers.INVOICE_SPEC.items() if '.' not in path
+    )
+    serialize_invoice = api_serializers.serializer_for('invoice', invoice_fields)
+    serialize_client = api_serializers.serializer_for('client', prefix='c_')
+    serialize_item = api_serializers.serializer_for('invoice_item', prefix='item_')
+
+    document = None
+    for row in rows:
+        if document is None or row.id != document['id']:
+            if document is not None:
+                yield document
+            document = serialize_invoice(row)
+            document['client'] = serialize_client(row)
+            document['items'] = []
+        if row.item_id is not None:
+            document['items'].append(serialize_item(row))
+
+    if document is not None:
+        yield document
+
+
+def vat_export_query(company_id, period_start, period_end):
+    """Build the VAT export query: one row per invoice line, client joined in"""
+    return select(
+        Invoice.invoice_number,
+        Invoice.invoice_date,
+        Client.company_code,
+        Client.vat_code,
+        Client.name.label('client_name'),
+        InvoiceItem.line_total,
+        InvoiceItem.vat_amount,
+        InvoiceItem.vat_rate
+    ).select_from(InvoiceItem).join(
+        Invoice, InvoiceItem.invoice_id == Invoice.id
+    ).join(
+        Client, Invoice.client_id == Client.id
+    ).where(
+        Invoice.company_id == company_id,
+        Invoice.invoice_date >= period_start,
+        Invoice.invoice_date <= period_end,
+        Invoice.status.in_(VAT_REPORTABLE_STATUSES)
+    ).order_by(
+        Invoice.invoice_date, Invoice.id, InvoiceItem.position, InvoiceItem.id
+    )
+
+
+def stream_rows(query, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Execute a query over a server-side cursor and yield rows.
+
+    Rows are fetched in batches of ``batch_size`` so memory stays flat
+    regardless of the result size.
+    """
+    result = db.session.execute(
+        query.execution_options(yield_per=batch_size)
+    )
+    try:
+        for row in result:
+            yield row
+    finally:
+        result.close()
+
+
+def format_date(value):
+    """Format a date for export files"""
+    return value.strftime('%Y-%m-%d') if value else ''
+
+
+def format_invoice_row(row):
+    """Convert an invoice export row to CSV values"""
+    return [
+        row.invoice_number,
+        format_date(row.invoice_date),
+        format_date(row.due_date),
+        row.client_name,
+        float(row.subtotal or 0),
+        float(row.vat_amount or 0),
+        float(row.total or 0),
+        row.status,
+        format_date(row.paid_date)
+    ]
+
+
+def format_vat_row(row):
+    """Convert a VAT export row to CSV values"""
+    return [
+        'SF',  # Sąskaita faktūra
+        row.invoice_number,
+        format_date(row.invoice_date),
+        row.company_code or '',
+        row.vat_code or '',
+        row.client_name,
+        float(row.line_total or 0),
+        float(row.vat_amount or 0),
+        row.vat_rate
+    ]
+
+
+def format_client_row(row):
+    """Convert a client report row to CSV values"""
+    return [
+        row.name,
+        row.company_code or '',
+        row.email or '',
+        row.invoice_count,
+        float(row.total_invoiced or 0),
+        float(row.total_paid or 0),
+        float(row.outstanding or 0)
+    ]
+
+
+def generate_csv(header, rows, formatter, delimiter=','):
+    """
+    Yield a CSV document chunk by chunk.
+
+    The header (with a UTF-8 BOM so Excel detects the encoding) is sent
+    immediately; data rows are buffered up to ``CSV_CHUNK_SIZE``.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter)
+
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    yield _drain(buffer)
+
+    for row in rows:
+        writer.writerow(formatter(row))
+        if buffer.tell() >= CSV_CHUNK_SIZE:
+            yield _drain(buffer)
+
+    remaining = _drain(buffer)
+    if remaining:
+        yield remaining
+
+
+def _drain(buffer):
+    """Return buffered text and reset the buffer"""
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return value
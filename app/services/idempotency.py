@@ -0,0 +1,157 @@
+"""
+Idempotency Service
+Stored outcomes of API requests retried with the same Idempotency-Key
+"""
+import hashlib
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+
+# Seconds between checks while a duplicate waits for the first request
+WAIT_INTERVAL = 0.1
+
+StoredResponse = namedtuple('StoredResponse', ['status', 'body', 'mimetype'])
+
+
+class IdempotencyConflict(Exception):
+    """A key that cannot be used for this request (right now)"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def fingerprint(method, path, body):
+    """SHA-256 identifying a request, so a key reused for another request is refused"""
+    digest = hashlib.sha256(f'{method} {path}\n'.encode('utf-8'))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def begin(user_id, key, request_fingerprint):
+    """
+    Reserve a key for a request, or get the response of the request that used it.
+
+    Reservations are committed on their own connection straight away, so a
+    concurrent duplicate sees them and waits for the first request to
+    finish instead of doing the work a second time.
+
+    Returns:
+        StoredResponse to replay, or None if the caller should process the
+        request (and then call complete() or release())
+
+    Raises:
+        IdempotencyConflict: If the key was used for a different request
+            (422) or the first request is still running after the wait (409)
+    """
+    deadline = time.monotonic() + current_app.config['IDEMPOTENCY_WAIT_TIMEOUT']
+
+    while True:
+        if _reserve(user_id, key, request_fingerprint):
+            return None
+
+        row = _load(user_id, key)
+        if row is not None:
+            if row.fingerprint != request_fingerprint:
+                raise IdempotencyConflict('Idempotency-Key was already used for a different request', 422)
+            if row.status == 'completed':
+                return StoredResponse(row.response_status, row.response_body, row.response_mimetype)
+        if time.monotonic() >= deadline:
+            raise IdempotencyConflict('A request with this Idempotency-Key is still in progress', 409)
+        if row is not None:
+            time.sleep(WAIT_INTERVAL)
+        # Without a row the key was released or expired meanwhile; reserve again
+
+
+def complete(user_id, key, response):
+    """Store a finished request's response for replay until the key expires"""
+    table = IdempotencyKey.__table__
+    expires_at = datetime.utcnow() + timedelta(seconds=current_app.config['IDEMPOTENCY_KEY_TTL'])
+    with db.engine.begin() as connection:
+        connection.execute(
+            table.update().where(
+                table.c.user_id == user_id,
+                table.c.key == key
+            ).values(
+                status='completed',
+                response_status=response.status_code,
+                response_body=response.get_data(),
+                response_mimetype=response.mimetype,
+                expires_at=expires_at
+            )
+        )
+
+
+def release(user_id, key):
+    """Drop a reservation so a retry runs the request again (after failures)"""
+    table = IdempotencyKey.__table__
+    with db.engine.begin() as connection:
+        connection.execute(
+            table.delete().where(table.c.user_id == user_id, table.c.key == key)
+        )
+
+
+def purge_expired(now=None):
+    """Delete expired keys, returning how many were removed"""
+    table = IdempotencyKey.__table__
+    with db.engine.begin() as connection:
+        result = connection.execute(
+            table.delete().where(table.c.expires_at <= (now or datetime.utcnow()))
+        )
+    return result.rowcount
+
+
+def _reserve(user_id, key, request_fingerprint):
+    """Insert a processing row for the key; False if one exists and has not expired"""
+    table = IdempotencyKey.__table__
+    now = datetime.utcnow()
+    try:
+        with db.engine.begin() as connection:
+            # A stale lease (crashed worker) or an expired response frees the key
+            connection.execute(
+                table.delete().where(
+                    table.c.user_id == user_id,
+                    table.c.key == key,
+                    table.c.expires_at <= now
+                )
+            )
+            connection.execute(
+                table.insert().values(
+                    user_id=user_id,
+                    key=key,
+                    fingerprint=request_fingerprint,
+                    status='processing',
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=current_app.config['IDEMPOTENCY_LOCK_TIMEOUT'])
+                )
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def _load(user_id, key):
+    table = IdempotencyKey.__table__
+    with db.engine.connect() as connection:
+        return connection.execute(
+            select(
+                table.c.fingerprint,
+                table.c.status,
+                table.c.response_status,
+                table.c.response_body,
+                table.c.response_mimetype
+            ).where(
+                table.c.user_id == user_id,
+                table.c.key == key,
+                table.c.expires_at > datetime.utcnow()
+            )
+        ).first()
@@ -0,0 +1,238 @@
+"""
+i.SAF Export Service
+Streams the VMI i.SAF sales invoice register as XML
+"""
+from datetime import datetime
+from itertools import groupby
+from xml.sax.saxutils import escape
+from flask import current_app
+from sqlalchemy import select, func
+
+from app import db
+from app.models import Invoice, InvoiceItem, Client
+from app.services.exports import stream_rows, format_date
+from app.services.report_data import VAT_REPORTABLE_STATUSES, to_money
+
+ISAF_NAMESPACE = 'http://www.vmi.lt/cms/imas/isaf'
+ISAF_FILE_VERSION = 'iSAF1.2'
+
+# Placeholder VMI expects when the buyer has no VAT code
+NO_VAT_CODE = 'ND'
+
+# Country names stored on clients mapped to ISO 3166 codes
+COUNTRY_CODES = {
+    'lietuva': 'LT',
+    'lithuania': 'LT',
+    'latvija': 'LV',
+    'latvia': 'LV',
+    'estija': 'EE',
+    'estonia': 'EE',
+    'lenkija': 'PL',
+    'poland': 'PL',
+    'vokietija': 'DE',
+    'germany': 'DE'
+}
+
+
+def isaf_sales_query(company_id, period_start, period_end):
+    """
+    Per-invoice, per-VAT-rate totals for the sales register.
+
+    One row per (invoice, rate), ordered so rows of the same invoice are
+    adjacent and can be grouped while streaming.
+    """
+    return select(
+        Invoice.id,
+        Invoice.invoice_number,
+        Invoice.invoice_date,
+        Client.id.label('client_id'),
+        Client.name.label('client_name'),
+        Client.company_code,
+        Client.vat_code,
+        Client.country,
+        InvoiceItem.vat_rate,
+        func.sum(InvoiceItem.line_total).label('taxable_value'),
+        func.sum(InvoiceItem.vat_amount).label('vat_amount')
+    ).select_from(InvoiceItem).join(
+        Invoice, InvoiceItem.invoice_id == Invoice.id
+    ).join(
+        Client, Invoice.client_id == Client.id
+    ).where(
+        Invoice.company_id == company_id,
+        Invoice.invoice_date >= period_start,
+        Invoice.invoice_date <= period_end,
+        Invoice.status.in_(VAT_REPORTABLE_STATUSES)
+    ).group_by(
+        Invoice.id, Client.id, InvoiceItem.vat_rate
+    ).order_by(
+        Invoice.invoice_date, Invoice.id, InvoiceItem.vat_rate.desc()
+    )
+
+
+def unmapped_vat_rates(company_id, period_start, period_end):
+    """VAT rates in the period's register that have no i.SAF tax code (one DISTINCT query)"""
+    register = isaf_sales_query(company_id, period_start, period_end).subquery()
+    rates = db.session.scalars(select(register.c.vat_rate).distinct())
+    tax_codes = current_app.config['ISAF_TAX_CODES']
+    return sorted(rate for rate in rates if rate not in tax_codes)
+
+
+def unmapped_countries(company_id, period_start, period_end):
+    """Client countries in the period's register that have no ISO code (one DISTINCT query)"""
+    register = isaf_sales_query(company_id, period_start, period_end).subquery()
+    countries = db.session.scalars(select(register.c.country).distinct())
+    return sorted(country or '' for country in countries if country_code(country) is None)
+
+
+def check_tax_codes(company_id, period_start, period_end):
+    """
+    Make sure every VAT rate and client country of the period maps to a code before exporting.
+
+    Raises:
+        ValueError: If some rates or countries have no code; the export would be rejected by VMI
+    """
+    rates = unmapped_vat_rates(company_id, period_start, period_end)
+    if rates:
+        raise ValueError(f'No i.SAF tax code for VAT rate(s): {", ".join(f"{rate}%" for rate in rates)}')
+
+    countries = unmapped_countries(company_id, period_start, period_end)
+    if countries:
+        raise ValueError(f'No country code for client country(ies): {", ".join(c or "(empty)" for c in countries)}')
+
+
+def generate_isaf_xml(company, period_start, period_end):
+    """
+    Yield the i.SAF XML document one invoice at a time.
+
+    The document is written element by element from a streaming query;
+    neither the rows nor an element tree are held in memory.
+
+    Args:
+        company: Company model instance (issuer of the invoices)
+        period_start: First day of the reporting period
+        period_end: Last day of the reporting period
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f'<iSAFFile xmlns="{ISAF_NAMESPACE}">\n'
+    yield _header(company, period_start, period_end)
+    yield '<SourceDocuments>\n<SalesInvoices>\n'
+
+    rows = stream_rows(isaf_sales_query(company.id, period_start, period_end))
+    for _, invoice_rows in groupby(rows, key=lambda row: row.id):
+        yield _invoice(list(invoice_rows))
+
+    yield '</SalesInvoices>\n</SourceDocuments>\n</iSAFFile>\n'
+
+
+def _header(company, period_start, period_end):
+    """Render the Header element"""
+    return (
+        '<Header>'
+        '<FileDescription>'
+        + _element('FileVersion', ISAF_FILE_VERSION)
+        + _element('FileDateCreated', datetime.now().strftime('%Y-%m-%dT%H:%M:%S'))
+        + _element('DataType', 'S')
+        + _element('SoftwareCompanyName', current_app.config['COMPANY_NAME'])
+        + _element('SoftwareName', current_app.config['COMPANY_NAME'])
+        + _element('SoftwareVersion', '1.0')
+        + _element('RegistrationNumber', company.company_code)
+        + _element('NumberOfParts', 1)
+        + _element('PartNumber', 1)
+        + '<SelectionCriteria>'
+        + _element('SelectionStartDate', format_date(period_start))
+        + _element('SelectionEndDate', format_date(period_end))
+        + '</SelectionCriteria>'
+        '</FileDescription>'
+        '</Header>\n'
+    )
+
+
+def _invoice(rows):
+    """Render one Invoice element from its per-rate rows"""
+    first = rows[0]
+    invoice_date = format_date(first.invoice_date)
+
+    parts = [
+        '<Invoice>',
+        _element('InvoiceNo', first.invoice_number),
+        '<CustomerInfo>',
+        _element('CustomerID', first.client_id),
+        _element('VATRegistrationNumber', first.vat_code or NO_VAT_CODE),
+        _element('RegistrationNumber', first.company_code),
+        _element('Country', country_code(first.country)),
+        _element('Name', first.client_name),
+        '</CustomerInfo>',
+        _element('InvoiceDate', invoice_date),
+        _element('InvoiceType', 'SF'),
+        _element('SpecialTaxation', None),
+        _element('References', None),
+        _element('VATPointDate', invoice_date),
+        '<DocumentTotals>'
+    ]
+
+    for row in rows:
+        parts.extend([
+            '<DocumentTotal>',
+            _element('TaxableValue', to_money(row.taxable_value)),
+            _element('TaxCode', tax_code(row.vat_rate)),
+            _element('TaxPercentage', row.vat_rate),
+            _element('Amount', to_money(row.vat_amount)),
+            _element('VATPointDate2', None),
+            '</DocumentTotal>'
+        ])
+
+    parts.append('</DocumentTotals></Invoice>\n')
+    return ''.join(parts)
+
+
+def _element(name, value):
+    """Render a simple text element, empty when value is None"""
+    if value is None or value == '':
+        return f'<{name}/>'
+    return f'<{name}>{escape(str(value))}</{name}>'
+
+
+def tax_code(vat_rate):
+    """
+    VMI PVM classifier code for a VAT rate.
+
+    Raises:
+        ValueError: If the rate has no code (never written as an empty TaxCode)
+    """
+    try:
+        return current_app.config['ISAF_TAX_CODES'][vat_rate]
+    except KeyError:
+        raise ValueError(f'No i.SAF tax code for VAT rate {vat_rate}%')
+
+
+def validate_isaf_xml(source, xsd_path=None):
+    """
+    Validate a generated i.SAF file against the VMI XSD.
+
+    Args:
+        source: Path or binary file object of the XML document
+        xsd_path: Schema file, ISAF_XSD_PATH by default
+
+    Returns:
+        list: Validation errors as "line N: message", empty when valid
+    """
+    from lxml import etree
+
+    schema = etree.XMLSchema(etree.parse(xsd_path or current_app.config['ISAF_XSD_PATH']))
+    try:
+        document = etree.parse(source)
+    except etree.XMLSyntaxError as e:
+        return [f'line {e.lineno}: {e.msg}']
+
+    if schema.validate(document):
+        return []
+    return [f'line {error.line}: {error.message}' for error in schema.error_log]
+
+
+def country_code(country):
+    """ISO country code for a stored country name, None if unknown"""
+    if not country:
+        return None
+    if len(country) == 2:
+        return country.upper()
+    return COUNTRY_CODES.get(country.strip().lower())
@@ -0,0 +1,86 @@
+"""
+Pagination Service
+Opaque keyset cursors ordered by (created_at, id)
+"""
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import func, select, tuple_
+
+from app import db
+
+
+def encode_cursor(created_at, record_id):
+    """Opaque cursor pointing just past a row"""
+    payload = json.dumps([created_at.isoformat(), record_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor into (created_at, id).
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, record_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(record_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def keyset_page(query, model, limit, cursor=None, descending=True, with_total=False):
+    """
+    One page of a query in (created_at, id) order.
+
+    Instead of OFFSET, the page starts strictly after the cursor row using a
+    row-value comparison that the (company_id, created_at, id) indexes
+    satisfy directly, so every page costs the same however deep the walk
+    goes. One extra row is fetched to tell whether another page follows.
+    COUNT(*) only runs when ``with_total`` is set.
+
+    Args:
+        query: Filtered ORM query for ``model``
+        model: Mapped class with created_at and id columns
+        limit: Page size
+        cursor: Cursor from the previous page, or None for the first page
+        descending: Newest first when True
+        with_total: Also count all rows matching the query
+
+    Returns:
+        dict: {'items', 'next_cursor', 'has_more'} plus 'total' when requested
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    key = tuple_(model.created_at, model.id)
+    total = None
+
+    if with_total:
+        total = db.session.execute(
+            select(func.count()).select_from(query.order_by(None).subquery())
+        ).scalar()
+
+    if cursor:
+        position = decode_cursor(cursor)
+        query = query.filter(key < position if descending else key > position)
+
+    if descending:
+        query = query.order_by(model.created_at.desc(), model.id.desc())
+    else:
+        query = query.order_by(model.created_at.asc(), model.id.asc())
+
+    items = query.limit(limit + 1).all()
+    has_more = len(items) > limit
+    items = items[:limit]
+
+    page = {
+        'items': items,
+        'next_cursor': encode_cursor(items[-1].created_at, items[-1].id) if has_more else None,
+        'has_more': has_more
+    }
+    if with_total:
+        page['total'] = total
+    return page
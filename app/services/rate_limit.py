@@ -0,0 +1,225 @@
+"""
+Rate Limit Service
+Token buckets per API principal and endpoint class
+"""
+import logging
+import math
+import threading
+import time
+from collections import Counter, namedtuple
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'limit', 'remaining', 'reset', 'retry_after'])
+
+
+class MemoryBackend:
+    """
+    Buckets in this process's memory.
+
+    Each worker process limits on its own, so with N workers a caller gets
+    up to N times the configured rate. Use the redis backend there.
+    """
+
+    max_buckets = 50000
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, monotonic time of last update)
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity, endpoint_class):
+        """
+        Refill a bucket for the time elapsed and take one token if available.
+
+        Returns:
+            tuple: (allowed, tokens left)
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._counters[(endpoint_class, 'allowed' if allowed else 'limited')] += 1
+
+            if len(self._buckets) > self.max_buckets:
+                self._prune(now)
+
+        return allowed, tokens
+
+    def _prune(self, now):
+        """Drop buckets idle for an hour; they have long refilled, same as no bucket"""
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if now - updated > 3600:
+                del self._buckets[key]
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+            self._counters.clear()
+
+
+# Refill, take and count in one round trip; the redis clock keeps workers consistent
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+redis.call('HINCRBY', KEYS[2], ARGV[3] .. (allowed == 1 and ':allowed' or ':limited'), 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBackend:
+    """Buckets shared by all workers through redis"""
+
+    key_prefix = 'ratelimit:'
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError('The redis package is required for API_RATE_LIMIT_STORAGE=redis://')
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, rate, capacity, endpoint_class):
+        allowed, tokens = self._take(
+            keys=[self.key_prefix + key, self.key_prefix + 'counters'],
+            args=[rate, capacity, endpoint_class]
+        )
+        return bool(allowed), float(tokens)
+
+    def counters(self):
+        raw = self._client.hgetall(self.key_prefix + 'counters')
+        return {
+            tuple(field.decode().split(':', 1)): int(value)
+            for field, value in raw.items()
+        }
+
+    def reset(self):
+        for key in self._client.scan_iter(self.key_prefix + '*'):
+            self._client.delete(key)
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter keyed by caller and endpoint class.
+
+    Every class has a refill rate (requests per second) and a burst size
+    (bucket capacity). A caller may burst up to the capacity and then
+    continues at the refill rate.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.limits = {}  # endpoint class -> (rate, capacity)
+        self.backend = MemoryBackend()
+        self._errors = 0
+
+    def configure(self, limits, storage='memory://', enabled=True):
+        self.enabled = enabled
+        self.limits = dict(limits)
+        if storage.startswith('redis://') or storage.startswith('rediss://'):
+            self.backend = RedisBackend(storage)
+        else:
+            self.backend = MemoryBackend()
+
+    def hit(self, caller, endpoint_class):
+        """
+        Count one request of a caller against an endpoint class.
+
+        Returns:
+            RateLimitResult or None when limiting is off for the class
+        """
+        if not self.enabled or endpoint_class not in self.limits:
+            return None
+
+        rate, capacity = self.limits[endpoint_class]
+        try:
+            allowed, tokens = self.backend.take(f'{caller}:{endpoint_class}', rate, capacity, endpoint_class)
+        except Exception:
+            # A broken shared store should not take the API down with it
+            self._errors += 1
+            logger.exception('Rate limit backend failed, allowing request')
+            return None
+
+        return RateLimitResult(
+            allowed=allowed,
+            limit=capacity,
+            remaining=int(tokens),
+            reset=math.ceil((capacity - tokens) / rate),
+            retry_after=0 if allowed else math.ceil((1 - tokens) / rate)
+        )
+
+    def metrics(self):
+        """Counters as {(endpoint class, outcome): count}, plus backend errors"""
+        counters = self.backend.counters()
+        counters[('backend', 'errors')] = self._errors
+        return counters
+
+
+limiter = RateLimiter()
+
+
+def init_app(app):
+    """Configure the shared limiter from app config"""
+    limiter.configure(
+        app.config['API_RATE_LIMITS'],
+        storage=app.config['API_RATE_LIMIT_STORAGE'],
+        enabled=app.config['API_RATE_LIMIT_ENABLED']
+    )
+
+
+def apply_headers(response, result):
+    """Add RateLimit-* headers (and Retry-After when limited) to a response"""
+    response.headers['RateLimit-Limit'] = str(result.limit)
+    response.headers['RateLimit-Remaining'] = str(result.remaining)
+    response.headers['RateLimit-Reset'] = str(result.reset)
+    if not result.allowed:
+        response.headers['Retry-After'] = str(result.retry_after)
+    return response
+
+
+def prometheus_text(counters):
+    """Render counters in the Prometheus text exposition format"""
+    lines = [
+        '# HELP api_rate_limit_requests_total API requests checked by the rate limiter',
+        '# TYPE api_rate_limit_requests_total counter'
+    ]
+    for (endpoint_class, outcome), value in sorted(counters.items()):
+        if endpoint_class == 'backend':
+            continue
+        lines.append(
+            f'api_rate_limit_requests_total{{class="{endpoint_class}",outcome="{outcome}"}} {value}'
+        )
+    lines += [
+        '# HELP api_rate_limit_backend_errors_total Rate limit checks skipped because the backend failed',
+        '# TYPE api_rate_limit_backend_errors_total counter',
+        f"api_rate_limit_backend_errors_total {counters.get(('backend', 'errors'), 0)}"
+    ]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,119 @@
+"""
+Report Cache Service
+In-process cache of report results keyed on parameters and data version
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from app import db
+from app.services.change_tracking import get_data_version
+
+
+class ReportCache:
+    """
+    Size-bounded LRU cache with per-entry TTL.
+
+    Entries stored with ``ttl=None`` never expire and only leave the cache
+    through LRU eviction.
+    """
+
+    def __init__(self, max_entries=256, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return a cached value or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=0):
+        """
+        Store a value.
+
+        Args:
+            ttl: Seconds to keep the entry; 0 uses the default TTL,
+                 None keeps it until evicted
+        """
+        if ttl == 0:
+            ttl = self.default_ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+report_cache = ReportCache()
+
+
+def init_app(app):
+    """Configure the shared cache from app config"""
+    report_cache.max_entries = app.config['REPORT_CACHE_MAX_ENTRIES']
+    report_cache.default_ttl = app.config['REPORT_CACHE_TTL']
+
+
+def normalize_params(params):
+    """Turn report parameters into a hashable, order-independent key"""
+    return tuple(sorted((name, str(value)) for name, value in params.items()))
+
+
+def is_period_locked(company, period_end):
+    """Check whether a period is closed by the company's books lock date"""
+    return company.is_date_locked(period_end)
+
+
+def cached_report(company, report, params, compute, period_end=None):
+    """
+    Return a report result from the cache, computing it on a miss.
+
+    Results are keyed on the company data version, so any write to the
+    company's data makes them unreachable. Results for periods closed by
+    ``Company.books_locked_until`` are also keyed on the lock date and
+    cached without a TTL: writes into a closed period are refused, so
+    their key only changes when the lock moves or data is changed anyway
+    (bulk paths, CLI commands).
+
+    Args:
+        company: Company model instance
+        report: Report name
+        params: Dict of parameters that determine the result
+        compute: Zero-argument callable producing the result
+        period_end: Last day covered by the report, if period-based
+    """
+    key_params = normalize_params(params)
+    data_version = get_data_version(db.session, company.id)
+
+    if is_period_locked(company, period_end):
+        key = (company.id, report, key_params, 'locked', company.books_locked_until, data_version)
+        ttl = None
+    else:
+        key = (company.id, report, key_params, data_version)
+        ttl = 0
+
+    result = report_cache.get(key)
+    if result is None:
+        result = compute()
+        report_cache.set(key, result, ttl)
+    return result
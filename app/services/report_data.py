@@ -0,0 +1,410 @@
+"""
+Report Data Service
+SQL aggregates behind the financial and VMI reports
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from sqlalchemy import select, func, and_, or_
+
+from app import db
+from app.models import Invoice, InvoiceItem, Client, Expense, ExpenseMonthlyRollup
+
+CENT = Decimal('0.01')
+
+# Invoice statuses that count towards the PVM declaration
+VAT_REPORTABLE_STATUSES = ['sent', 'paid', 'overdue']
+
+# Invoice statuses that are still awaiting payment
+OPEN_STATUSES = ['sent', 'overdue']
+
+# Receivables aging buckets: (key, label, min days overdue, max days overdue)
+AGING_BUCKETS = [
+    ('current', 'Terminas nesuėjęs', None, 0),
+    ('days_1_30', '1–30 d.', 1, 30),
+    ('days_31_60', '31–60 d.', 31, 60),
+    ('days_61_90', '61–90 d.', 61, 90),
+    ('days_over_90', '90+ d.', 91, None)
+]
+
+
+def to_money(value):
+    """Round an aggregate to cents as an exact Decimal"""
+    if value is None:
+        return Decimal('0.00')
+    return Decimal(str(value)).quantize(CENT)
+
+
+def month_range(year, month):
+    """Return the first and last day of a calendar month"""
+    month_start = date(year, month, 1)
+    if month == 12:
+        month_end = date(year, 12, 31)
+    else:
+        month_end = date(year, month + 1, 1) - timedelta(days=1)
+    return month_start, month_end
+
+
+def quarter_range(year, quarter):
+    """Return the first and last day of a calendar quarter"""
+    quarter_start = date(year, (quarter - 1) * 3 + 1, 1)
+    if quarter == 4:
+        quarter_end = date(year, 12, 31)
+    else:
+        quarter_end = date(year, quarter * 3 + 1, 1) - timedelta(days=1)
+    return quarter_start, quarter_end
+
+
+def vat_breakdown(company_id, period_start, period_end):
+    """
+    Taxable base and VAT per rate for a period.
+
+    Computed with a single GROUP BY over invoice lines joined to their
+    invoices, so no invoice or line is loaded into Python.
+
+    Returns:
+        dict: {vat_rate: {'base': Decimal, 'vat': Decimal, 'lines': int}}
+    """
+    rows = db.session.query(
+        InvoiceItem.vat_rate,
+        func.sum(InvoiceItem.line_total).label('base'),
+        func.sum(InvoiceItem.vat_amount).label('vat'),
+        func.count(InvoiceItem.id).label('lines')
+    ).join(
+        Invoice, InvoiceItem.invoice_id == Invoice.id
+    ).filter(
+        Invoice.company_id == company_id,
+        Invoice.invoice_date >= period_start,
+        Invoice.invoice_date <= period_end,
+        Invoice.status.in_(VAT_REPORTABLE_STATUSES)
+    ).group_by(
+        InvoiceItem.vat_rate
+    ).order_by(
+        InvoiceItem.vat_rate.desc()
+    ).all()
+
+    return {
+        row.vat_rate: {
+            'base': to_money(row.base),
+            'vat': to_money(row.vat),
+            'lines': row.lines
+        }
+        for row in rows
+    }
+
+
+def vat_invoices_query(company, period_start, period_end):
+    """Invoices included in the PVM report, for paginated detail listing"""
+    return company.invoices.filter(
+        Invoice.invoice_date >= period_start,
+        Invoice.invoice_date <= period_end,
+        Invoice.status.in_(VAT_REPORTABLE_STATUSES)
+    ).order_by(Invoice.invoice_date, Invoice.id)
+
+
+def month_key(column):
+    """SQL expression formatting a date column as 'YYYY-MM' for GROUP BY"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.to_char(func.date_trunc('month', column), 'YYYY-MM')
+    return func.strftime('%Y-%m', column)
+
+
+def paid_invoices_filter(company_id, date_from, date_to):
+    """Filter criteria for paid invoices in a payment date range"""
+    return (
+        Invoice.company_id == company_id,
+        Invoice.status == 'paid',
+        Invoice.paid_date >= date_from,
+        Invoice.paid_date <= date_to
+    )
+
+
+def revenue_summary(company_id, date_from, date_to):
+    """
+    Totals, monthly breakdown and top clients for paid invoices in a range.
+
+    Everything is aggregated in the database (three GROUP BY queries), so
+    the cost does not grow with the number of invoices loaded into Python.
+    Returns plain values only, so the result can be cached.
+    """
+    criteria = paid_invoices_filter(company_id, date_from, date_to)
+
+    # Totals
+    totals = db.session.query(
+        func.sum(Invoice.total).label('revenue'),
+        func.sum(Invoice.vat_amount).label('vat'),
+        func.sum(Invoice.subtotal).label('net'),
+        func.count(Invoice.id).label('count')
+    ).filter(*criteria).one()
+
+    # Monthly breakdown
+    month = month_key(Invoice.paid_date).label('month')
+    monthly_rows = db.session.query(
+        month,
+        func.sum(Invoice.total).label('revenue'),
+        func.sum(Invoice.vat_amount).label('vat'),
+        func.count(Invoice.id).label('count')
+    ).filter(*criteria).group_by(month).order_by(month).all()
+
+    monthly_data = {
+        row.month: {
+            'revenue': to_money(row.revenue),
+            'vat': to_money(row.vat),
+            'count': row.count
+        }
+        for row in monthly_rows
+    }
+
+    # Top clients by revenue
+    client_revenue = db.session.query(
+        Client.id,
+        Client.name,
+        func.sum(Invoice.total).label('total')
+    ).join(Invoice).filter(*criteria).group_by(Client.id, Client.name).order_by(
+        func.sum(Invoice.total).desc()
+    ).limit(10).all()
+
+    return {
+        'total_revenue': to_money(totals.revenue),
+        'total_vat': to_money(totals.vat),
+        'total_net': to_money(totals.net),
+        'invoice_count': totals.count,
+        'monthly_data': monthly_data,
+        'client_revenue': client_revenue
+    }
+
+
+def paid_invoices_query(company, date_from, date_to):
+    """Paid invoices in a range, for paginated detail listing"""
+    return company.invoices.filter(
+        *paid_invoices_filter(company.id, date_from, date_to)
+    ).order_by(Invoice.paid_date, Invoice.id)
+
+
+def clients_summary_query(company_id):
+    """Invoice count, invoiced, paid and outstanding totals per client"""
+    return select(
+        Client.id,
+        Client.name,
+        Client.company_code,
+        Client.email,
+        Client.is_active,
+        func.count(Invoice.id).label('invoice_count'),
+        func.sum(Invoice.total).label('total_invoiced'),
+        func.sum(
+            db.case(
+                (Invoice.status == 'paid', Invoice.total),
+                else_=0
+            )
+        ).label('total_paid'),
+        func.sum(
+            db.case(
+                (Invoice.status.in_(['sent', 'overdue']), Invoice.total),
+                else_=0
+            )
+        ).label('outstanding')
+    ).outerjoin(Invoice).where(
+        Client.company_id == company_id
+    ).group_by(Client.id).order_by(
+        func.sum(Invoice.total).desc().nullslast()
+    )
+
+
+def clients_summary(company_id):
+    """Per-client totals for the clients report"""
+    return db.session.execute(clients_summary_query(company_id)).all()
+
+
+def _aging_condition(as_of, min_days, max_days):
+    """Due date condition for a bucket, as plain comparisons on due_date"""
+    conditions = []
+    if min_days is not None:
+        conditions.append(Invoice.due_date <= as_of - timedelta(days=min_days))
+    if max_days is not None:
+        conditions.append(Invoice.due_date > as_of - timedelta(days=max_days + 1))
+    return and_(*conditions)
+
+
+def aging_bucket(due_date, as_of):
+    """Bucket key for a single invoice"""
+    days_overdue = (as_of - due_date).days
+    for key, _, min_days, max_days in AGING_BUCKETS:
+        if (min_days is None or days_overdue >= min_days) and \
+                (max_days is None or days_overdue <= max_days):
+            return key
+
+
+def aging_summary(company_id, as_of):
+    """
+    Open receivables per client split into aging buckets.
+
+    One GROUP BY pass over open invoices, with a CASE per bucket comparing
+    due_date to precomputed cutoff dates; this stays on the
+    (company_id, status, due_date) index.
+
+    Returns:
+        dict: {'clients': [row, ...], 'totals': {bucket: Decimal, 'total': Decimal}}
+    """
+    columns = [
+        func.sum(
+            db.case((_aging_condition(as_of, min_days, max_days), Invoice.total), else_=0)
+        ).label(key)
+        for key, _, min_days, max_days in AGING_BUCKETS
+    ]
+
+    rows = db.session.query(
+        Client.id,
+        Client.name,
+        func.count(Invoice.id).label('invoice_count'),
+        func.sum(Invoice.total).label('total'),
+        *columns
+    ).join(
+        Invoice, Invoice.client_id == Client.id
+    ).filter(
+        Invoice.company_id == company_id,
+        Invoice.status.in_(OPEN_STATUSES)
+    ).group_by(Client.id, Client.name).order_by(
+        func.sum(Invoice.total).desc()
+    ).all()
+
+    keys = [key for key, _, _, _ in AGING_BUCKETS] + ['total']
+    clients = [
+        dict(
+            {'id': row.id, 'name': row.name, 'invoice_count': row.invoice_count},
+            **{key: to_money(getattr(row, key)) for key in keys}
+        )
+        for row in rows
+    ]
+    totals = {
+        key: sum((client[key] for client in clients), Decimal('0.00'))
+        for key in keys
+    }
+
+    return {'clients': clients, 'totals': totals}
+
+
+def open_invoices_query(company_id, client_id):
+    """A client's open invoices, oldest due date first"""
+    return Invoice.query.filter(
+        Invoice.company_id == company_id,
+        Invoice.client_id == client_id,
+        Invoice.status.in_(OPEN_STATUSES)
+    ).order_by(Invoice.due_date, Invoice.id)
+
+
+def _month_floor(value):
+    return date(value.year, value.month, 1)
+
+
+def expense_totals(company_id, date_from, date_to):
+    """
+    Expense totals per month and category for an exact date range.
+
+    Months wholly inside the range are read from the rollup; partial
+    months at either end are summed from the expense rows of the range.
+
+    Returns:
+        list: Rows of (month 'YYYY-MM', category, amount, vat_amount)
+    """
+    # Whole months are [first_month, end_month) on month starts
+    first_month = _month_floor(date_from)
+    if date_from != first_month:
+        first_month = _month_floor(first_month + timedelta(days=31))
+    end_month = _month_floor(date_to + timedelta(days=1))
+
+    rows = []
+    if first_month < end_month:
+        rows.extend(
+            (row.month.strftime('%Y-%m'), row.category, row.amount, row.vat_amount)
+            for row in db.session.query(
+                ExpenseMonthlyRollup.month,
+                ExpenseMonthlyRollup.category,
+                ExpenseMonthlyRollup.amount,
+                ExpenseMonthlyRollup.vat_amount
+            ).filter(
+                ExpenseMonthlyRollup.company_id == company_id,
+                ExpenseMonthlyRollup.month >= first_month,
+                ExpenseMonthlyRollup.month < end_month,
+                ExpenseMonthlyRollup.expense_count > 0
+            )
+        )
+
+    if date_from < first_month or date_to >= end_month:
+        month = month_key(Expense.expense_date).label('month')
+        rows.extend(
+            (row.month, row.category or '', row.amount, row.vat_amount)
+            for row in db.session.query(
+                month,
+                Expense.category,
+                func.sum(Expense.amount).label('amount'),
+                func.sum(Expense.vat_amount).label('vat_amount')
+            ).filter(
+                Expense.company_id == company_id,
+                Expense.expense_date >= date_from,
+                Expense.expense_date <= date_to,
+                or_(Expense.expense_date < first_month, Expense.expense_date >= end_month)
+            ).group_by(month, Expense.category)
+        )
+
+    return rows
+
+
+def input_vat(company_id, period_start, period_end):
+    """Input (purchase) VAT for a period, from the expense rollup"""
+    return sum(
+        (to_money(vat_amount) for _, _, _, vat_amount in expense_totals(company_id, period_start, period_end)),
+        Decimal('0.00')
+    )
+
+
+def profit_loss(company_id, date_from, date_to):
+    """
+    Monthly profit & loss: invoiced net income against expenses.
+
+    Income is the net amount of issued invoices by invoice date; expenses
+    are those dated in the same range (see expense_totals()).
+    """
+    month = month_key(Invoice.invoice_date).label('month')
+    income_rows = db.session.query(
+        month,
+        func.sum(Invoice.subtotal).label('income')
+    ).filter(
+        Invoice.company_id == company_id,
+        Invoice.invoice_date >= date_from,
+        Invoice.invoice_date <= date_to,
+        Invoice.status.in_(VAT_REPORTABLE_STATUSES)
+    ).group_by(month).all()
+
+    expense_rows = expense_totals(company_id, date_from, date_to)
+
+    zero = Decimal('0.00')
+    months = {}
+
+    def month_entry(key):
+        if key not in months:
+            months[key] = {'income': zero, 'expenses': zero}
+        return months[key]
+
+    for row in income_rows:
+        month_entry(row.month)['income'] += to_money(row.income)
+
+    categories = {}
+    for expense_month, category, amount, _ in expense_rows:
+        amount = to_money(amount)
+        month_entry(expense_month)['expenses'] += amount
+        categories[category] = categories.get(category, zero) + amount
+
+    for data in months.values():
+        data['profit'] = data['income'] - data['expenses']
+
+    total_income = sum((m['income'] for m in months.values()), zero)
+    total_expenses = sum((m['expenses'] for m in months.values()), zero)
+
+    return {
+        'monthly_data': dict(sorted(months.items())),
+        'expenses_by_category': dict(
+            sorted(categories.items(), key=lambda item: item[1], reverse=True)
+        ),
+        'total_income': total_income,
+        'total_expenses': total_expenses,
+        'profit': total_income - total_expenses
+    }
@@ -0,0 +1,354 @@
+"""
+Report Job Service
+Runs long reports and exports on a worker pool and stores result files
+"""
+import csv
+import hashlib
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from flask import current_app
+from sqlalchemy import select, func
+
+from app import db
+from app.models import Company, ReportJob
+from app.services import columnar_export, exports, isaf, report_data, xlsx_export
+
+logger = logging.getLogger(__name__)
+
+RESULTS_SUBFOLDER = 'reports'
+
+# Write progress to the database at most every this many rows
+PROGRESS_STEP = 500
+
+_executor = None
+
+
+def _get_executor(app):
+    """Create the worker pool on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config['REPORT_JOB_WORKERS'],
+            thread_name_prefix='report-job'
+        )
+    return _executor
+
+
+# Parameter parsing
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def _parse_period(params, unit):
+    today = date.today()
+    year = int(params.get('year') or today.year)
+    if unit == 'quarter':
+        value = int(params.get('quarter') or (today.month - 1) // 3 + 1)
+        if not 1 <= value <= 4:
+            raise ValueError('quarter must be 1-4')
+    else:
+        value = int(params.get('month') or today.month)
+        if not 1 <= value <= 12:
+            raise ValueError('month must be 1-12')
+    return {'year': year, unit: value}
+
+
+def _date_range_params(params):
+    date_from = _parse_date(params.get('from'))
+    date_to = _parse_date(params.get('to'))
+    return {
+        'from': date_from.isoformat() if date_from else None,
+        'to': date_to.isoformat() if date_to else None
+    }
+
+
+def _revenue_params(params):
+    today = date.today()
+    date_from = _parse_date(params.get('from')) or date(today.year, 1, 1)
+    date_to = _parse_date(params.get('to')) or today
+    return {'from': date_from.isoformat(), 'to': date_to.isoformat()}
+
+
+def _analytics_params(params):
+    result = _date_range_params(params)
+    fmt = params.get('format', 'parquet')
+    if fmt not in columnar_export.FORMATS:
+        raise ValueError('format must be parquet or arrow')
+    result['format'] = fmt
+    return result
+
+
+# Runners
+def _count(query):
+    """Row count of a query, used as the progress denominator"""
+    return db.session.execute(
+        select(func.count()).select_from(query.order_by(None).subquery())
+    ).scalar() or 0
+
+
+def _run_invoices_csv(job, params, path, progress):
+    query = exports.invoice_export_query(job.company_id, params['from'], params['to'])
+    rows = progress.track(exports.stream_rows(query), _count(query))
+    _write_text(path, exports.generate_csv(
+        exports.INVOICE_EXPORT_HEADER, rows, exports.format_invoice_row
+    ))
+
+
+def _run_vat_csv(job, params, path, progress):
+    period_start, period_end = report_data.quarter_range(params['year'], params['quarter'])
+    query = exports.vat_export_query(job.company_id, period_start, period_end)
+    rows = progress.track(exports.stream_rows(query), _count(query))
+    _write_text(path, exports.generate_csv(
+        exports.VAT_EXPORT_HEADER, rows, exports.format_vat_row, delimiter=';'
+    ))
+
+
+def _run_invoices_xlsx(job, params, path, progress):
+    query = exports.invoice_export_query(job.company_id, params['from'], params['to'])
+    rows = progress.track(exports.stream_rows(query), _count(query))
+    xlsx_export.write_xlsx(
+        path, 'Sąskaitos', exports.INVOICE_EXPORT_HEADER, xlsx_export.INVOICE_COLUMNS, rows
+    )
+
+
+def _run_vat_xlsx(job, params, path, progress):
+    period_start, period_end = report_data.quarter_range(params['year'], params['quarter'])
+    query = exports.vat_export_query(job.company_id, period_start, period_end)
+    rows = progress.track(exports.stream_rows(query), _count(query))
+    xlsx_export.write_xlsx(
+        path, 'PVM', exports.VAT_EXPORT_HEADER, xlsx_export.VAT_COLUMNS, rows,
+        xlsx_export.vat_values
+    )
+
+
+def _run_isaf_xml(job, params, path, progress):
+    company = db.session.get(Company, job.company_id)
+    period_start, period_end = report_data.month_range(params['year'], params['month'])
+    isaf.check_tax_codes(job.company_id, period_start, period_end)
+    register = isaf.isaf_sales_query(job.company_id, period_start, period_end).subquery()
+    invoice_count = db.session.execute(
+        select(func.count(func.distinct(register.c.id)))
+    ).scalar() or 0
+    # One chunk per invoice, plus the document header and footer chunks
+    chunks = progress.track(
+        isaf.generate_isaf_xml(company, period_start, period_end), invoice_count + 5
+    )
+    _write_text(path, chunks)
+
+
+def _run_revenue_csv(job, params, path, progress):
+    summary = report_data.revenue_summary(
+        job.company_id, _parse_date(params['from']), _parse_date(params['to'])
+    )
+    progress.update(50)
+
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['Mėnuo', 'Pajamos', 'PVM', 'Sąskaitų'])
+        for month, data in sorted(summary['monthly_data'].items()):
+            writer.writerow([month, data['revenue'], data['vat'], data['count']])
+        writer.writerow(['Viso', summary['total_revenue'], summary['total_vat'], ''])
+        writer.writerow([])
+        writer.writerow(['Klientas', 'Pajamos'])
+        for row in summary['client_revenue']:
+            writer.writerow([row.name, float(row.total)])
+
+
+def _run_analytics(job, params, path, progress):
+    if not columnar_export.is_available():
+        raise RuntimeError('pyarrow is not installed')
+    with open(path, 'wb') as f:
+        columnar_export.write_snapshot_zip(
+            job.company_id, f, params['format'], params['from'], params['to']
+        )
+
+
+def _write_text(path, chunks):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+# kind: (parameter parser, runner, file extension, download name prefix)
+JOB_KINDS = {
+    'invoices_csv': (_date_range_params, _run_invoices_csv, 'csv', 'saskaitos'),
+    'invoices_xlsx': (_date_range_params, _run_invoices_xlsx, 'xlsx', 'saskaitos'),
+    'vat_csv': (lambda p: _parse_period(p, 'quarter'), _run_vat_csv, 'csv', 'pvm_ataskaita'),
+    'vat_xlsx': (lambda p: _parse_period(p, 'quarter'), _run_vat_xlsx, 'xlsx', 'pvm_ataskaita'),
+    'isaf_xml': (lambda p: _parse_period(p, 'month'), _run_isaf_xml, 'xml', 'isaf'),
+    'revenue_csv': (_revenue_params, _run_revenue_csv, 'csv', 'pajamos'),
+    'analytics': (_analytics_params, _run_analytics, 'zip', 'analitika')
+}
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'xml': 'application/xml',
+    'xlsx': xlsx_export.XLSX_MIMETYPE,
+    'zip': 'application/zip'
+}
+
+
+class JobProgress:
+    """Progress reporter writing through its own connection"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.percent = 0
+
+    def update(self, percent):
+        percent = max(0, min(int(percent), 99))
+        if percent == self.percent:
+            return
+        self.percent = percent
+        # A separate transaction keeps the job's streaming cursor open
+        with db.engine.begin() as connection:
+            connection.execute(
+                ReportJob.__table__.update().where(
+                    ReportJob.__table__.c.id == self.job_id
+                ).values(progress=percent)
+            )
+
+    def track(self, iterable, total):
+        """Yield items from iterable, reporting progress against total"""
+        for count, item in enumerate(iterable, 1):
+            if total and count % PROGRESS_STEP == 0:
+                self.update(count * 100 / total)
+            yield item
+
+
+def normalize_job_params(kind, params):
+    """Validate parameters for a job kind, raising ValueError when invalid"""
+    if kind not in JOB_KINDS:
+        raise ValueError(f'Unknown report: {kind}')
+    parser = JOB_KINDS[kind][0]
+    return parser(params)
+
+
+def _params_key(kind, params):
+    payload = json.dumps([kind, params], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def find_active_job(company_id, params_key):
+    """A queued or running job for the same parameters, if still alive"""
+    stale_before = datetime.utcnow() - current_app.config['REPORT_JOB_STALE_AFTER']
+    return ReportJob.query.filter(
+        ReportJob.company_id == company_id,
+        ReportJob.params_key == params_key,
+        ReportJob.status.in_(['queued', 'running']),
+        ReportJob.created_at >= stale_before
+    ).order_by(ReportJob.created_at.desc()).first()
+
+
+def submit_job(company_id, user_id, kind, params):
+    """
+    Submit a report job, or attach to an identical one already in progress.
+
+    Args:
+        company_id: Company the report is for
+        user_id: Requesting user
+        kind: One of JOB_KINDS
+        params: Raw request parameters
+
+    Returns:
+        ReportJob: The new or already running job
+
+    Raises:
+        ValueError: If the kind or parameters are invalid
+    """
+    params = normalize_job_params(kind, params)
+    params_key = _params_key(kind, params)
+
+    existing = find_active_job(company_id, params_key)
+    if existing:
+        return existing
+
+    job = ReportJob(
+        id=uuid.uuid4().hex,
+        company_id=company_id,
+        user_id=user_id,
+        kind=kind,
+        params=json.dumps(params),
+        params_key=params_key,
+        status='queued'
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    _get_executor(app).submit(_run_job, app, job.id)
+
+    return job
+
+
+def _run_job(app, job_id):
+    """Execute a job inside its own application context"""
+    with app.app_context():
+        job = db.session.get(ReportJob, job_id)
+        if job is None:
+            return
+
+        path = None
+        try:
+            # Bad stored parameters or an unwritable folder fail the job too
+            _, runner, extension, prefix = JOB_KINDS[job.kind]
+            params = json.loads(job.params)
+
+            relative_path = os.path.join(RESULTS_SUBFOLDER, str(job.company_id), f'{job.id}.{extension}')
+            path = os.path.join(app.config['UPLOAD_FOLDER'], relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            job.status = 'running'
+            job.started_at = datetime.utcnow()
+            db.session.commit()
+
+            runner(job, params, path, JobProgress(job.id))
+        except Exception as e:
+            logger.exception(f'Report job {job.id} ({job.kind}) failed')
+            db.session.rollback()
+            job.status = 'failed'
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+            return
+
+        job.status = 'completed'
+        job.progress = 100
+        job.result_file = relative_path
+        suffix = '_'.join(str(v) for v in params.values() if v) or date.today().strftime('%Y%m%d')
+        job.download_name = f'{prefix}_{suffix}.{extension}'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def result_path(job):
+    """Absolute path of a completed job's result file"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], job.result_file)
+
+
+def result_mimetype(job):
+    return MIMETYPES[JOB_KINDS[job.kind][2]]
+
+
+def cleanup_jobs(older_than):
+    """Delete finished jobs created before a cutoff, with their files"""
+    jobs = ReportJob.query.filter(
+        ReportJob.created_at < older_than,
+        ReportJob.status.in_(['completed', 'failed'])
+    ).all()
+
+    for job in jobs:
+        if job.result_file:
+            path = result_path(job)
+            if os.path.exists(path):
+                os.remove(path)
+        db.session.delete(job)
+
+    db.session.commit()
+    return len(jobs)
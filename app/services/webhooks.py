@@ -0,0 +1,556 @@
+"""
+Webhook Service
+Signed event notifications queued with the data change and delivered in the background
+"""
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import logging
+import random
+import secrets
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+from flask import current_app
+from sqlalchemy import and_, event, inspect, or_, select
+from sqlalchemy.orm import Session, joinedload
+
+from app import db
+from app.models import Invoice, Client, WebhookEndpoint, WebhookDelivery
+from app.services import api_serializers
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = (
+    'invoice.created', 'invoice.sent', 'invoice.paid', 'invoice.overdue',
+    'invoice.cancelled', 'client.created'
+)
+
+# Invoice status changes that are announced as invoice.<status>
+STATUS_EVENTS = {'sent', 'paid', 'overdue', 'cancelled'}
+
+SIGNATURE_HEADER = 'X-SaskaitaPro-Signature'
+EVENT_HEADER = 'X-SaskaitaPro-Event'
+
+MAX_BATCH_SIZE = 100
+MAX_CONCURRENCY = 10
+
+
+# Queueing
+
+def register_listeners():
+    """Attach the flush and commit listeners (idempotent)"""
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+
+
+def _after_flush(session, flush_context):
+    """Queue deliveries for events caused by this flush, in its transaction"""
+    events = []
+
+    for obj in session.new:
+        if isinstance(obj, Invoice):
+            events.append((obj.company_id, 'invoice.created', 'invoice', obj.id))
+        elif isinstance(obj, Client):
+            events.append((obj.company_id, 'client.created', 'client', obj.id))
+
+    for obj in session.dirty:
+        if isinstance(obj, Invoice) and obj.status in STATUS_EVENTS \
+                and inspect(obj).attrs.status.history.has_changes():
+            events.append((obj.company_id, f'invoice.{obj.status}', 'invoice', obj.id))
+
+    if events:
+        queue_events(session, events)
+
+
+def _after_commit(session):
+    # Only wakes a dispatcher this process runs; CLI commands never start one
+    dispatcher = _dispatcher
+    if session.info.pop('webhooks_queued', False) and dispatcher is not None:
+        dispatcher.wake()
+
+
+def _after_rollback(session):
+    session.info.pop('webhooks_queued', None)
+
+
+def queue_events(session, events):
+    """
+    Queue one delivery per event and subscribed endpoint.
+
+    Runs in the caller's transaction, so deliveries exist exactly when the
+    change commits. Bulk paths that bypass the ORM call this themselves.
+
+    Args:
+        session: Session of the writing transaction
+        events: Iterable of (company_id, event_type, entity_type, entity_id)
+
+    Returns:
+        int: Number of deliveries queued
+    """
+    events = [e for e in events if e[0] is not None]
+    if not events:
+        return 0
+
+    connection = session.connection()
+    endpoints = connection.execute(
+        select(WebhookEndpoint.id, WebhookEndpoint.company_id, WebhookEndpoint.events).where(
+            WebhookEndpoint.company_id.in_({e[0] for e in events}),
+            WebhookEndpoint.is_active.is_(True)
+        )
+    ).all()
+    if not endpoints:
+        return 0
+
+    now = datetime.utcnow()
+    rows = []
+    for company_id, event_type, entity_type, entity_id in events:
+        event_id = uuid.uuid4().hex
+        for endpoint in endpoints:
+            if endpoint.company_id == company_id and \
+                    (endpoint.events == '*' or event_type in endpoint.events.split(',')):
+                rows.append({
+                    'endpoint_id': endpoint.id,
+                    'event_id': event_id,
+                    'event_type': event_type,
+                    'entity_type': entity_type,
+                    'entity_id': entity_id,
+                    'status': 'pending',
+                    'attempts': 0,
+                    'next_attempt_at': now,
+                    'created_at': now
+                })
+
+    if rows:
+        connection.execute(WebhookDelivery.__table__.insert(), rows)
+        session.info['webhooks_queued'] = True
+    return len(rows)
+
+
+# Endpoints
+
+def validate_endpoint(data):
+    """
+    Validated endpoint settings from an API request.
+
+    Raises:
+        ValueError: If a setting is invalid
+    """
+    url = (data.get('url') or '').strip()
+    parsed = urlparse(url)
+    allowed_schemes = ('https', 'http') if current_app.config['WEBHOOK_ALLOW_HTTP'] else ('https',)
+    if parsed.scheme not in allowed_schemes or not parsed.netloc:
+        raise ValueError(f'url must be an absolute {" or ".join(allowed_schemes)} URL')
+    if len(url) > 500:
+        raise ValueError('url is too long')
+    try:
+        port = parsed.port
+    except ValueError:
+        raise ValueError('url has an invalid port')
+    resolve_address(parsed.hostname, port or (443 if parsed.scheme == 'https' else 80))
+
+    events = data.get('events', '*')
+    if events != '*':
+        if not isinstance(events, list) or not events:
+            raise ValueError('events must be "*" or a non-empty list')
+        unknown = [e for e in events if e not in EVENT_TYPES]
+        if unknown:
+            raise ValueError(f'Unknown events: {", ".join(map(str, unknown))}')
+        events = ','.join(dict.fromkeys(events))
+
+    batch_size = data.get('batch_size', 1)
+    if not isinstance(batch_size, int) or not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise ValueError(f'batch_size must be between 1 and {MAX_BATCH_SIZE}')
+
+    max_concurrency = data.get('max_concurrency', 2)
+    if not isinstance(max_concurrency, int) or not 1 <= max_concurrency <= MAX_CONCURRENCY:
+        raise ValueError(f'max_concurrency must be between 1 and {MAX_CONCURRENCY}')
+
+    return {'url': url, 'events': events, 'batch_size': batch_size, 'max_concurrency': max_concurrency}
+
+
+def create_endpoint(company_id, settings):
+    endpoint = WebhookEndpoint(
+        company_id=company_id,
+        secret=f'whsec_{secrets.token_urlsafe(32)}',
+        **settings
+    )
+    db.session.add(endpoint)
+    db.session.commit()
+    return endpoint
+
+
+def delete_endpoint(endpoint):
+    """Delete an endpoint and everything still queued for it"""
+    WebhookDelivery.query.filter_by(endpoint_id=endpoint.id).delete(synchronize_session=False)
+    db.session.delete(endpoint)
+    db.session.commit()
+
+
+# Signing
+
+def sign(secret, body, timestamp=None):
+    """
+    Signature header value: t=<unix time>,v1=<hex HMAC-SHA256 of "<t>.<body>">.
+
+    The timestamp lets receivers reject replayed requests.
+    """
+    timestamp = int(timestamp if timestamp is not None else time.time())
+    digest = hmac.new(secret.encode('utf-8'), f'{timestamp}.'.encode('ascii') + body, hashlib.sha256)
+    return f't={timestamp},v1={digest.hexdigest()}'
+
+
+def verify_signature(secret, header, body, tolerance=300):
+    """Check a signature header as a receiver would"""
+    try:
+        parts = dict(part.split('=', 1) for part in header.split(','))
+        timestamp = int(parts['t'])
+    except (ValueError, KeyError, AttributeError):
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    expected = sign(secret, body, timestamp)
+    return hmac.compare_digest(expected, header)
+
+
+# Delivery
+
+def _due_condition(now):
+    """Pending deliveries whose time has come, or deliveries whose dispatcher lease ran out"""
+    return or_(
+        and_(WebhookDelivery.status == 'pending', WebhookDelivery.next_attempt_at <= now),
+        and_(WebhookDelivery.status == 'delivering', WebhookDelivery.locked_until < now)
+    )
+
+
+def claim_batch(endpoint, now, lease):
+    """
+    Lease up to batch_size due deliveries of an endpoint.
+
+    SKIP LOCKED lets several dispatchers claim from the same queue without
+    waiting on or double-sending each other's rows.
+
+    Returns:
+        list: Claimed delivery ids, oldest first
+    """
+    deliveries = WebhookDelivery.__table__
+    candidates = select(deliveries.c.id).where(
+        deliveries.c.endpoint_id == endpoint.id,
+        _due_condition(now)
+    ).order_by(deliveries.c.id).limit(endpoint.batch_size).with_for_update(skip_locked=True)
+
+    ids = db.session.execute(
+        deliveries.update().where(deliveries.c.id.in_(candidates.scalar_subquery())).values(
+            status='delivering',
+            locked_until=now + lease,
+            attempts=deliveries.c.attempts + 1
+        ).returning(deliveries.c.id)
+    ).scalars().all()
+    db.session.commit()
+    return sorted(ids)
+
+
+def build_events(deliveries):
+    """Event payloads with the current state of each entity (one IN query per type)"""
+    ids = {}
+    for delivery in deliveries:
+        ids.setdefault(delivery.entity_type, set()).add(delivery.entity_id)
+
+    records = {}
+    if 'invoice' in ids:
+        serialize = api_serializers.serializer_for('invoice')
+        for invoice in Invoice.query.options(joinedload(Invoice.client)).filter(Invoice.id.in_(ids['invoice'])):
+            records[('invoice', invoice.id)] = serialize(invoice)
+    if 'client' in ids:
+        serialize = api_serializers.serializer_for('client')
+        for client in Client.query.filter(Client.id.in_(ids['client'])):
+            records[('client', client.id)] = serialize(client)
+
+    return [{
+        'id': f'evt_{delivery.event_id}',
+        'type': delivery.event_type,
+        'created_at': delivery.created_at.isoformat(),
+        'data': records.get((delivery.entity_type, delivery.entity_id))
+    } for delivery in deliveries]
+
+
+def resolve_address(host, port):
+    """
+    Resolve an endpoint host to the address to connect to.
+
+    Every address the name resolves to must be public, so an endpoint
+    cannot reach loopback, private, link-local or reserved networks
+    (internal services, cloud metadata) unless
+    WEBHOOK_ALLOW_PRIVATE_ADDRESSES is set.
+
+    Raises:
+        ValueError: If the host does not resolve or resolves to a non-public address
+    """
+    if not host:
+        raise ValueError('url has no host')
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f'url host {host} does not resolve')
+
+    addresses = [info[4][0] for info in infos]
+    if not current_app.config['WEBHOOK_ALLOW_PRIVATE_ADDRESSES']:
+        for address in addresses:
+            ip = ipaddress.ip_address(address.split('%', 1)[0])
+            if getattr(ip, 'ipv4_mapped', None):
+                ip = ip.ipv4_mapped
+            if ip.is_loopback or ip.is_private or ip.is_link_local or ip.is_reserved \
+                    or ip.is_multicast or ip.is_unspecified:
+                raise ValueError(f'url host {host} resolves to a non-public address')
+    return addresses[0]
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection to an address resolved and checked beforehand"""
+
+    def __init__(self, host, port, address, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS connection to a checked address; the certificate is verified for the host name"""
+
+    def __init__(self, host, port, address, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def post(url, body, headers, timeout):
+    """
+    POST a body; returns None on a 2xx answer, else a short error description.
+
+    The host is resolved and checked again for every delivery and the
+    connection goes to that checked address, so a DNS record changed after
+    registration cannot point deliveries at internal addresses. Redirects
+    are not followed; a 3xx answer is a failed delivery.
+    """
+    parsed = urlparse(url)
+    try:
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        address = resolve_address(parsed.hostname, port)
+    except ValueError as e:
+        return str(e)
+
+    connection_class = _PinnedHTTPSConnection if parsed.scheme == 'https' else _PinnedHTTPConnection
+    connection = connection_class(parsed.hostname, port, address, timeout=timeout)
+    path = parsed.path or '/'
+    if parsed.query:
+        path = f'{path}?{parsed.query}'
+
+    try:
+        connection.request('POST', path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read(1024)
+        if 200 <= response.status < 300:
+            return None
+        return f'HTTP {response.status}'
+    except (http.client.HTTPException, OSError) as e:
+        return str(e)[:500]
+    finally:
+        connection.close()
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter after a failed attempt"""
+    config = current_app.config
+    delay = min(config['WEBHOOK_RETRY_BASE'] * 2 ** (attempts - 1), config['WEBHOOK_RETRY_MAX'])
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def deliver(endpoint_id, delivery_ids):
+    """Send claimed deliveries in one POST and record the outcome"""
+    deliveries = WebhookDelivery.query.filter(
+        WebhookDelivery.id.in_(delivery_ids)
+    ).order_by(WebhookDelivery.id).all()
+    endpoint = db.session.get(WebhookEndpoint, endpoint_id)
+
+    if endpoint is None or not endpoint.is_active:
+        error = 'Endpoint removed or disabled'
+        for delivery in deliveries:
+            delivery.status = 'failed'
+            delivery.last_error = error
+            delivery.locked_until = None
+        db.session.commit()
+        return
+
+    events = build_events(deliveries)
+    if endpoint.batch_size > 1:
+        payload = {'events': events}
+    else:
+        payload = events[0]
+    body = api_serializers.dumps(payload)
+
+    headers = {
+        'Content-Type': 'application/json',
+        'User-Agent': 'SaskaitaPro-Webhooks/1.0',
+        SIGNATURE_HEADER: sign(endpoint.secret, body)
+    }
+    if endpoint.batch_size == 1:
+        headers[EVENT_HEADER] = deliveries[0].event_type
+
+    error = post(endpoint.url, body, headers, current_app.config['WEBHOOK_TIMEOUT'])
+
+    now = datetime.utcnow()
+    max_attempts = current_app.config['WEBHOOK_MAX_ATTEMPTS']
+    for delivery in deliveries:
+        delivery.locked_until = None
+        delivery.last_error = error
+        if error is None:
+            delivery.status = 'delivered'
+            delivery.delivered_at = now
+        elif delivery.attempts >= max_attempts:
+            delivery.status = 'failed'
+        else:
+            delivery.status = 'pending'
+            delivery.next_attempt_at = now + retry_delay(delivery.attempts)
+    db.session.commit()
+
+    if error is not None:
+        logger.warning(f'Webhook delivery to endpoint {endpoint_id} failed: {error}')
+
+
+class WebhookDispatcher:
+    """
+    Delivery loop for one process.
+
+    A daemon thread claims due deliveries whenever it is woken (after a
+    commit that queued some) or every WEBHOOK_POLL_INTERVAL seconds, and
+    hands each claimed batch to a thread pool. At most max_concurrency
+    POSTs per endpoint run at once in this process; with N processes
+    dispatching (gunicorn workers, webhook-worker commands) an endpoint can
+    receive up to N x max_concurrency at once.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._wake = threading.Event()
+        self._pool = ThreadPoolExecutor(
+            max_workers=app.config['WEBHOOK_WORKERS'],
+            thread_name_prefix='webhook'
+        )
+        self._in_flight = Counter()  # endpoint id -> POSTs running
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Run the loop in a daemon thread (once)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name='webhook-dispatcher', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def run(self, stop=None):
+        """Dispatch until ``stop`` (a threading.Event) is set; forever by default"""
+        interval = self.app.config['WEBHOOK_POLL_INTERVAL']
+        while stop is None or not stop.is_set():
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self.dispatch_due()
+            except Exception:
+                logger.exception('Webhook dispatch failed')
+            self._wake.wait(interval)
+
+    def dispatch_due(self):
+        """Claim due work for endpoints with free slots and submit it to the pool"""
+        now = datetime.utcnow()
+        lease = timedelta(seconds=self.app.config['WEBHOOK_TIMEOUT'] * 3)
+
+        endpoint_ids = db.session.scalars(
+            select(WebhookDelivery.endpoint_id).where(_due_condition(now)).distinct().limit(100)
+        ).all()
+        endpoints = WebhookEndpoint.query.filter(WebhookEndpoint.id.in_(endpoint_ids)).all() \
+            if endpoint_ids else []
+
+        for endpoint in endpoints:
+            while self._acquire(endpoint):
+                delivery_ids = claim_batch(endpoint, now, lease)
+                if not delivery_ids:
+                    self._release(endpoint.id)
+                    break
+                self._pool.submit(self._deliver, endpoint.id, delivery_ids)
+
+        db.session.remove()
+
+    def _acquire(self, endpoint):
+        with self._lock:
+            if self._in_flight[endpoint.id] >= endpoint.max_concurrency:
+                return False
+            self._in_flight[endpoint.id] += 1
+            return True
+
+    def _release(self, endpoint_id):
+        with self._lock:
+            self._in_flight[endpoint_id] -= 1
+            if self._in_flight[endpoint_id] <= 0:
+                del self._in_flight[endpoint_id]
+
+    def _deliver(self, endpoint_id, delivery_ids):
+        with self.app.app_context():
+            try:
+                deliver(endpoint_id, delivery_ids)
+            except Exception:
+                logger.exception(f'Webhook delivery to endpoint {endpoint_id} crashed')
+                db.session.rollback()
+            finally:
+                db.session.remove()
+                self._release(endpoint_id)
+                # A slot is free again; more may be queued for this endpoint
+                self._wake.set()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def init_app(app):
+    """
+    Run deliveries in every serving process when WEBHOOK_DISPATCH_IN_PROCESS is set.
+
+    The dispatcher starts with the first request a process handles rather
+    than in create_app(), so CLI commands (which create the app too) never
+    start one and a gunicorn --preload master does not start a thread its
+    forked workers would lose. Once running it also picks up deliveries
+    and retries left over from before a restart.
+    """
+    if not app.config['WEBHOOK_DISPATCH_IN_PROCESS']:
+        return
+
+    @app.before_request
+    def start_webhook_dispatcher():
+        if _dispatcher is None:
+            get_dispatcher(app).start()
+
+
+def get_dispatcher(app):
+    """The process-wide dispatcher, created on first use"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = WebhookDispatcher(app)
+    return _dispatcher
@@ -0,0 +1,121 @@
+"""
+XLSX Export Service
+Write-only Excel workbooks fed from streamed query rows
+"""
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+MONEY_FORMAT = '#,##0.00'
+DATE_FORMAT = 'yyyy-mm-dd'
+
+# Column types: text, int, money, date
+INVOICE_COLUMNS = ['text', 'date', 'date', 'text', 'money', 'money', 'money', 'text', 'date']
+VAT_COLUMNS = ['text', 'text', 'date', 'text', 'text', 'text', 'money', 'money', 'int']
+CLIENT_COLUMNS = ['text', 'text', 'text', 'int', 'money', 'money', 'money']
+
+COLUMN_WIDTHS = {'text': 24, 'int': 10, 'money': 14, 'date': 12}
+
+
+def _cell_writer(worksheet, kind):
+    """
+    Return a function turning a raw value into something to append.
+
+    Formatted columns reuse one styled cell: write-only sheets serialize
+    each row as soon as it is appended, so the cell is free again for the
+    next row and no per-cell objects accumulate.
+    """
+    cell = WriteOnlyCell(worksheet)
+
+    if kind == 'money':
+        cell.number_format = MONEY_FORMAT
+    elif kind == 'date':
+        cell.number_format = DATE_FORMAT
+    elif kind == 'int':
+        return lambda value: value
+    else:
+        def write_text(value):
+            if isinstance(value, str) and value.startswith('='):
+                # Store as text so user data never becomes a formula
+                cell.value = value
+                cell.data_type = 's'
+                return cell
+            return value
+        return write_text
+
+    def write_formatted(value):
+        if value is None:
+            return None
+        cell.value = value
+        return cell
+
+    return write_formatted
+
+
+def write_xlsx(sink, title, header, columns, rows, values=tuple):
+    """
+    Write rows to a single-sheet workbook.
+
+    Uses openpyxl's write-only mode: rows go straight to a temporary sheet
+    file with inline strings, so memory stays flat however many rows are
+    written. Numbers and dates are stored as typed cells.
+
+    Args:
+        sink: File path or binary file object
+        title: Sheet title
+        header: Column titles
+        columns: Column types (text, int, money, date)
+        rows: Iterable of source rows
+        values: Converts a source row to a sequence of cell values
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title)
+    worksheet.freeze_panes = 'A2'
+
+    for index, kind in enumerate(columns, 1):
+        worksheet.column_dimensions[get_column_letter(index)].width = COLUMN_WIDTHS[kind]
+
+    bold = Font(bold=True)
+    header_cells = []
+    for name in header:
+        cell = WriteOnlyCell(worksheet, value=name)
+        cell.font = bold
+        header_cells.append(cell)
+    worksheet.append(header_cells)
+
+    writers = [_cell_writer(worksheet, kind) for kind in columns]
+    for row in rows:
+        worksheet.append([write(value) for write, value in zip(writers, values(row))])
+
+    workbook.save(sink)
+
+
+def vat_values(row):
+    """Cell values of a VAT export row"""
+    return (
+        'SF',  # Sąskaita faktūra
+        row.invoice_number,
+        row.invoice_date,
+        row.company_code,
+        row.vat_code,
+        row.client_name,
+        row.line_total,
+        row.vat_amount,
+        row.vat_rate
+    )
+
+
+def client_values(row):
+    """Cell values of a client report row"""
+    return (
+        row.name,
+        row.company_code,
+        row.email,
+        row.invoice_count,
+        row.total_invoiced or 0,
+        row.total_paid or 0,
+        row.outstanding or 0
+    )
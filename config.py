@@ -85,12 +85,63 @@ class Config:
         'zero': 0            # Zero rate (exports, etc.)
     }
 
+    # VMI PVM classifier codes used in i.SAF registers, keyed by VAT rate
+    ISAF_TAX_CODES = {
+        21: 'PVM1',
+        9: 'PVM2',
+        5: 'PVM3',
+        0: 'PVM5'
+    }
+    ISAF_XSD_PATH = os.environ.get('ISAF_XSD_PATH', os.path.join(basedir, 'schemas', 'isaf_1.2.xsd'))  # VMI schema for `flask validate-isaf`
+
     # Company settings
     COMPANY_NAME = 'SąskaitaPro'
     COMPANY_TAGLINE = 'Profesionalios sąskaitos Lietuvos verslui'
     COMPANY_EMAIL = 'info@saskaitapro.lt'
     COMPANY_WEBSITE = 'https://saskaitapro.lt'
 
+    # Report result cache
+    REPORT_CACHE_TTL = int(os.environ.get('REPORT_CACHE_TTL', 300))  # Seconds
+    REPORT_CACHE_MAX_ENTRIES = int(os.environ.get('REPORT_CACHE_MAX_ENTRIES', 256))
+
+    # Background report jobs
+    REPORT_JOB_WORKERS = int(os.environ.get('REPORT_JOB_WORKERS', 2))
+    REPORT_JOB_STALE_AFTER = timedelta(hours=1)  # Running jobs older than this are considered dead
+
+    # API
+    API_BULK_MAX_INVOICES = int(os.environ.get('API_BULK_MAX_INVOICES', 500))  # Per bulk request
+    API_BULK_MAX_CLIENTS = int(os.environ.get('API_BULK_MAX_CLIENTS', 10000))  # Per bulk upsert request
+    API_BATCH_MAX_REQUESTS = int(os.environ.get('API_BATCH_MAX_REQUESTS', 50))  # Sub-requests per POST /api/batch
+    API_PRINCIPAL_CACHE_TTL = int(os.environ.get('API_PRINCIPAL_CACHE_TTL', 300))  # Seconds, capped by token expiry
+    API_PRINCIPAL_CACHE_MAX_ENTRIES = int(os.environ.get('API_PRINCIPAL_CACHE_MAX_ENTRIES', 10000))
+    API_DECIMAL_FORMAT = os.environ.get('API_DECIMAL_FORMAT', 'number')  # 'number' or 'string' (exact amounts)
+
+    # API rate limiting: endpoint class -> (requests per second, burst), per user
+    API_RATE_LIMIT_ENABLED = os.environ.get('API_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    API_RATE_LIMIT_STORAGE = os.environ.get('API_RATE_LIMIT_STORAGE', 'memory://')  # redis://host:6379/0 with several workers
+    API_RATE_LIMITS = {
+        'read': (20, 100),
+        'write': (5, 30),
+        'bulk': (0.2, 5)
+    }
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token for /api/metrics; unset disables it
+
+    # Idempotency-Key support for mutating API requests
+    IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 3600))  # Seconds a response is replayed
+    IDEMPOTENCY_LOCK_TIMEOUT = 60  # Seconds before an unfinished request's key is freed (crashed worker)
+    IDEMPOTENCY_WAIT_TIMEOUT = 10  # Seconds a duplicate waits for the first request before a 409
+
+    # Outbound webhooks
+    WEBHOOK_DISPATCH_IN_PROCESS = os.environ.get('WEBHOOK_DISPATCH_IN_PROCESS', 'true').lower() == 'true'  # Each web worker delivers; else run `flask webhook-worker`
+    WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 4))  # Concurrent POSTs per process
+    WEBHOOK_TIMEOUT = int(os.environ.get('WEBHOOK_TIMEOUT', 10))  # Seconds per POST
+    WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 8))
+    WEBHOOK_RETRY_BASE = 30  # Seconds before the first retry, doubling per attempt
+    WEBHOOK_RETRY_MAX = 6 * 3600  # Longest wait between attempts
+    WEBHOOK_POLL_INTERVAL = 5  # Seconds between queue scans when idle
+    WEBHOOK_ALLOW_HTTP = False  # Plain http:// endpoint URLs
+    WEBHOOK_ALLOW_PRIVATE_ADDRESSES = False  # Endpoints on loopback/private networks (local receivers only)
+
     # Upload settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
@@ -101,6 +152,8 @@ class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     SQLALCHEMY_ECHO = True
+    WEBHOOK_ALLOW_HTTP = True
+    WEBHOOK_ALLOW_PRIVATE_ADDRESSES = True
 
 
 class ProductionConfig(Config):
@@ -118,6 +171,8 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    WEBHOOK_ALLOW_HTTP = True
+    WEBHOOK_DISPATCH_IN_PROCESS = False  # Tests deliver explicitly
 
 
 class WindowsLocalConfig(Config):
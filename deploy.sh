@@ -154,13 +154,8 @@ sleep 10
 echo ""
 echo -e "${YELLOW}[6/6] Initializing database...${NC}"
 
-$COMPOSE_CMD exec -T app python -c "
-from app import create_app, db
-app = create_app('production')
-with app.app_context():
-    db.create_all()
-    print('Database tables created successfully!')
-"
+$COMPOSE_CMD exec -T app flask db upgrade
+echo "Database schema is up to date!"
 
 # Ask about demo user
 echo ""
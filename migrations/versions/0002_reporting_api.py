@@ -0,0 +1,226 @@
+"""Reporting, API and webhook tables
+
+Company data version and books lock, the expense rollup, report jobs,
+API keys, the change log, webhooks and idempotency keys, and the indexes
+the reports and the API query by.
+
+Revision ID: 0002_reporting_api
+Revises: 0001_baseline
+Create Date: 2026-10-19 00:41:07.562214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_reporting_api'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+BIG_ID = sa.BigInteger().with_variant(sa.Integer(), 'sqlite')
+
+
+def upgrade():
+    # Before this revision the app ran db.create_all() at startup, which
+    # may already have made the new tables (but never the new columns)
+    if not _has_table('api_keys'):
+        op.create_table(
+            'api_keys',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('prefix', sa.String(length=16), nullable=False),
+            sa.Column('key_hash', sa.String(length=64), nullable=False),
+            sa.Column('scopes', sa.String(length=50), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('revoked_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('prefix')
+        )
+        op.create_index('ix_api_keys_user_id', 'api_keys', ['user_id'])
+
+    if not _has_table('idempotency_keys'):
+        op.create_table(
+            'idempotency_keys',
+            sa.Column('id', BIG_ID, nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('key', sa.String(length=255), nullable=False),
+            sa.Column('fingerprint', sa.String(length=64), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('response_status', sa.Integer(), nullable=True),
+            sa.Column('response_body', sa.LargeBinary(), nullable=True),
+            sa.Column('response_mimetype', sa.String(length=100), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key')
+        )
+        op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'])
+
+    if not _has_table('change_log'):
+        op.create_table(
+            'change_log',
+            sa.Column('id', BIG_ID, nullable=False),
+            sa.Column('company_id', sa.Integer(), nullable=False),
+            sa.Column('entity_type', sa.String(length=20), nullable=False),
+            sa.Column('entity_id', sa.Integer(), nullable=False),
+            sa.Column('action', sa.String(length=10), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['company_id'], ['companies.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_change_log_company_id', 'change_log', ['company_id', 'id'])
+
+    if not _has_table('expense_monthly_rollups'):
+        op.create_table(
+            'expense_monthly_rollups',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('company_id', sa.Integer(), nullable=False),
+            sa.Column('month', sa.Date(), nullable=False),
+            sa.Column('category', sa.String(length=50), nullable=False),
+            sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False),
+            sa.Column('vat_amount', sa.Numeric(precision=12, scale=2), nullable=False),
+            sa.Column('expense_count', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['company_id'], ['companies.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('company_id', 'month', 'category', name='uq_expense_rollup_month_category')
+        )
+    _rebuild_expense_rollups()
+
+    if not _has_table('report_jobs'):
+        op.create_table(
+            'report_jobs',
+            sa.Column('id', sa.String(length=32), nullable=False),
+            sa.Column('company_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(length=30), nullable=False),
+            sa.Column('params', sa.Text(), nullable=True),
+            sa.Column('params_key', sa.String(length=64), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('progress', sa.Integer(), nullable=True),
+            sa.Column('result_file', sa.String(length=300), nullable=True),
+            sa.Column('download_name', sa.String(length=200), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['company_id'], ['companies.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_report_jobs_company_params', 'report_jobs', ['company_id', 'params_key', 'status'])
+
+    if not _has_table('webhook_endpoints'):
+        op.create_table(
+            'webhook_endpoints',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('company_id', sa.Integer(), nullable=False),
+            sa.Column('url', sa.String(length=500), nullable=False),
+            sa.Column('secret', sa.String(length=100), nullable=False),
+            sa.Column('events', sa.String(length=300), nullable=False),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+            sa.Column('max_concurrency', sa.Integer(), nullable=False),
+            sa.Column('batch_size', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['company_id'], ['companies.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_webhook_endpoints_company_id', 'webhook_endpoints', ['company_id'])
+
+    if not _has_table('webhook_deliveries'):
+        op.create_table(
+            'webhook_deliveries',
+            sa.Column('id', BIG_ID, nullable=False),
+            sa.Column('endpoint_id', sa.Integer(), nullable=False),
+            sa.Column('event_id', sa.String(length=32), nullable=False),
+            sa.Column('event_type', sa.String(length=30), nullable=False),
+            sa.Column('entity_type', sa.String(length=20), nullable=False),
+            sa.Column('entity_id', sa.Integer(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+            sa.Column('locked_until', sa.DateTime(), nullable=True),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('delivered_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['endpoint_id'], ['webhook_endpoints.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_webhook_deliveries_due', 'webhook_deliveries', ['status', 'next_attempt_at'])
+        op.create_index('ix_webhook_deliveries_endpoint', 'webhook_deliveries', ['endpoint_id', 'status', 'id'])
+
+    # Existing companies start at data version 0 with no closed period
+    if not _has_column('companies', 'data_version'):
+        op.add_column('companies', sa.Column('data_version', sa.Integer(), nullable=False, server_default='0'))
+    if not _has_column('companies', 'books_locked_until'):
+        op.add_column('companies', sa.Column('books_locked_until', sa.Date(), nullable=True))
+
+    # IF NOT EXISTS, since SQLite cannot reflect the expression indexes
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+
+    with op.batch_alter_table('companies') as batch_op:
+        batch_op.drop_column('books_locked_until')
+        batch_op.drop_column('data_version')
+
+    op.drop_table('webhook_deliveries')
+    op.drop_table('webhook_endpoints')
+    op.drop_table('report_jobs')
+    op.drop_table('expense_monthly_rollups')
+    op.drop_table('change_log')
+    op.drop_table('idempotency_keys')
+    op.drop_table('api_keys')
+
+
+# New indexes on tables of the baseline schema: (name, table, columns)
+INDEXES = [
+    ('ix_companies_user_id', 'companies', ['user_id']),
+    ('ix_clients_company_active_created_id', 'clients', ['company_id', 'is_active', 'created_at', 'id']),
+    # Import matching on normalized codes, the same expression as models.normalized_code()
+    ('ix_clients_company_company_code', 'clients', ['company_id', sa.text("upper(replace(company_code, ' ', ''))")]),
+    ('ix_clients_company_vat_code', 'clients', ['company_id', sa.text("upper(replace(vat_code, ' ', ''))")]),
+    ('ix_products_company_active_created_id', 'products', ['company_id', 'is_active', 'created_at', 'id']),
+    ('ix_invoices_company_invoice_date', 'invoices', ['company_id', 'invoice_date']),
+    ('ix_invoices_company_status_due_date', 'invoices', ['company_id', 'status', 'due_date']),
+    ('ix_invoices_company_created_id', 'invoices', ['company_id', 'created_at', 'id']),
+    ('ix_invoice_items_invoice_id', 'invoice_items', ['invoice_id']),
+    ('ix_expenses_company_id', 'expenses', ['company_id']),
+]
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def _has_column(table, name):
+    return any(column['name'] == name for column in sa.inspect(op.get_bind()).get_columns(table))
+
+
+def _rebuild_expense_rollups():
+    """
+    Fill the rollup from the expense rows.
+
+    A table made by create_all() only has the expenses written since, so
+    it is always rebuilt; the rollup is derived data.
+    """
+    if op.get_bind().dialect.name == 'postgresql':
+        month = "CAST(date_trunc('month', expense_date) AS DATE)"
+    else:
+        month = "date(expense_date, 'start of month')"
+    op.execute('DELETE FROM expense_monthly_rollups')
+    op.execute(
+        'INSERT INTO expense_monthly_rollups '
+        '(company_id, month, category, amount, vat_amount, expense_count) '
+        f'SELECT company_id, {month}, COALESCE(category, \'\'), '
+        'COALESCE(SUM(amount), 0), COALESCE(SUM(vat_amount), 0), COUNT(id) '
+        f'FROM expenses GROUP BY company_id, {month}, COALESCE(category, \'\')'
+    )
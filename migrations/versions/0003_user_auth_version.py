@@ -0,0 +1,27 @@
+"""User auth version for API principal caches
+
+Revision ID: 0003_user_auth_version
+Revises: 0002_reporting_api
+Create Date: 2026-10-19 01:02:13.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_user_auth_version'
+down_revision = '0002_reporting_api'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = sa.inspect(op.get_bind()).get_columns('users')
+    if not any(column['name'] == 'auth_version' for column in columns):
+        op.add_column('users', sa.Column('auth_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('auth_version')
@@ -4,6 +4,7 @@ SąskaitaPro - Lithuanian Small Business Invoicing Platform
 Main Application Entry Point
 """
 import os
+import click
 from app import create_app, db
 from app.models import User, Company, Client, Product, Invoice
 
@@ -145,5 +146,319 @@ def create_demo_user():
     print('Password: demo123456')
 
 
+@app.cli.command('export-analytics')
+@click.argument('company_id', type=int)
+@click.option('--format', 'fmt', type=click.Choice(['parquet', 'arrow']), default='parquet')
+@click.option('--output', default='analytics_export', help='Output directory')
+@click.option('--from', 'date_from', default=None, help='First invoice date (YYYY-MM-DD)')
+@click.option('--to', 'date_to', default=None, help='Last invoice date (YYYY-MM-DD)')
+def export_analytics(company_id, fmt, output, date_from, date_to):
+    """Write a columnar snapshot of a company's invoices, lines and clients"""
+    from app.services import columnar_export
+
+    if not columnar_export.is_available():
+        print('pyarrow is not installed.')
+        return
+
+    for path in columnar_export.write_snapshot_dir(company_id, output, fmt, date_from, date_to):
+        print(f'Wrote {path}')
+
+
+@app.cli.command('validate-isaf')
+@click.argument('company_id', type=int)
+@click.argument('year', type=int)
+@click.argument('month', type=int)
+@click.option('--xsd', default=None, help='i.SAF schema file (default: ISAF_XSD_PATH)')
+@click.option('--output', default=None, help='Keep the generated XML at this path')
+def validate_isaf(company_id, year, month, xsd, output):
+    """Generate a month's i.SAF register and validate it against the VMI XSD"""
+    import tempfile
+    from app.services import isaf
+    from app.services.report_data import month_range
+
+    xsd = xsd or app.config['ISAF_XSD_PATH']
+    if not os.path.exists(xsd):
+        print(f'Schema not found: {xsd} (download the i.SAF XSD from VMI)')
+        return
+
+    company = db.session.get(Company, company_id)
+    if company is None:
+        print(f'Company {company_id} not found.')
+        return
+
+    period_start, period_end = month_range(year, month)
+    try:
+        isaf.check_tax_codes(company_id, period_start, period_end)
+    except ValueError as e:
+        print(e)
+        return
+
+    if output:
+        path = output
+    else:
+        fd, path = tempfile.mkstemp(suffix='.xml')
+        os.close(fd)
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(isaf.generate_isaf_xml(company, period_start, period_end))
+        errors = isaf.validate_isaf_xml(path, xsd)
+    finally:
+        if not output:
+            os.remove(path)
+
+    if not errors:
+        print('i.SAF file is valid.')
+        return
+    for error in errors:
+        print(error)
+    raise SystemExit(1)
+
+
+@app.cli.command('cleanup-report-jobs')
+@click.option('--days', default=7, help='Delete finished jobs older than this many days')
+def cleanup_report_jobs(days):
+    """Delete finished report jobs and their result files"""
+    from datetime import datetime, timedelta
+    from app.services.report_jobs import cleanup_jobs
+
+    count = cleanup_jobs(datetime.utcnow() - timedelta(days=days))
+    print(f'Deleted {count} report jobs.')
+
+
+@app.cli.command('purge-idempotency-keys')
+def purge_idempotency_keys():
+    """Delete expired API idempotency keys (run daily)"""
+    from app.services.idempotency import purge_expired
+
+    print(f'Deleted {purge_expired()} idempotency keys.')
+
+
+@app.cli.command('rebuild-expense-rollup')
+@click.argument('company_id', type=int, required=False)
+def rebuild_expense_rollup(company_id):
+    """Recompute the monthly expense rollup from expense rows (one company or all)"""
+    from app.services import expense_rollup
+
+    if company_id is None:
+        company_ids = [company.id for company in Company.query.order_by(Company.id)]
+    elif db.session.get(Company, company_id) is None:
+        print(f'Company {company_id} not found.')
+        return
+    else:
+        company_ids = [company_id]
+
+    for company_id in company_ids:
+        expense_rollup.rebuild(company_id)
+    print(f'Rebuilt the expense rollup of {len(company_ids)} companies.')
+
+
+@app.cli.command('mark-overdue-invoices')
+def mark_overdue_invoices():
+    """Mark sent invoices past their due date as overdue (run daily)"""
+    from datetime import date
+
+    invoices = Invoice.query.filter(
+        Invoice.status == 'sent',
+        Invoice.due_date < date.today()
+    ).all()
+
+    for invoice in invoices:
+        invoice.status = 'overdue'
+    db.session.commit()
+
+    print(f'Marked {len(invoices)} invoices as overdue')
+
+
+@app.cli.command('webhook-worker')
+def webhook_worker():
+    """Deliver queued webhooks in the foreground (when not dispatched in-process)"""
+    from app.services import webhooks
+
+    print('Delivering webhooks, press Ctrl+C to stop')
+    try:
+        webhooks.WebhookDispatcher(app).run()
+    except KeyboardInterrupt:
+        pass
+
+
+@app.cli.command('webhook-receiver')
+@click.option('--port', default=8765, help='Port to listen on')
+@click.option('--secret', default=None, help='Endpoint secret to verify signatures with')
+@click.option('--fail-first', default=0, help='Answer this many requests with HTTP 500 first')
+def webhook_receiver(port, secret, fail_first):
+    """Local stand-in for a customer's webhook endpoint; prints what it receives"""
+    import json
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from app.services import webhooks
+
+    state = {'requests': 0}
+
+    class Receiver(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            state['requests'] += 1
+
+            signature = self.headers.get(webhooks.SIGNATURE_HEADER, '')
+            verified = webhooks.verify_signature(secret, signature, body) if secret else None
+            failing = state['requests'] <= fail_first
+
+            print(f"#{state['requests']} {self.headers.get(webhooks.EVENT_HEADER, 'batch')} "
+                  f"signature={'ok' if verified else 'BAD' if verified is False else 'unchecked'} "
+                  f"answer={500 if failing else 200}")
+            print(json.dumps(json.loads(body), indent=2, ensure_ascii=False))
+
+            self.send_response(500 if failing else 200)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    print(f'Listening on http://127.0.0.1:{port}/')
+    HTTPServer(('127.0.0.1', port), Receiver).serve_forever()
+
+
+@app.cli.command('benchmark-xlsx')
+@click.option('--rows', default=1_000_000, help='Number of synthetic invoice rows')
+@click.option('--output', default=None, help='Keep the workbook at this path')
+def benchmark_xlsx(rows, output):
+    """Time a write-only XLSX invoice export and report peak memory"""
+    import tempfile
+    import time
+    from collections import namedtuple
+    from datetime import date, timedelta
+    from decimal import Decimal
+    from app.services import exports, xlsx_export
+
+    Row = namedtuple('Row', [
+        'invoice_number', 'invoice_date', 'due_date', 'client_name',
+        'subtotal', 'vat_amount', 'total', 'status', 'paid_date'
+    ])
+
+    def synthetic_rows():
+        start = date(2020, 1, 1)
+        for i in range(rows):
+            invoice_date = start + timedelta(days=i % 1500)
+            subtotal = Decimal(100 + i % 900).quantize(Decimal('0.01'))
+            vat = (subtotal * Decimal('0.21')).quantize(Decimal('0.01'))
+            yield Row(
+                f'SF-{i:07d}', invoice_date, invoice_date + timedelta(days=14),
+                f'Klientas {i % 5000}', subtotal, vat, subtotal + vat,
+                'paid', invoice_date + timedelta(days=20)
+            )
+
+    if output:
+        path = output
+    else:
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+    try:
+        started = time.perf_counter()
+        xlsx_export.write_xlsx(
+            path, 'Sąskaitos', exports.INVOICE_EXPORT_HEADER, xlsx_export.INVOICE_COLUMNS,
+            synthetic_rows()
+        )
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(path)
+    finally:
+        if not output:
+            os.remove(path)
+
+    print(f'Rows: {rows}')
+    print(f'Time: {elapsed:.1f} s ({rows / elapsed:,.0f} rows/s)')
+    print(f'File size: {size / 1024 / 1024:.1f} MB')
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f'Peak RSS: {peak / 1024:.0f} MB')
+    except ImportError:
+        pass
+
+
+@app.cli.command('benchmark-serializers')
+@click.option('--pages', default=200, help='Number of pages to serialize')
+@click.option('--per-page', default=100, help='Invoices per page')
+@click.option('--items', default=5, help='Items per invoice')
+def benchmark_serializers(pages, per_page, items):
+    """Time serializing and encoding API invoice pages with items"""
+    import json
+    import time
+    from datetime import date, datetime, timedelta
+    from decimal import Decimal
+    from app.models import Client, Invoice, InvoiceItem
+    from app.services import api_serializers
+
+    def synthetic_page():
+        page = []
+        for i in range(per_page):
+            invoice_date = date(2024, 1, 1) + timedelta(days=i)
+            invoice = Invoice(
+                id=i + 1, invoice_number=f'SF{i:06d}', invoice_date=invoice_date,
+                due_date=invoice_date + timedelta(days=14), status='sent', client_id=1,
+                subtotal=Decimal('1000.00'), vat_amount=Decimal('210.00'), total=Decimal('1210.00'),
+                payment_reference=f'SF{i:08d}', created_at=datetime(2024, 1, 1, 12, 30),
+                updated_at=datetime(2024, 1, 2, 8, 15)
+            )
+            invoice.client = Client(id=1, name='UAB Klientas')
+            invoice.items = [
+                InvoiceItem(
+                    id=i * items + n, description=f'Paslauga {n}', quantity=Decimal('2.00'),
+                    unit='vnt.', unit_price=Decimal('100.00'), vat_rate=21,
+                    line_total=Decimal('200.00'), vat_amount=Decimal('42.00')
+                )
+                for n in range(items)
+            ]
+            page.append(invoice)
+        return page
+
+    def field_by_field(invoice):
+        # The previous approach: a getter lookup per field, stdlib json below
+        result = {}
+        for name, (path, kind) in api_serializers.INVOICE_SPEC.items():
+            value = invoice
+            for attribute in path.split('.'):
+                value = getattr(value, attribute)
+            if kind == 'decimal':
+                value = float(value)
+            elif kind == 'date':
+                value = value.isoformat()
+            result[name] = value
+        result['items'] = [{
+            name: float(getattr(item, path)) if kind == 'decimal' else getattr(item, path)
+            for name, (path, kind) in api_serializers.INVOICE_ITEM_SPEC.items()
+        } for item in invoice.items]
+        return result
+
+    page = synthetic_page()
+    fields = tuple(api_serializers.INVOICE_SPEC)
+    variants = [('field-by-field + json', field_by_field, lambda payload: json.dumps(payload).encode())]
+    for decimal_format in api_serializers.DECIMAL_FORMATS:
+        variants.append((
+            f'compiled + json ({decimal_format})',
+            api_serializers.compile_serializer('invoice', fields, ('items',), decimal_format, False),
+            lambda payload: json.dumps(payload, separators=(',', ':')).encode()
+        ))
+        if api_serializers.orjson is not None:
+            variants.append((
+                f'compiled + orjson ({decimal_format})',
+                api_serializers.compile_serializer('invoice', fields, ('items',), decimal_format, True),
+                api_serializers.orjson.dumps
+            ))
+
+    print(f'{pages} pages x {per_page} invoices x {items} items, ms per page')
+    print(f'{"":32} {"build":>7} {"encode":>7} {"total":>7}')
+    for name, serialize, encode in variants:
+        build_time = encode_time = 0
+        for _ in range(pages):
+            started = time.perf_counter()
+            payload = {'invoices': [serialize(invoice) for invoice in page]}
+            built = time.perf_counter()
+            body = encode(payload)
+            build_time += built - started
+            encode_time += time.perf_counter() - built
+        print(f'{name:32} {build_time / pages * 1000:7.2f} {encode_time / pages * 1000:7.2f} '
+              f'{(build_time + encode_time) / pages * 1000:7.2f}  {len(body) / 1024:.1f} KB')
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
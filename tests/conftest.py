@@ -0,0 +1,42 @@
+"""
+Test fixtures
+An application on an in-memory SQLite database, rebuilt for every test
+"""
+import pytest
+
+from app import create_app, db
+from app.models import User, Company
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app):
+    """An enterprise user with a company"""
+    user = User(email='jonas@example.lt', first_name='Jonas', last_name='Jonaitis', subscription_plan='enterprise')
+    user.set_password('slaptazodis')
+    db.session.add(user)
+    db.session.commit()
+
+    db.session.add(Company(user_id=user.id, name='UAB Testas', company_code='300000001'))
+    db.session.commit()
+    return user
+
+
+def login(client, user):
+    """Log a user in to the web app without going through the form"""
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
@@ -0,0 +1,67 @@
+"""API principal cache: revocations must reach every worker's cache"""
+import jwt
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.routes import payments
+from app.services import api_auth
+
+
+@pytest.fixture
+def caches(monkeypatch):
+    """Two principal caches, as two gunicorn workers would have"""
+    first, second = api_auth.PrincipalCache(), api_auth.PrincipalCache()
+
+    def use(cache):
+        monkeypatch.setattr(api_auth, 'principal_cache', cache)
+
+    return first, second, use
+
+
+def test_revoked_key_is_refused_by_another_worker(user, caches):
+    first, second, use = caches
+    api_key, key = api_auth.create_api_key(user, 'CI')
+
+    use(second)
+    assert api_auth.authenticate_key(key) is not None
+    assert len(second) == 1
+
+    use(first)
+    api_auth.revoke_api_key(api_key)
+
+    use(second)
+    assert api_auth.authenticate_key(key) is None
+
+
+def test_plan_downgrade_reaches_another_worker(user, caches, app):
+    first, second, use = caches
+    token = jwt.encode({'user_id': user.id}, app.config['SECRET_KEY'], algorithm='HS256')
+
+    user.stripe_customer_id = 'cus_123'
+    db.session.commit()
+
+    use(second)
+    assert api_auth.authenticate(token).plan == 'enterprise'
+
+    use(first)
+    payments.handle_subscription_deleted({'customer': 'cus_123'})
+
+    use(second)
+    assert api_auth.authenticate(token).plan == 'free'
+
+
+def test_cache_hit_only_checks_the_auth_version(user, caches, app):
+    _, second, use = caches
+    _, key = api_auth.create_api_key(user, 'CI')
+    use(second)
+    api_auth.authenticate_key(key)
+    user_id = user.id
+
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    principal = api_auth.authenticate_key(key)
+
+    assert principal.id == user_id
+    assert len(statements) == 1
+    assert 'auth_version' in statements[0]
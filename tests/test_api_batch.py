@@ -0,0 +1,43 @@
+"""POST /api/batch: only JSON read endpoints can be batched"""
+import pytest
+
+from app import db
+from app.models import Client
+from app.services import api_auth
+
+
+@pytest.fixture
+def headers(user):
+    _, key = api_auth.create_api_key(user, 'CI')
+    return {'Authorization': f'Bearer {key}'}
+
+
+def test_batch_answers_json_reads(client, user, headers):
+    record = Client(company_id=user.company.id, name='UAB Pirkėjas')
+    db.session.add(record)
+    db.session.commit()
+
+    response = client.post('/api/batch', headers=headers, json={'requests': [
+        {'id': 'one', 'path': f'/api/clients/{record.id}'},
+        {'id': 'list', 'path': '/api/clients?per_page=5'}
+    ]})
+
+    assert response.status_code == 200
+    one, listed = response.get_json()['responses']
+    assert (one['status'], one['body']['name']) == (200, 'UAB Pirkėjas')
+    assert listed['status'] == 200
+
+
+@pytest.mark.parametrize('path', [
+    '/api/export/invoices.ndjson',
+    '/api/metrics',
+    '/api/batch',
+    '/reports/export/isaf'
+])
+def test_batch_refuses_streaming_and_non_json_paths(client, user, headers, path):
+    response = client.post('/api/batch', headers=headers, json={'requests': [{'id': 'x', 'path': path}]})
+
+    assert response.status_code == 200
+    entry = response.get_json()['responses'][0]
+    assert entry['status'] == 400
+    assert entry['body'] == {'error': 'path cannot be batched'}
@@ -0,0 +1,61 @@
+"""Client import: matching records to existing clients by code"""
+import pytest
+
+from app import db
+from app.models import Client
+from app.services.client_import import upsert_clients
+
+
+@pytest.fixture
+def company_id(user):
+    return user.company.id
+
+
+def add_client(company_id, name, is_active=True, **codes):
+    client = Client(company_id=company_id, name=name, is_active=is_active, **codes)
+    db.session.add(client)
+    db.session.commit()
+    return client.id
+
+
+def test_codes_matching_different_clients_are_an_error(company_id):
+    first = add_client(company_id, 'UAB Pirmas', company_code='300000001')
+    second = add_client(company_id, 'UAB Antras', vat_code='LT100000000011')
+
+    results = upsert_clients(company_id, [
+        (2, {'name': 'UAB Mišrus', 'company_code': '300000001', 'vat_code': 'lt 100000000011'})
+    ])
+
+    assert results[0]['status'] == 'error'
+    assert str(first) in results[0]['error'] and str(second) in results[0]['error']
+    assert db.session.get(Client, first).name == 'UAB Pirmas'
+
+
+def test_two_records_for_the_same_client_are_an_error(company_id):
+    client_id = add_client(company_id, 'UAB Pirmas', company_code='300000001', vat_code='LT100000000011')
+
+    results = upsert_clients(company_id, [
+        (2, {'name': 'Pagal kodą', 'company_code': '300000001'}),
+        (3, {'name': 'Pagal PVM kodą', 'vat_code': 'LT100000000011'})
+    ])
+
+    assert results[0] == {'status': 'updated', 'id': client_id}
+    assert results[1] == {'status': 'error', 'error': 'same client as row 2'}
+    assert db.session.get(Client, client_id).name == 'Pagal kodą'
+
+
+def test_inactive_match_is_reactivated_within_the_client_limit(company_id):
+    add_client(company_id, 'UAB Aktyvus')
+    inactive = add_client(company_id, 'UAB Neaktyvus', is_active=False, company_code='300000001')
+    other = add_client(company_id, 'UAB Kitas', is_active=False, company_code='300000002')
+
+    results = upsert_clients(company_id, [
+        (2, {'name': 'UAB Grįžęs', 'company_code': '300000001'}),
+        (3, {'name': 'UAB Kitas', 'company_code': '300000002'})
+    ], client_limit=2)
+
+    assert results[0] == {'status': 'updated', 'id': inactive}
+    assert results[1] == {'status': 'error', 'error': 'client limit of the plan reached'}
+    db.session.expire_all()
+    assert db.session.get(Client, inactive).is_active
+    assert not db.session.get(Client, other).is_active
@@ -0,0 +1,76 @@
+"""Expense totals in reports and the monthly expense rollup"""
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app import db
+from app.models import Expense, ExpenseMonthlyRollup
+from app.services import expense_rollup, report_data
+
+
+@pytest.fixture
+def company_id(user):
+    return user.company.id
+
+
+@pytest.fixture
+def rebuild_command(app, monkeypatch):
+    """Run `flask rebuild-expense-rollup` against the test app"""
+    monkeypatch.setenv('FLASK_CONFIG', 'testing')
+    import run
+
+    return lambda *args: app.test_cli_runner().invoke(run.rebuild_expense_rollup, [str(arg) for arg in args])
+
+
+def add_expenses(company_id, *expenses):
+    """Add (date, amount) expenses and keep the rollup in step, as the expense routes do"""
+    deltas = expense_rollup.new_deltas()
+    for expense_date, amount in expenses:
+        expense = Expense(company_id=company_id, description='Išlaidos', category='office',
+                          amount=Decimal(amount), vat_amount=Decimal(amount) * Decimal('0.21'),
+                          expense_date=expense_date)
+        db.session.add(expense)
+        expense_rollup.expense_deltas(expense, deltas=deltas)
+    expense_rollup.apply_deltas(deltas)
+    db.session.commit()
+
+
+def test_profit_loss_counts_only_expenses_inside_the_range(company_id):
+    add_expenses(
+        company_id,
+        (date(2026, 1, 10), '10.00'),   # before the range, same month
+        (date(2026, 1, 20), '20.00'),
+        (date(2026, 2, 14), '40.00'),   # whole month
+        (date(2026, 3, 5), '80.00'),
+        (date(2026, 3, 25), '160.00')   # after the range, same month
+    )
+
+    summary = report_data.profit_loss(company_id, date(2026, 1, 15), date(2026, 3, 10))
+
+    assert summary['total_expenses'] == Decimal('140.00')
+    assert {month: data['expenses'] for month, data in summary['monthly_data'].items()} == {
+        '2026-01': Decimal('20.00'), '2026-02': Decimal('40.00'), '2026-03': Decimal('80.00')
+    }
+
+
+def test_profit_loss_within_one_month(company_id):
+    add_expenses(company_id, (date(2026, 3, 5), '80.00'), (date(2026, 3, 25), '160.00'))
+
+    summary = report_data.profit_loss(company_id, date(2026, 3, 1), date(2026, 3, 10))
+
+    assert summary['total_expenses'] == Decimal('80.00')
+
+
+def test_rebuild_command_recomputes_the_rollup(company_id, rebuild_command):
+    add_expenses(company_id, (date(2026, 2, 14), '40.00'), (date(2026, 2, 20), '2.50'))
+    ExpenseMonthlyRollup.query.update({'amount': Decimal('999.00'), 'expense_count': 7})
+    db.session.commit()
+
+    result = rebuild_command(company_id)
+
+    assert result.exit_code == 0, result.output
+    assert 'Rebuilt the expense rollup of 1 companies.' in result.output
+    db.session.expire_all()
+    rollup = ExpenseMonthlyRollup.query.one()
+    assert (rollup.month, rollup.amount, rollup.expense_count) == (date(2026, 2, 1), Decimal('42.50'), 2)
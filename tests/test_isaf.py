@@ -0,0 +1,91 @@
+"""i.SAF export: generated files must validate against the schema"""
+import io
+import os
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app import db
+from app.models import Client, Invoice, InvoiceItem
+from app.services import isaf
+
+XSD_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'isaf_1.2.xsd')
+
+PERIOD = (date(2026, 3, 1), date(2026, 3, 31))
+
+
+def add_invoice(user, client, number, items, status='sent'):
+    """Add an invoice with (quantity, unit price, VAT rate) items"""
+    invoice = Invoice(
+        user_id=user.id, company_id=user.company.id, client_id=client.id,
+        invoice_number=number, invoice_date=date(2026, 3, 10), due_date=date(2026, 3, 24),
+        status=status
+    )
+    for position, (quantity, unit_price, vat_rate) in enumerate(items):
+        line_total = Decimal(quantity) * Decimal(unit_price)
+        invoice.items.append(InvoiceItem(
+            description=f'Paslauga {position + 1}', quantity=quantity, unit_price=unit_price,
+            vat_rate=vat_rate, line_total=line_total,
+            vat_amount=(line_total * vat_rate / 100).quantize(Decimal('0.01')), position=position
+        ))
+    db.session.add(invoice)
+    return invoice
+
+
+@pytest.fixture
+def clients(user):
+    company_id = user.company.id
+    lithuanian = Client(company_id=company_id, name='UAB Pirkėjas & Ko', company_code='300000002',
+                        vat_code='LT100000000021', country='Lietuva')
+    latvian = Client(company_id=company_id, name='SIA Pircējs', company_code='40000000001',
+                     vat_code='LV40000000001', country='LV')
+    db.session.add_all([lithuanian, latvian])
+    db.session.commit()
+    return lithuanian, latvian
+
+
+def generate(user):
+    return ''.join(isaf.generate_isaf_xml(user.company, *PERIOD)).encode('utf-8')
+
+
+def test_generated_file_validates(user, clients):
+    pytest.importorskip('lxml')
+    lithuanian, latvian = clients
+    add_invoice(user, lithuanian, 'SF-0001', [(2, '100.00', 21), (1, '50.00', 9)])
+    add_invoice(user, latvian, 'SF-0002', [(3, '12.50', 0)], status='paid')
+    add_invoice(user, latvian, 'SF-0003', [(1, '999.00', 21)], status='draft')
+    db.session.commit()
+
+    isaf.check_tax_codes(user.company.id, *PERIOD)
+    document = generate(user)
+
+    assert isaf.validate_isaf_xml(io.BytesIO(document), XSD_PATH) == []
+    assert document.count(b'<Invoice>') == 2
+    assert b'<Country>LV</Country>' in document
+
+
+def test_unknown_country_is_refused_before_export(user, clients):
+    lithuanian, _ = clients
+    finnish = Client(company_id=user.company.id, name='Oy Ostaja', country='Suomija')
+    db.session.add(finnish)
+    db.session.commit()
+    add_invoice(user, lithuanian, 'SF-0001', [(1, '10.00', 21)])
+    add_invoice(user, finnish, 'SF-0002', [(1, '10.00', 21)])
+    db.session.commit()
+
+    assert isaf.unmapped_countries(user.company.id, *PERIOD) == ['Suomija']
+    with pytest.raises(ValueError, match='Suomija'):
+        isaf.check_tax_codes(user.company.id, *PERIOD)
+
+
+def test_empty_country_fails_validation(user, clients):
+    pytest.importorskip('lxml')
+    lithuanian, _ = clients
+    lithuanian.country = 'Suomija'
+    add_invoice(user, lithuanian, 'SF-0001', [(1, '10.00', 21)])
+    db.session.commit()
+
+    errors = isaf.validate_isaf_xml(io.BytesIO(generate(user)), XSD_PATH)
+
+    assert any('Country' in error for error in errors)